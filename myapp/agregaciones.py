@@ -0,0 +1,171 @@
+"""
+Agregaciones dinámicas con campos validados contra _meta.
+
+Agregador recibe nombres de campos desde parámetros GET/POST y solo acepta
+rutas de campos concretos del modelo, atravesando claves foráneas hacia
+adelante (cliente__sexo, categoria__nombre) hasta una profundidad máxima:
+relaciones inversas, many-to-many, métodos y propiedades se rechazan con
+ParametroInvalido. Cada pedido se compila en una sola consulta
+(values().annotate() con WHERE, ORDER BY y LIMIT). El plan validado (rutas
+resueltas, expresión de agregación y queryset base) se guarda en un LRU por
+estructura del pedido, de modo que solo los valores de los filtros cambian
+entre llamadas.
+"""
+import functools
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import NotSupportedError
+from django.db.models import Aggregate, Avg, Count, FloatField, Max, Min, Sum
+
+from .paginacion import ParametroInvalido
+
+
+class Percentil(Aggregate):
+    # percentile_cont de PostgreSQL (agregado de conjunto ordenado)
+    function = "PERCENTILE_CONT"
+    name = "Percentil"
+    output_field = FloatField()
+    template = "%(function)s(%(percentil)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expresion, percentil=0.5, **extra):
+        super().__init__(expresion, percentil=float(percentil), **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        raise NotSupportedError("El percentil solo está disponible en PostgreSQL.")
+
+
+OPERACIONES = {
+    "count": Count,
+    "sum": Sum,
+    "avg": Avg,
+    "min": Min,
+    "max": Max,
+    "percentile": Percentil,
+}
+
+# Operaciones que solo tienen sentido sobre campos numéricos
+NUMERICAS = {"sum", "avg", "percentile"}
+
+TIPOS_NUMERICOS = {
+    "AutoField", "BigAutoField", "SmallAutoField", "IntegerField", "BigIntegerField", "SmallIntegerField",
+    "PositiveIntegerField", "PositiveBigIntegerField", "PositiveSmallIntegerField", "FloatField",
+    "DecimalField", "DurationField",
+}
+
+LOOKUPS = {"exact", "gt", "gte", "lt", "lte", "in", "isnull"}
+
+
+class Agregador:
+    # profundidad: cuántas claves foráneas se pueden atravesar en una ruta
+    def __init__(self, modelo, profundidad=2, limite_por_defecto=500, limite_maximo=5000, tamano_cache=128):
+        self.modelo = modelo
+        self.profundidad = profundidad
+        self.limite_por_defecto = limite_por_defecto
+        self.limite_maximo = limite_maximo
+        # Rutas y planes validados; las rutas posibles son pocas, los planes se acotan por LRU
+        self.campo = functools.lru_cache(maxsize=None)(self._resolver)
+        self._plan = functools.lru_cache(maxsize=tamano_cache)(self._compilar)
+
+    def _resolver(self, ruta):
+        # Devuelve el campo final de la ruta o lanza ParametroInvalido
+        partes = ruta.split("__") if ruta else []
+        if not partes or len(partes) > self.profundidad + 1:
+            raise ParametroInvalido(f"Campo inválido: '{ruta}'.")
+        meta = self.modelo._meta
+        for posicion, parte in enumerate(partes):
+            try:
+                campo = meta.get_field(parte)
+            except FieldDoesNotExist:
+                raise ParametroInvalido(f"El campo '{ruta}' no existe en {self.modelo.__name__}.")
+            # Solo columnas propias o claves foráneas hacia adelante (una fila del otro lado)
+            if not campo.concrete or campo.many_to_many or campo.one_to_many:
+                raise ParametroInvalido(f"No se puede usar '{ruta}'.")
+            if posicion < len(partes) - 1:
+                if not campo.is_relation:
+                    raise ParametroInvalido(f"'{parte}' no es una relación en '{ruta}'.")
+                meta = campo.related_model._meta
+        return campo
+
+    def _separar(self, lookup):
+        # 'fecha__gte' -> ('fecha', 'gte'); 'cliente__sexo' -> ('cliente__sexo', 'exact')
+        ruta, _, tipo = lookup.rpartition("__")
+        if tipo not in LOOKUPS:
+            return lookup, "exact"
+        return ruta, tipo
+
+    def _compilar(self, agrupar, operacion, campo, lookups, orden, percentil):
+        if operacion not in OPERACIONES:
+            raise ParametroInvalido(f"Operación inválida: '{operacion}'.")
+        for ruta in agrupar:
+            self.campo(ruta)
+        if campo:
+            final = self.campo(campo)
+            if operacion in NUMERICAS and final.get_internal_type() not in TIPOS_NUMERICOS:
+                raise ParametroInvalido(f"'{campo}' no es numérico.")
+        elif operacion != "count":
+            raise ParametroInvalido("Falta el campo a agregar.")
+        for lookup in lookups:
+            self.campo(self._separar(lookup)[0])
+
+        columna = orden.lstrip("-")
+        if columna not in ("valor", *agrupar):
+            raise ParametroInvalido(f"No se puede ordenar por '{columna}'.")
+
+        opciones = {"percentil": percentil} if operacion == "percentile" else {}
+        expresion = OPERACIONES[operacion](campo or "pk", **opciones)
+        return self.modelo.objects.values(*agrupar).annotate(valor=expresion).order_by(orden, *agrupar)
+
+    def _valor_filtro(self, lookup, valor):
+        ruta, tipo = self._separar(lookup)
+        campo = self.campo(ruta)
+        try:
+            if tipo == "isnull":
+                return str(valor).lower() in ("1", "true", "si", "sí")
+            if tipo == "in":
+                valores = valor.split(",") if isinstance(valor, str) else valor
+                return [campo.to_python(v) for v in valores]
+            return campo.to_python(valor)
+        except (ValidationError, ValueError, TypeError):
+            raise ParametroInvalido(f"Valor inválido para '{lookup}'.")
+
+    def consultar(self, agrupar, operacion="count", campo=None, filtros=None, orden="-valor", limite=None,
+                  percentil=0.5):
+        """
+        Lista de diccionarios {<campos de agrupar>..., 'valor'}.
+        filtros: {'ruta' o 'ruta__lookup': valor} con lookup en LOOKUPS.
+        """
+        filtros = filtros or {}
+        agrupar = tuple(agrupar)
+        if not agrupar:
+            raise ParametroInvalido("Indique al menos un campo para agrupar.")
+        try:
+            percentil = float(percentil)
+        except (TypeError, ValueError):
+            raise ParametroInvalido("El percentil debe ser un número.")
+        if not 0 <= percentil <= 1:
+            raise ParametroInvalido("El percentil debe estar entre 0 y 1.")
+        try:
+            limite = int(limite or self.limite_por_defecto)
+        except ValueError:
+            raise ParametroInvalido("El límite debe ser un número.")
+        limite = max(1, min(limite, self.limite_maximo))
+
+        if operacion != "percentile":
+            percentil = None  # no forma parte del plan
+        plan = self._plan(agrupar, operacion, campo or None, tuple(sorted(filtros)), orden, percentil)
+        valores = {lookup: self._valor_filtro(lookup, valor) for lookup, valor in filtros.items()}
+        try:
+            return list(plan.filter(**valores)[:limite])
+        except NotSupportedError as e:
+            raise ParametroInvalido(str(e))
+
+    def estadisticas(self):
+        return self._plan.cache_info()._asdict()
+
+
+def datos_grafico(filas, agrupar):
+    # {'labels', 'data'} para Chart.js; con varios campos la etiqueta los une con " / "
+    return {
+        "labels": [" / ".join(str(fila[ruta]) for ruta in agrupar) for fila in filas],
+        "data": [fila["valor"] for fila in filas],
+    }
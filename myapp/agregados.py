@@ -0,0 +1,165 @@
+"""
+Tablas de agregados para los KPIs (ResumenTest y ResumenCalificacion).
+
+Las cargas CSV suman cada lote de tests a los agregados dentro de la misma
+transacción (acumular_tests) y el comando reconstruir_agregados los vuelve a
+calcular desde cero. Las vistas de KPIs leen estas tablas pequeñas en lugar
+de recorrer myapp_test.
+"""
+from collections import Counter
+
+from django.apps import apps as django_apps
+from django.db import connections, router, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+
+from .versiones import incrementar_version
+
+
+# Rangos de edad (inclusive) usados en ResumenTest.rango_edad
+RANGOS_EDAD = [(0, 17), (18, 29), (30, 44), (45, 59), (60, None)]
+
+# Filas por sentencia INSERT ... ON CONFLICT
+TAMANO_UPSERT = 100
+
+
+def etiqueta_rango(minimo, maximo):
+    return f"{minimo}+" if maximo is None else f"{minimo}-{maximo}"
+
+
+def rango_edad(fnac, fecha):
+    if fnac is None:
+        return ""
+    edad = fecha.year - fnac.year - ((fecha.month, fecha.day) < (fnac.month, fnac.day))
+    for minimo, maximo in RANGOS_EDAD:
+        if minimo <= edad and (maximo is None or edad <= maximo):
+            return etiqueta_rango(minimo, maximo)
+    return ""
+
+
+def etiquetas_rangos_edad(rangos=RANGOS_EDAD):
+    return [etiqueta_rango(minimo, maximo) for minimo, maximo in rangos]
+
+
+def _sumar(modelo, dimensiones, medidas, conteos):
+    # INSERT ... ON CONFLICT DO UPDATE sumando las medidas (PostgreSQL y SQLite >= 3.24)
+    if not conteos:
+        return
+    conexion = connections[router.db_for_write(modelo)]
+    qn = conexion.ops.quote_name
+    tabla = qn(modelo._meta.db_table)
+    columnas = [modelo._meta.get_field(nombre).column for nombre in dimensiones + medidas]
+    conflicto = ", ".join(qn(modelo._meta.get_field(nombre).column) for nombre in dimensiones)
+    actualizar = ", ".join(
+        "{col} = {tabla}.{col} + excluded.{col}".format(col=qn(modelo._meta.get_field(nombre).column), tabla=tabla)
+        for nombre in medidas
+    )
+    marcadores = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+
+    filas = [clave + tuple(valores) for clave, valores in conteos.items()]
+    with conexion.cursor() as cursor:
+        for inicio in range(0, len(filas), TAMANO_UPSERT):
+            parte = filas[inicio:inicio + TAMANO_UPSERT]
+            cursor.execute(
+                "INSERT INTO {} ({}) VALUES {} ON CONFLICT ({}) DO UPDATE SET {}".format(
+                    tabla,
+                    ", ".join(qn(columna) for columna in columnas),
+                    ", ".join([marcadores] * len(parte)),
+                    conflicto,
+                    actualizar,
+                ),
+                [valor for fila in parte for valor in fila],
+            )
+
+
+def _acumular(resumen, calificaciones, fecha, nombre, categoria_id, sexo, fnac, calificacion, cantidad, dias_espera):
+    sexo = sexo or ""
+    valores = resumen.setdefault((fecha, nombre, categoria_id, sexo, rango_edad(fnac, fecha)), [0, 0, 0])
+    valores[0] += cantidad
+    valores[1] += calificacion * cantidad
+    valores[2] += dias_espera
+    calificaciones[(calificacion, sexo)] += cantidad
+
+
+def _guardar(ResumenTest, ResumenCalificacion, resumen, calificaciones):
+    _sumar(
+        ResumenTest,
+        ["dia", "nombre", "categoria", "cliente_sexo", "rango_edad"],
+        ["cantidad", "suma_calificacion", "suma_dias_espera"],
+        resumen,
+    )
+    _sumar(
+        ResumenCalificacion,
+        ["calificacion", "cliente_sexo"],
+        ["cantidad"],
+        {clave: (cantidad,) for clave, cantidad in calificaciones.items()},
+    )
+
+
+def acumular_tests(tests):
+    # tests: lista de Test o de diccionarios con sus campos. Se llama dentro
+    # de la transacción del lote, así que datos y agregados se confirman juntos.
+    Persona = django_apps.get_model("myapp", "Persona")
+    tests = [_Fila(test) if isinstance(test, dict) else test for test in tests]
+    personas = {
+        pk: (sexo, fnac)
+        for pk, sexo, fnac in Persona.objects.filter(
+            pk__in={test.cliente_id for test in tests}
+        ).values_list("pk", "sexo", "fnac")
+    }
+
+    resumen, calificaciones = {}, Counter()
+    for test in tests:
+        sexo, fnac = personas.get(test.cliente_id, ("", None))
+        _acumular(
+            resumen, calificaciones, test.fecha, test.nombre, test.categoria_id, sexo, fnac,
+            test.calificacion, 1, (test.fecha_entrega - test.fecha).days,
+        )
+    _guardar(
+        django_apps.get_model("myapp", "ResumenTest"),
+        django_apps.get_model("myapp", "ResumenCalificacion"),
+        resumen,
+        calificaciones,
+    )
+
+
+class _Fila:
+    def __init__(self, datos):
+        self.__dict__.update(datos)
+
+
+def reconstruir_agregados(apps=django_apps):
+    # Recalcula los agregados desde myapp_test. Recibe 'apps' para poder
+    # usarse también desde una migración.
+    Test = apps.get_model("myapp", "Test")
+    ResumenTest = apps.get_model("myapp", "ResumenTest")
+    ResumenCalificacion = apps.get_model("myapp", "ResumenCalificacion")
+
+    # Se agrupa en SQL por día, nombre, categoría y cliente; en Python solo se
+    # calcula el rango de edad de cada grupo
+    grupos = (
+        Test.objects.values("fecha", "nombre", "categoria_id", "cliente__sexo", "cliente__fnac", "calificacion")
+        .annotate(
+            cantidad=Count("id"),
+            espera=Sum(ExpressionWrapper(F("fecha_entrega") - F("fecha"), output_field=DurationField())),
+        )
+        .order_by()
+    )
+    resumen, calificaciones = {}, Counter()
+    for grupo in grupos.iterator(chunk_size=5000):
+        _acumular(
+            resumen, calificaciones, grupo["fecha"], grupo["nombre"], grupo["categoria_id"],
+            grupo["cliente__sexo"], grupo["cliente__fnac"], grupo["calificacion"], grupo["cantidad"],
+            grupo["espera"].days if grupo["espera"] else 0,
+        )
+
+    with transaction.atomic():
+        ResumenTest.objects.all().delete()
+        ResumenCalificacion.objects.all().delete()
+        _guardar(ResumenTest, ResumenCalificacion, resumen, calificaciones)
+    if apps is django_apps:
+        incrementar_version()
+    return len(resumen)
+
+
+def promedio(suma, cantidad):
+    return suma / cantidad if cantidad else 0
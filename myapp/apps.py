@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
+
+    def ready(self):
+        from .conexiones import contar_conexion
+        from .esquema import al_migrar
+        from .metricas import instalar_en_conexion, instrumentar_plantillas
+
+        # Rearmar el esquema del prompt de analitics después de cada migrate
+        post_migrate.connect(al_migrar, sender=self, dispatch_uid="myapp_esquema_prompt")
+        # Conexiones abiertas por alias (bd/estadisticas/)
+        connection_created.connect(contar_conexion, dispatch_uid="myapp_contar_conexiones")
+        # Consultas y render de plantillas de las solicitudes muestreadas (/metrics)
+        connection_created.connect(instalar_en_conexion, dispatch_uid="myapp_metricas_consultas")
+        instrumentar_plantillas()
@@ -0,0 +1,101 @@
+"""
+Caché de resultados de las consultas de analitics.
+
+La pregunta normalizada ya se resuelve a SQL desde el LRU de myapp/llm sin
+llamar a la API; aquí se guarda el resultado de ejecutar ese SQL. La clave es
+una huella canónica de la consulta (sqlparse: sin comentarios, palabras clave
+en mayúsculas, identificadores en minúsculas, espacios colapsados), así dos
+preguntas distintas que producen el mismo SQL comparten la entrada. La versión
+de datos va en la clave: una carga CSV invalida todo. La fecha también, como
+en kpi_cache, para las consultas con CURRENT_DATE; las que dependen de la hora
+(now(), CURRENT_TIMESTAMP, 'now' de SQLite) o de random() no se guardan. El
+caché 'consultas' de Django (LocMemCache) limita la cantidad de entradas y
+desaloja por LRU.
+"""
+import hashlib
+import threading
+from datetime import date
+
+import sqlparse
+from django.core.cache import caches
+
+from .ejecutor_sql import ejecutar_consulta
+from .versiones import version_datos
+
+
+ALIAS_CACHE = "consultas"
+
+# Funciones cuyo resultado cambia durante el día
+VOLATILES = {
+    "now", "current_time", "current_timestamp", "localtime", "localtimestamp", "clock_timestamp",
+    "statement_timestamp", "transaction_timestamp", "timeofday", "random",
+}
+
+_FALTA = object()
+_contadores = {"aciertos": 0, "fallos": 0}
+_lock = threading.Lock()
+
+
+def huella_sql(sql):
+    canonica = sqlparse.format(
+        sql,
+        strip_comments=True,
+        keyword_case="upper",
+        identifier_case="lower",
+        strip_whitespace=True,
+    )
+    canonica = " ".join(canonica.split()).rstrip("; ")
+    return hashlib.md5(canonica.encode()).hexdigest()
+
+
+def es_volatil(sql):
+    for token in sqlparse.parse(sql)[0].flatten() if sql.strip() else ():
+        valor = token.value.lower()
+        if (token.ttype in sqlparse.tokens.Name or token.is_keyword) and valor in VOLATILES:
+            return True
+        if token.ttype in sqlparse.tokens.Literal.String and valor.strip("'\"") == "now":
+            return True
+    return False
+
+
+def _contar(campo):
+    with _lock:
+        _contadores[campo] += 1
+
+
+def resultado_para(sql):
+    # Resultado de ejecutar_consulta() desde el caché si los datos no cambiaron desde que se guardó
+    if es_volatil(sql):
+        _contar("fallos")
+        return ejecutar_consulta(sql)
+
+    cache = caches[ALIAS_CACHE]
+    clave = f"consulta:{huella_sql(sql)}:{date.today().isoformat()}"
+    version = version_datos()
+
+    resultado = cache.get(clave, _FALTA, version=version)
+    if resultado is not _FALTA:
+        _contar("aciertos")
+        return resultado
+
+    _contar("fallos")
+    # Los errores (consulta rechazada, timeout) no se guardan
+    resultado = ejecutar_consulta(sql)
+    cache.set(clave, resultado, version=version)
+    return resultado
+
+
+def estadisticas():
+    with _lock:
+        aciertos, fallos = _contadores["aciertos"], _contadores["fallos"]
+    return {
+        "version_datos": version_datos(),
+        "aciertos": aciertos,
+        "fallos": fallos,
+        "tasa_aciertos": round(aciertos / (aciertos + fallos), 4) if aciertos + fallos else 0,
+    }
+
+
+def reiniciar_estadisticas():
+    with _lock:
+        _contadores.update(aciertos=0, fallos=0)
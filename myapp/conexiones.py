@@ -0,0 +1,42 @@
+"""
+Estado de las conexiones a la base de datos.
+
+Cuenta las conexiones que abre cada alias (señal connection_created; con el
+pool de psycopg cuenta cada vez que una solicitud toma una conexión del pool)
+y junta la configuración de persistencia con las estadísticas del pool si
+está activo. Se expone en bd/estadisticas/.
+"""
+import threading
+from collections import Counter
+
+from django.db import connections
+
+
+_abiertas = Counter()
+_lock = threading.Lock()
+
+
+def contar_conexion(sender, connection, **kwargs):
+    with _lock:
+        _abiertas[connection.alias] += 1
+
+
+def usa_pool(conexion):
+    return conexion.vendor == "postgresql" and bool(conexion.settings_dict["OPTIONS"].get("pool"))
+
+
+def estadisticas():
+    with _lock:
+        abiertas = dict(_abiertas)
+    datos = {}
+    for alias in connections:
+        conexion = connections[alias]
+        ajustes = conexion.settings_dict
+        datos[alias] = {
+            "motor": conexion.vendor,
+            "conn_max_age": ajustes["CONN_MAX_AGE"],
+            "health_checks": ajustes["CONN_HEALTH_CHECKS"],
+            "conexiones_abiertas": abiertas.get(alias, 0),
+            "pool": conexion.pool.get_stats() if usa_pool(conexion) else None,
+        }
+    return datos
@@ -0,0 +1,72 @@
+"""
+Carga rápida con COPY FROM STDIN en PostgreSQL.
+
+Las filas ya normalizadas (diccionarios con los attname de cada campo) se
+escriben como CSV y se envían a la tabla con COPY, sin pasar por el ORM.
+En otros motores (SQLite en desarrollo) copy_disponible() devuelve False y
+los cargadores usan bulk_create.
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.db import connections, router
+
+
+# Marca de NULL en el CSV enviado a COPY (así '' se mantiene como texto vacío)
+NULO = "\\N"
+
+
+def _conexion(modelo):
+    return connections[router.db_for_write(modelo)]
+
+
+def copy_disponible(modelo):
+    # Se puede desactivar con CSV_USAR_COPY = False en settings
+    return _conexion(modelo).vendor == "postgresql" and getattr(settings, "CSV_USAR_COPY", True)
+
+
+def campos_copy(modelo, incluir_pk=False):
+    return [
+        campo for campo in modelo._meta.concrete_fields
+        if incluir_pk or not campo.primary_key
+    ]
+
+
+def reservar_pks(modelo, cantidad):
+    # Toma 'cantidad' valores de la secuencia de la PK para poder enlazar
+    # otras tablas (Resultado -> Test) antes de hacer el COPY
+    conexion = _conexion(modelo)
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+            [modelo._meta.db_table, modelo._meta.pk.column, cantidad],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def copiar(modelo, filas, incluir_pk=False):
+    conexion = _conexion(modelo)
+    campos = campos_copy(modelo, incluir_pk)
+    qn = conexion.ops.quote_name
+    sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+        qn(modelo._meta.db_table),
+        ", ".join(qn(campo.column) for campo in campos),
+        NULO,
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for fila in filas:
+        writer.writerow([NULO if fila[campo.attname] is None else fila[campo.attname] for campo in campos])
+    buffer.seek(0)
+
+    with conexion.cursor() as cursor:
+        cursor_db = cursor.cursor
+        if hasattr(cursor_db, "copy_expert"):
+            # psycopg2
+            cursor_db.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with cursor_db.copy(sql) as copy:
+                copy.write(buffer.getvalue())
@@ -0,0 +1,263 @@
+"""
+Datos sintéticos reproducibles de Persona, Test y Resultado.
+
+La misma semilla con los mismos parámetros genera siempre las mismas filas.
+Cada tabla usa su propio random.Random y las columnas de un bloque se sortean
+de una sola vez (random.choices con pesos acumulados sobre tablas
+precalculadas) en lugar de encadenar randint por fila como la carga CSV. Los
+días de entrega y los resultados salen de las mismas tablas que usa la carga
+(importers.DIAS_ENTREGA y RESULTADOS).
+
+Las filas son diccionarios con los attname de cada modelo: guardar_personas
+y guardar_tests las escriben con COPY en PostgreSQL; en otros motores,
+personas y tests con un executemany sin pasar por instancias del ORM (y
+leyendo sus PKs) y resultados con bulk_create. fila_csv_persona y
+fila_csv_test las pasan al formato de los CSV de carga. Lo usa el comando
+generate_dataset.
+"""
+import random
+from bisect import bisect
+from datetime import date, timedelta
+from itertools import accumulate
+
+from django.db import connections, router
+
+from .copy_postgres import campos_copy, copiar, copy_disponible, reservar_pks
+from .importers import opciones_resultado, rango_dias_entrega
+from .models import Categoria, Persona, Resultado, Test
+
+
+# Filas que se sortean juntas
+TAMANO_BLOQUE = 10000
+
+NOMBRES_FEMENINOS = [
+    "María", "Ana", "Lucía", "Carmen", "Sofía", "Valeria", "Isabel", "Paula", "Laura", "Elena",
+    "Daniela", "Gabriela", "Rosa", "Patricia", "Andrea", "Camila", "Teresa", "Natalia", "Julia", "Mónica",
+]
+NOMBRES_MASCULINOS = [
+    "José", "Juan", "Luis", "Carlos", "Miguel", "Jorge", "Pedro", "Diego", "Andrés", "Fernando",
+    "Javier", "Manuel", "Ricardo", "Alejandro", "Sergio", "Pablo", "Roberto", "Mario", "Daniel", "Raúl",
+]
+APELLIDOS = [
+    "García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez", "Pérez", "Gómez", "Martín",
+    "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Álvarez", "Romero", "Torres", "Flores", "Vargas",
+    "Rojas", "Mendoza", "Castro", "Ortiz", "Gutiérrez", "Ramos", "Vega", "Morales", "Quispe", "Mamani",
+]
+PROPORCION_FEMENINO = 0.52
+
+# Edad de los clientes (rango inclusive, peso) y del personal
+EDADES_CLIENTES = [((0, 17), 14), ((18, 29), 20), ((30, 44), 26), ((45, 59), 22), ((60, 95), 18)]
+EDADES_PERSONAL = (23, 65)
+
+# (nombre de la prueba, categoría, peso): pruebas de rutina mucho más frecuentes
+PRUEBAS = [
+    ("Hemograma completo", "Hematología", 20),
+    ("Covid PCR", "Infecciosas", 16),
+    ("Perfil lipídico", "Bioquímica", 12),
+    ("Glucosa en ayunas", "Bioquímica", 11),
+    ("Influenza A/B", "Infecciosas", 9),
+    ("Electrocardiograma", "Cardiología", 8),
+    ("Anticuerpos IgG", "Inmunología", 7),
+    ("Panel de alergia", "Inmunología", 6),
+    ("Hepatitis B", "Infecciosas", 5),
+    ("Prueba de paternidad", "Genética", 3),
+    ("Urocultivo", "Microbiología", 3),
+]
+
+# Peso de las calificaciones 1 a 10: la mayoría conformes, una cola de muy insatisfechos
+PESOS_CALIFICACION = [3, 1, 2, 3, 5, 8, 14, 22, 24, 18]
+
+# Volumen relativo por día de la semana (lunes a domingo) y crecimiento en todo el período
+PESOS_DIA_SEMANA = [1.0, 1.0, 0.95, 0.95, 0.9, 0.5, 0.15]
+CRECIMIENTO = 0.3
+
+
+def nombres_categorias():
+    return sorted({categoria for _, categoria, _ in PRUEBAS})
+
+
+def asegurar_categorias():
+    # {nombre: id} de las categorías de PRUEBAS, creando las que falten
+    return {nombre: Categoria.objects.get_or_create(nombre=nombre)[0].pk for nombre in nombres_categorias()}
+
+
+class Generador:
+    def __init__(self, semilla=0, desde=date(2023, 1, 1), dias=730, proporcion_personal=0.02):
+        self.semilla = semilla
+        self.desde = desde
+        self.dias = dias
+        self.proporcion_personal = proporcion_personal
+
+    def _aleatorio(self, tabla):
+        # Un flujo por tabla: cambiar la cantidad de personas no cambia las pruebas,
+        # fechas ni calificaciones de los tests
+        return random.Random(f"{self.semilla}:{tabla}")
+
+    def personas(self, cantidad):
+        # Bloques de filas de Persona; una de cada 1/proporcion_personal es personal
+        # (la primera siempre), así hasta un conjunto pequeño tiene clientes y personal
+        cada = max(2, round(1 / self.proporcion_personal))
+        aleatorio = self._aleatorio("personas")
+        azar = aleatorio.random
+        bandas = [banda for banda, _ in EDADES_CLIENTES]
+        acumulado_edades = list(accumulate(peso for _, peso in EDADES_CLIENTES))
+        referencia = self.desde.toordinal()
+
+        for inicio in range(0, cantidad, TAMANO_BLOQUE):
+            n = min(TAMANO_BLOQUE, cantidad - inicio)
+            femenino = [azar() < PROPORCION_FEMENINO for _ in range(n)]
+            personal = [(inicio + i) % cada == 0 for i in range(n)]
+            bandas_edad = aleatorio.choices(bandas, cum_weights=acumulado_edades, k=n)
+            nombres_f = aleatorio.choices(NOMBRES_FEMENINOS, k=n)
+            nombres_m = aleatorio.choices(NOMBRES_MASCULINOS, k=n)
+            apellidos_1 = aleatorio.choices(APELLIDOS, k=n)
+            apellidos_2 = aleatorio.choices(APELLIDOS, k=n)
+
+            bloque = []
+            for i in range(n):
+                minimo, maximo = EDADES_PERSONAL if personal[i] else bandas_edad[i]
+                edad = minimo + (maximo - minimo + 1) * azar()
+                bloque.append({
+                    "nombre": nombres_f[i] if femenino[i] else nombres_m[i],
+                    "apellidos": f"{apellidos_1[i]} {apellidos_2[i]}",
+                    "sexo": "femenino" if femenino[i] else "masculino",
+                    "fnac": date.fromordinal(referencia - int(edad * 365.25)),
+                    "telefono": f"{6 + int(azar() * 2)}{int(azar() * 10_000_000):07d}",
+                    "rol": "personal" if personal[i] else "cliente",
+                    "especialidad": None,
+                })
+            yield bloque
+
+    def tests(self, cantidad, clientes_ids, personal_ids, categorias):
+        # Bloques de (tests, resultados); los resultados se enlazan al guardar los tests
+        aleatorio = self._aleatorio("tests")
+        azar = aleatorio.random
+        fechas = [self.desde + timedelta(days=dia) for dia in range(self.dias)]
+        acumulado_fechas = list(accumulate(
+            PESOS_DIA_SEMANA[fecha.weekday()] * (1 + CRECIMIENTO * dia / self.dias)
+            for dia, fecha in enumerate(fechas)
+        ))
+        hasta = fechas[-1]
+
+        # Todo lo que depende del nombre de la prueba se resuelve una vez por nombre
+        pruebas = []
+        for nombre, categoria, _ in PRUEBAS:
+            opciones, detalles = opciones_resultado(nombre)
+            pruebas.append((
+                nombre,
+                categorias[categoria],
+                rango_dias_entrega(nombre),
+                [(resultado, interpretacion) for resultado, interpretacion, _ in opciones],
+                list(accumulate(peso for *_, peso in opciones)),
+                detalles,
+            ))
+        acumulado_pruebas = list(accumulate(peso for *_, peso in PRUEBAS))
+        acumulado_calificaciones = list(accumulate(PESOS_CALIFICACION))
+        calificaciones = range(1, len(PESOS_CALIFICACION) + 1)
+        n_clientes, n_personal = len(clientes_ids), len(personal_ids)
+
+        for inicio in range(0, cantidad, TAMANO_BLOQUE):
+            n = min(TAMANO_BLOQUE, cantidad - inicio)
+            elegidas = aleatorio.choices(pruebas, cum_weights=acumulado_pruebas, k=n)
+            dias_prueba = aleatorio.choices(fechas, cum_weights=acumulado_fechas, k=n)
+            notas = aleatorio.choices(calificaciones, cum_weights=acumulado_calificaciones, k=n)
+
+            tests, resultados = [], []
+            for prueba, fecha, calificacion in zip(elegidas, dias_prueba, notas):
+                nombre, categoria_id, (minimo, maximo), opciones, acumulado, detalles = prueba
+                # La mayoría se entrega cerca del mínimo del rango
+                espera = minimo + min(int(aleatorio.triangular(0, maximo - minimo + 1, 0)), maximo - minimo)
+                entrega = fecha + timedelta(days=espera)
+                resultado, interpretacion = opciones[bisect(acumulado, azar() * acumulado[-1])]
+                tests.append({
+                    "nombre": nombre,
+                    "fecha": fecha,
+                    "fecha_entrega": entrega,
+                    "estado": "entregado" if entrega <= hasta else "en proceso",
+                    "observaciones": None,
+                    "calificacion": calificacion,
+                    "categoria_id": categoria_id,
+                    "cliente_id": clientes_ids[int(azar() * n_clientes)],
+                    "personal_id": personal_ids[int(azar() * n_personal)],
+                })
+                resultados.append({
+                    "resultado": resultado,
+                    "fecha": entrega,
+                    "observaciones": "N/a",
+                    "interpretacion": interpretacion,
+                    "detalles": detalles,
+                    "url_imagen_path": None,
+                })
+            yield tests, resultados
+
+
+def _insertar(modelo, filas):
+    # INSERT con executemany: crear instancias y preparar cada valor con el ORM
+    # costaba más que la escritura en SQLite
+    conexion = connections[router.db_for_write(modelo)]
+    campos = campos_copy(modelo)
+    qn = conexion.ops.quote_name
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        qn(modelo._meta.db_table),
+        ", ".join(qn(campo.column) for campo in campos),
+        ", ".join(["%s"] * len(campos)),
+    )
+    with conexion.cursor() as cursor:
+        cursor.executemany(sql, [[fila[campo.attname] for campo in campos] for fila in filas])
+    # Dentro de la transacción del lote tenemos el bloqueo de escritura, así
+    # que las últimas len(filas) filas son las que acabamos de insertar
+    pks = list(modelo.objects.order_by("-pk").values_list("pk", flat=True)[: len(filas)])
+    return pks[::-1]
+
+
+def guardar_personas(lote):
+    # Devuelve las PKs en el orden del lote
+    if copy_disponible(Persona):
+        pks = reservar_pks(Persona, len(lote))
+        for datos, pk in zip(lote, pks):
+            datos["id"] = pk
+        copiar(Persona, lote, incluir_pk=True)
+        return pks
+    return _insertar(Persona, lote)
+
+
+def guardar_tests(tests, resultados):
+    if copy_disponible(Test):
+        pks = reservar_pks(Test, len(tests))
+        for datos, pk in zip(tests, pks):
+            datos["id"] = pk
+        copiar(Test, tests, incluir_pk=True)
+    else:
+        pks = _insertar(Test, tests)
+    for datos, pk in zip(resultados, pks):
+        datos["test_id"] = pk
+    if copy_disponible(Resultado):
+        copiar(Resultado, resultados)
+    else:
+        # Nada referencia a Resultado: no hace falta leer sus PKs
+        Resultado.objects.bulk_create(Resultado(**datos) for datos in resultados)
+
+
+def _fecha_csv(fecha):
+    return f"{fecha.month:02d}/{fecha.day:02d}/{fecha.year}"
+
+
+# Columnas de los CSV que aceptan cargar y cargar_tests
+COLUMNAS_CSV_PERSONAS = ["nombre", "apellidos", "gender", "fnac", "telefono", "rol"]
+COLUMNAS_CSV_TESTS = ["nombre", "fecha", "estado", "observaciones", "calificacion", "categoria_id",
+                      "cliente_id", "personal_id"]
+
+
+def fila_csv_persona(datos):
+    return [
+        datos["nombre"], datos["apellidos"], "female" if datos["sexo"] == "femenino" else "male",
+        _fecha_csv(datos["fnac"]), datos["telefono"], datos["rol"],
+    ]
+
+
+def fila_csv_test(datos):
+    # La carga recalcula la fecha de entrega y el resultado a partir del nombre
+    return [
+        datos["nombre"], _fecha_csv(datos["fecha"]), datos["estado"], "N/a", datos["calificacion"],
+        datos["categoria_id"], datos["cliente_id"], datos["personal_id"],
+    ]
@@ -0,0 +1,74 @@
+"""
+Expresiones de edad para agrupar los KPIs en la base de datos.
+
+edad_exacta() calcula en SQL la edad cumplida a una fecha (la del test u
+hoy) y rango_edad_expresion() la convierte en la etiqueta de su rango
+("0-17", "18-29", ... "60+") con un CASE, así la agrupación por rango se
+hace en la misma consulta. Los rangos por defecto son los de los agregados
+(RANGOS_EDAD).
+"""
+from datetime import date
+
+from django.db.models import Case, CharField, DateField, F, Func, IntegerField, Value, When
+from django.db.models.lookups import IsNull, LessThan, LessThanOrEqual
+
+from .agregados import RANGOS_EDAD, etiqueta_rango
+
+
+class EdadExacta(Func):
+    # Años cumplidos a 'fecha' por alguien nacido en 'fnac'. En SQLite se
+    # restan las fechas como enteros AAAAMMDD y se divide por 10000; en
+    # PostgreSQL se usa AGE(), que es lo más rápido ahí
+    arity = 2
+    output_field = IntegerField()
+    plantilla = (
+        "(CAST(REPLACE(CAST({fecha} AS CHAR(10)), '-', '') AS INTEGER)"
+        " - CAST(REPLACE(CAST({fnac} AS CHAR(10)), '-', '') AS INTEGER)) / 10000"
+    )
+    plantilla_sqlite = "(CAST(REPLACE(DATE({fecha}), '-', '') AS INTEGER) - CAST(REPLACE(DATE({fnac}), '-', '') AS INTEGER)) / 10000"
+    plantilla_postgresql = "CAST(DATE_PART('year', AGE({fecha}, {fnac})) AS INTEGER)"
+
+    def _compilar(self, compiler, plantilla):
+        fnac, fecha = self.get_source_expressions()
+        fnac_sql, fnac_params = compiler.compile(fnac)
+        fecha_sql, fecha_params = compiler.compile(fecha)
+        # En las tres plantillas 'fecha' aparece antes que 'fnac'
+        return plantilla.format(fecha=fecha_sql, fnac=fnac_sql), (*fecha_params, *fnac_params)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return self._compilar(compiler, self.plantilla)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self._compilar(compiler, self.plantilla_sqlite)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self._compilar(compiler, self.plantilla_postgresql)
+
+
+def edad_exacta(fnac, fecha=None):
+    # 'fnac' y 'fecha' son campos o expresiones; sin 'fecha' se usa hoy
+    if isinstance(fnac, str):
+        fnac = F(fnac)
+    if fecha is None:
+        fecha = Value(date.today(), output_field=DateField())
+    elif isinstance(fecha, str):
+        fecha = F(fecha)
+    return EdadExacta(fnac, fecha)
+
+
+def rango_edad_expresion(edad, rangos=RANGOS_EDAD, sin_rango=""):
+    # Los rangos deben ser consecutivos y estar ordenados; el CASE toma la
+    # primera condición que se cumple, así que basta comparar con el máximo
+    if isinstance(edad, str):
+        edad = F(edad)
+    casos = [
+        When(IsNull(edad, True), then=Value(sin_rango)),
+        When(LessThan(edad, rangos[0][0]), then=Value(sin_rango)),
+    ]
+    ultimo = Value(sin_rango)
+    for minimo, maximo in rangos:
+        if maximo is None:
+            ultimo = Value(etiqueta_rango(minimo, maximo))
+        else:
+            casos.append(When(LessThanOrEqual(edad, maximo), then=Value(etiqueta_rango(minimo, maximo))))
+    return Case(*casos, default=ultimo, output_field=CharField())
@@ -0,0 +1,163 @@
+"""
+Ejecución acotada de consultas SQL generadas (analitics).
+
+validar_consulta() usa sqlparse para aceptar una sola sentencia SELECT (o
+WITH ... SELECT) sin DML/DDL en ninguna parte, sin SELECT INTO ni bloqueos, y
+sin tablas internas (auth_, django_, catálogos del motor) ni funciones que
+lean o cambien algo fuera de la consulta (set_config, query_to_xml, dblink,
+objetos grandes). ejecutar_consulta() la envuelve con un LIMIT, la corre en
+una transacción de solo lectura con límite de tiempo, que siempre se revierte,
+y lee el resultado por partes con un cursor del lado del servidor en
+PostgreSQL. Ahí la transacción corre además con el rol SQL_IA_ROL, que solo
+puede leer las tablas de myapp (comando crear_rol_consultas); sin ese rol no
+se ejecuta nada. Devuelve las columnas con su tipo para graficar.
+"""
+import datetime
+import decimal
+import re
+import time
+
+import sqlparse
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from sqlparse import tokens as T
+
+from .routers import alias_lectura
+
+
+# Identificadores que no se pueden consultar (usuarios, sesiones, catálogos)
+PREFIJOS_PROHIBIDOS = ("auth_", "django_", "pg_", "sqlite_", "information_schema", "myapp_customuser")
+PALABRAS_PROHIBIDAS = {"INTO", "LOCK", "FOR UPDATE", "FOR SHARE", "FOR NO KEY UPDATE", "FOR KEY SHARE"}
+# Funciones que ejecutan SQL recibido como texto, cambian la sesión o tocan archivos y
+# objetos grandes (las pg_* ya quedan fuera por PREFIJOS_PROHIBIDOS)
+FUNCIONES_PROHIBIDAS = {"set_config", "setval", "nextval", "readfile", "writefile", "load_extension"}
+PREFIJOS_FUNCIONES_PROHIBIDAS = ("dblink", "lo_", "query_to_", "cursor_to_", "table_to_", "schema_to_", "database_to_")
+
+# Filas que se piden al cursor por vez
+TAMANO_PARTE = 500
+
+_PUNTO_Y_COMA_FINAL = re.compile(r";\s*$")
+
+
+class ConsultaNoPermitida(ValueError):
+    pass
+
+
+class ErrorConsulta(Exception):
+    pass
+
+
+def _escape_unicode(tokens, posicion):
+    # U&"\0061uth_user" es auth_user en PostgreSQL: sqlparse lo parte en U, & y "..."
+    if tokens[posicion].value.lower() != "u" or posicion + 2 >= len(tokens):
+        return False
+    return tokens[posicion + 1].value == "&" and tokens[posicion + 2].ttype in T.Literal.String
+
+
+def validar_consulta(sql):
+    # Devuelve la consulta sin el ';' final o lanza ConsultaNoPermitida
+    sentencias = [sentencia for sentencia in sqlparse.parse(sql or "") if str(sentencia).strip(" \n\t;")]
+    if len(sentencias) != 1:
+        raise ConsultaNoPermitida("Se permite exactamente una consulta.")
+    sentencia = sentencias[0]
+    if sentencia.get_type() != "SELECT":
+        raise ConsultaNoPermitida("Solo se permiten consultas SELECT.")
+
+    tokens = [token for token in sentencia.flatten() if not token.is_whitespace]
+    for posicion, token in enumerate(tokens):
+        valor = token.normalized.upper() if token.is_keyword else token.value
+        if token.ttype in T.Keyword.DML and valor != "SELECT":
+            raise ConsultaNoPermitida(f"No se permite {valor} dentro de la consulta.")
+        if token.ttype in T.Keyword.DDL or (token.is_keyword and " ".join(valor.split()) in PALABRAS_PROHIBIDAS):
+            raise ConsultaNoPermitida(f"No se permite {valor} en la consulta.")
+        if _escape_unicode(tokens, posicion):
+            raise ConsultaNoPermitida("No se permiten identificadores ni textos con escapes Unicode (U&).")
+        if token.ttype in T.Name or token.ttype in T.Literal.String.Symbol:
+            nombre = token.value.strip('"`[]').lower()
+            if nombre.startswith(PREFIJOS_PROHIBIDOS):
+                raise ConsultaNoPermitida(f"No se puede consultar {token.value}.")
+            siguiente = tokens[posicion + 1].value if posicion + 1 < len(tokens) else ""
+            if siguiente == "(" and (nombre in FUNCIONES_PROHIBIDAS or nombre.startswith(PREFIJOS_FUNCIONES_PROHIBIDAS)):
+                raise ConsultaNoPermitida(f"No se permite la función {token.value}.")
+
+    return _PUNTO_Y_COMA_FINAL.sub("", str(sentencia).strip())
+
+
+def _tipo(valores):
+    # Tipo de una columna a partir de su primer valor no nulo
+    for valor in valores:
+        if valor is None:
+            continue
+        if isinstance(valor, bool):
+            return "booleano"
+        if isinstance(valor, (int, float, decimal.Decimal)):
+            return "numero"
+        if isinstance(valor, (datetime.date, datetime.datetime)):
+            return "fecha"
+        return "texto"
+    return "texto"
+
+
+def _limitar_sqlite(connection, timeout_ms):
+    # SQLite no tiene statement_timeout: el progress handler corta la consulta al vencer el plazo
+    limite = time.monotonic() + timeout_ms / 1000
+    connection.connection.set_progress_handler(lambda: int(time.monotonic() > limite), 10000)
+    connection.cursor().execute("PRAGMA query_only = ON")
+
+
+def _liberar_sqlite(connection):
+    connection.connection.set_progress_handler(None, 0)
+    connection.cursor().execute("PRAGMA query_only = OFF")
+
+
+def ejecutar_consulta(sql, limite_filas=None, timeout_ms=None, alias=None):
+    limite_filas = limite_filas or getattr(settings, "SQL_IA_LIMITE_FILAS", 1000)
+    timeout_ms = timeout_ms or getattr(settings, "SQL_IA_TIMEOUT_MS", 5000)
+    consulta = validar_consulta(sql)
+    # Se pide una fila de más para saber si el resultado quedó truncado
+    envuelta = f"SELECT * FROM ({consulta}) AS consulta_ia LIMIT {int(limite_filas) + 1}"
+
+    # Dentro de routers.lectura_replica() se lee de la réplica si está al día
+    alias = alias or alias_lectura()
+    connection = connections[alias]
+    rol = getattr(settings, "SQL_IA_ROL", "")
+    if connection.vendor == "postgresql" and not rol:
+        # Sin rol restringido la única defensa sería la lista de validar_consulta
+        raise ErrorConsulta("Falta configurar SQL_IA_ROL (ver el comando crear_rol_consultas).")
+    filas = []
+    try:
+        with transaction.atomic(using=alias):
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION READ ONLY")
+                    cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(timeout_ms))])
+                    # SET LOCAL: el rol termina con la transacción
+                    cursor.execute(f"SET LOCAL ROLE {connection.ops.quote_name(rol)}")
+            elif connection.vendor == "sqlite":
+                connection.ensure_connection()
+                _limitar_sqlite(connection, timeout_ms)
+            try:
+                # En PostgreSQL chunked_cursor() es un cursor con nombre (del lado del servidor)
+                with connection.chunked_cursor() as cursor:
+                    cursor.execute(envuelta)
+                    while len(filas) <= limite_filas:
+                        parte = cursor.fetchmany(TAMANO_PARTE)
+                        if not parte:
+                            break
+                        filas.extend(parte)
+                    nombres = [columna[0] for columna in cursor.description]
+            finally:
+                if connection.vendor == "sqlite":
+                    _liberar_sqlite(connection)
+                # Nada de lo que haya hecho la consulta sobrevive en la conexión persistente
+                transaction.set_rollback(True, using=alias)
+    except DatabaseError as e:
+        raise ErrorConsulta(f"Error al ejecutar la consulta: {e}") from e
+
+    truncado = len(filas) > limite_filas
+    filas = [list(fila) for fila in filas[:limite_filas]]
+    columnas = [
+        {"nombre": nombre, "tipo": _tipo(fila[i] for fila in filas)}
+        for i, nombre in enumerate(nombres)
+    ]
+    return {"consulta": consulta, "columnas": columnas, "filas": filas, "truncado": truncado}
@@ -0,0 +1,158 @@
+"""
+Esquema de la base de datos para el prompt de analitics.
+
+Se arma desde _meta de los modelos: tablas, columnas con su tipo en el motor
+actual, claves foráneas con la columna real (categoria_id, cliente_id, ...),
+índices y una estimación de filas (pg_class.reltuples en PostgreSQL,
+COUNT(*) en SQLite). El texto se memoriza por versión de datos y se
+recalcula tras migrate (ver apps.py), que además incrementa la versión para
+que los demás procesos también lo rearmen.
+"""
+import threading
+
+from django.db import DatabaseError, connection
+
+from .agregados import etiquetas_rangos_edad
+from .models import Categoria, Persona, Resultado, ResumenCalificacion, ResumenTest, Test
+from .versiones import incrementar_version, version_datos
+
+
+# Modelos que puede consultar la IA (usuarios, importaciones y contadores internos no)
+MODELOS = [Categoria, Persona, Test, Resultado, ResumenTest, ResumenCalificacion]
+
+# Valores y significados que no están en _meta
+NOTAS = {
+    Persona: {
+        "tabla": "Clientes y personal del laboratorio.",
+        "sexo": "'masculino' o 'femenino'",
+        "fnac": "fecha de nacimiento",
+        "rol": "'cliente' o 'personal'",
+    },
+    Test: {
+        "calificacion": "satisfacción de 1 a 10",
+        "fecha_entrega": "fecha en que se entregó el resultado",
+        "cliente_id": "persona con rol 'cliente'",
+        "personal_id": "persona con rol 'personal' que atendió",
+    },
+    ResumenTest: {
+        "tabla": "Agregados de myapp_test por día; conviene usarla para conteos grandes.",
+        "rango_edad": "rango de edad del cliente a la fecha del test: "
+        + ", ".join(repr(etiqueta) for etiqueta in etiquetas_rangos_edad())
+        + " o '' si no se conoce",
+        "suma_dias_espera": "suma de (fecha_entrega - fecha) en días",
+    },
+    ResumenCalificacion: {
+        "tabla": "Cantidad de tests por calificación y sexo del cliente.",
+    },
+}
+
+_memo = {"version": None, "texto": None}
+_lock = threading.Lock()
+
+
+def _aproximar(cantidad):
+    # Dos cifras significativas: el texto (y la clave del caché del prompt) cambia poco entre cargas
+    if cantidad < 100:
+        return cantidad
+    cifras = len(str(cantidad)) - 2
+    return round(cantidad, -cifras)
+
+
+def estimar_filas(tablas):
+    estimaciones = {}
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r' AND relname = ANY(%s)",
+                [list(tablas)],
+            )
+            # reltuples es -1 si la tabla nunca se analizó
+            estimaciones = {tabla: filas for tabla, filas in cursor.fetchall() if filas >= 0}
+        for tabla in tablas:
+            if tabla not in estimaciones:
+                cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(tabla)}")
+                estimaciones[tabla] = cursor.fetchone()[0]
+    return estimaciones
+
+
+def _columna(campo, notas):
+    tipo = campo.db_type(connection) or campo.get_internal_type()
+    detalles = [tipo]
+    if campo.primary_key:
+        detalles.append("clave primaria")
+    if campo.is_relation:
+        destino = campo.target_field
+        detalles.append(f"-> {destino.model._meta.db_table}.{destino.column}")
+    if campo.null:
+        detalles.append("puede ser NULL")
+    nota = notas.get(campo.column) or notas.get(campo.name)
+    linea = f"  - {campo.column} ({', '.join(detalles)})"
+    return f"{linea}: {nota}" if nota else linea
+
+
+def _condicion(condicion, meta):
+    # Q(rol="personal") -> rol = 'personal' (solo condiciones simples de igualdad)
+    partes = []
+    for nombre, valor in condicion.children:
+        partes.append(f"{meta.get_field(nombre).column} = {valor!r}")
+    return f" {condicion.connector} ".join(partes)
+
+
+def _indices(meta):
+    lineas = []
+    for indice in meta.indexes:
+        columnas = ", ".join(meta.get_field(nombre.lstrip("-")).column for nombre in indice.fields)
+        condicion = f" donde {_condicion(indice.condition, meta)}" if indice.condition else ""
+        lineas.append(f"  - {indice.name} ({columnas}){condicion}")
+    for restriccion in meta.constraints:
+        if getattr(restriccion, "fields", None):
+            columnas = ", ".join(meta.get_field(nombre).column for nombre in restriccion.fields)
+            lineas.append(f"  - {restriccion.name} (único: {columnas})")
+    return lineas
+
+
+def describir_esquema(modelos=MODELOS):
+    tablas = [modelo._meta.db_table for modelo in modelos]
+    filas = estimar_filas(tablas)
+    partes = [f"Motor: {connection.display_name} (usar su dialecto SQL)."]
+    for modelo in modelos:
+        meta = modelo._meta
+        notas = NOTAS.get(modelo, {})
+        encabezado = f"Tabla: {meta.db_table} (~{_aproximar(filas.get(meta.db_table, 0))} filas)"
+        if "tabla" in notas:
+            encabezado += f" {notas['tabla']}"
+        lineas = [encabezado]
+        lineas += [_columna(campo, notas) for campo in meta.concrete_fields]
+        indices = _indices(meta)
+        if indices:
+            lineas.append("  Índices:")
+            lineas += ["  " + linea for linea in indices]
+        partes.append("\n".join(lineas))
+    return "\n\n".join(partes)
+
+
+def esquema_prompt():
+    # Texto memorizado; se rearma cuando cambia la versión de datos (cargas CSV, migrate)
+    version = version_datos()
+    with _lock:
+        if _memo["texto"] is not None and _memo["version"] == version:
+            return _memo["texto"]
+    texto = describir_esquema()
+    with _lock:
+        _memo.update(version=version, texto=texto)
+    return texto
+
+
+def refrescar_esquema():
+    with _lock:
+        _memo.update(version=None, texto=None)
+
+
+def al_migrar(sender, **kwargs):
+    # post_migrate: el esquema pudo cambiar; la versión nueva avisa a los demás procesos
+    refrescar_esquema()
+    try:
+        incrementar_version()
+    except DatabaseError:
+        # migrate hacia atrás: la tabla de versiones ya no existe
+        pass
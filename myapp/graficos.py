@@ -0,0 +1,160 @@
+"""
+Gráfico automático para el resultado de una consulta de analitics.
+
+grafico_para() recibe el resultado de ejecutor_sql.ejecutar_consulta() (filas
+y columnas con tipo) y elige el gráfico según la primera columna: fecha ->
+serie de tiempo, texto/número/booleano con columnas numéricas -> barras por
+categoría, una sola columna numérica -> histograma. Los datos se reducen en el
+servidor para que el navegador reciba a lo sumo unos cientos de puntos: LTTB
+(Largest-Triangle-Three-Buckets) en las series y las N categorías mayores más
+"Otros" en las barras.
+"""
+import datetime
+import decimal
+import math
+
+from django.conf import settings
+
+from myapp.pivote import datasets_chartjs
+
+
+ETIQUETA_OTROS = "Otros"
+
+
+def _numero(valor):
+    if isinstance(valor, decimal.Decimal):
+        return float(valor)
+    return valor
+
+
+def _eje_x(valor):
+    # Posición numérica de una fecha para medir áreas en LTTB
+    if isinstance(valor, datetime.datetime):
+        return valor.timestamp()
+    if isinstance(valor, datetime.date):
+        return float(valor.toordinal())
+    return float(valor)
+
+
+def lttb(puntos, umbral):
+    """
+    Índices de los puntos (x, y) que conservan la forma de la serie.
+
+    Se mantienen el primero y el último; el resto se divide en umbral - 2
+    cubetas y de cada una se toma el punto que forma el triángulo de mayor
+    área con el punto elegido en la cubeta anterior y el promedio de la
+    siguiente.
+    """
+    n = len(puntos)
+    if umbral >= n or umbral < 3:
+        return list(range(n))
+
+    indices = [0]
+    tamano = (n - 2) / (umbral - 2)
+    anterior = 0
+    for cubeta in range(umbral - 2):
+        inicio = int(cubeta * tamano) + 1
+        fin = int((cubeta + 1) * tamano) + 1
+        # Promedio de la cubeta siguiente (la última usa el punto final)
+        siguiente_inicio = fin
+        siguiente_fin = min(int((cubeta + 2) * tamano) + 1, n)
+        siguientes = puntos[siguiente_inicio:siguiente_fin] or puntos[-1:]
+        promedio_x = sum(x for x, _ in siguientes) / len(siguientes)
+        promedio_y = sum(y for _, y in siguientes) / len(siguientes)
+
+        ax, ay = puntos[anterior]
+        mejor, mayor_area = inicio, -1.0
+        for i in range(inicio, fin):
+            x, y = puntos[i]
+            area = abs((ax - promedio_x) * (y - ay) - (ax - x) * (promedio_y - ay))
+            if area > mayor_area:
+                mejor, mayor_area = i, area
+        indices.append(mejor)
+        anterior = mejor
+    indices.append(n - 1)
+    return indices
+
+
+def _serie(etiquetas, series, max_puntos):
+    # Series ordenadas por fecha; los índices de LTTB salen de la primera y se aplican a todas
+    orden = sorted(range(len(etiquetas)), key=lambda i: etiquetas[i])
+    etiquetas = [etiquetas[i] for i in orden]
+    series = [[serie[i] for i in orden] for serie in series]
+    puntos = [(_eje_x(x), y or 0) for x, y in zip(etiquetas, series[0])]
+    indices = lttb(puntos, max_puntos)
+    etiquetas = [etiquetas[i].isoformat() for i in indices]
+    series = [[serie[i] for i in indices] for serie in series]
+    return "line", etiquetas, series
+
+
+def _barras(etiquetas, series, max_categorias):
+    # Si entran todas se respeta el orden de la consulta; si no, las mayores y el resto en "Otros"
+    etiquetas = ["" if etiqueta is None else str(etiqueta) for etiqueta in etiquetas]
+    if len(etiquetas) <= max_categorias:
+        return "bar", etiquetas, series
+    orden = sorted(range(len(etiquetas)), key=lambda i: series[0][i] or 0, reverse=True)
+    mayores, resto = orden[:max_categorias - 1], orden[max_categorias - 1:]
+    etiquetas = [etiquetas[i] for i in mayores] + [ETIQUETA_OTROS]
+    series = [[serie[i] for i in mayores] + [sum(serie[i] or 0 for i in resto)] for serie in series]
+    return "bar", etiquetas, series
+
+
+def _histograma(valores, nombre):
+    valores = [valor for valor in valores if valor is not None]
+    if not valores:
+        return None
+    minimo, maximo = min(valores), max(valores)
+    # Regla de Sturges, con tope para que las barras sigan siendo legibles
+    cantidad = min(30, int(math.log2(len(valores))) + 1) if maximo > minimo else 1
+    ancho = (maximo - minimo) / cantidad or 1
+    conteos = [0] * cantidad
+    for valor in valores:
+        conteos[min(int((valor - minimo) / ancho), cantidad - 1)] += 1
+    etiquetas = [f"{minimo + i * ancho:g}–{minimo + (i + 1) * ancho:g}" for i in range(cantidad)]
+    return "bar", etiquetas, [conteos], [f"Cantidad por {nombre}"]
+
+
+def grafico_para(resultado, max_puntos=None, max_categorias=None):
+    """
+    Datos de Chart.js ({'tipo', 'titulo', 'labels', 'datasets', 'reducido'})
+    para el resultado de una consulta, o {} si no hay un gráfico razonable.
+    """
+    max_puntos = max_puntos or getattr(settings, "GRAFICO_MAX_PUNTOS", 300)
+    max_categorias = max_categorias or getattr(settings, "GRAFICO_MAX_CATEGORIAS", 15)
+    columnas, filas = resultado["columnas"], resultado["filas"]
+    if not columnas or not filas:
+        return {}
+
+    numericas = [i for i, columna in enumerate(columnas) if columna["tipo"] == "numero"]
+    x = columnas[0]
+    valores = [i for i in numericas if i != 0]
+    if valores:
+        etiquetas = [fila[0] for fila in filas]
+        series = [[_numero(fila[i]) for fila in filas] for i in valores]
+        nombres = [columnas[i]["nombre"] for i in valores]
+        if x["tipo"] == "fecha":
+            # Las filas sin fecha no se pueden ubicar en el eje
+            con_fecha = [i for i, etiqueta in enumerate(etiquetas) if etiqueta is not None]
+            if not con_fecha:
+                return {}
+            etiquetas = [etiquetas[i] for i in con_fecha]
+            series = [[serie[i] for i in con_fecha] for serie in series]
+            tipo, etiquetas, series = _serie(etiquetas, series, max_puntos)
+        else:
+            tipo, etiquetas, series = _barras(etiquetas, series, max_categorias)
+        titulo = f"{', '.join(nombres)} por {x['nombre']}"
+    elif numericas == [0] and len(columnas) == 1:
+        histograma = _histograma([_numero(fila[0]) for fila in filas], x["nombre"])
+        if histograma is None:
+            return {}
+        tipo, etiquetas, series, nombres = histograma
+        titulo = f"Distribución de {x['nombre']}"
+    else:
+        return {}
+
+    return {
+        "tipo": tipo,
+        "titulo": titulo,
+        **datasets_chartjs(nombres, etiquetas, series),
+        "reducido": len(etiquetas) < len(filas),
+    }
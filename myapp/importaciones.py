@@ -0,0 +1,149 @@
+"""
+Cola de importaciones CSV respaldada por la base de datos.
+
+Las vistas de carga solo guardan el archivo y crean un ImportacionCSV; el
+comando ``procesar_importaciones`` reclama los trabajos pendientes y los
+procesa. El avance se confirma en la misma transacción de cada lote, así
+que volver a ejecutar un trabajo interrumpido continúa desde la última fila
+guardada sin duplicar datos.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .importers import cargar_personas_csv, cargar_tests_csv
+from .models import ImportacionCSV
+
+
+logger = logging.getLogger(__name__)
+
+CARGADORES = {
+    ImportacionCSV.TIPO_PERSONAS: cargar_personas_csv,
+    ImportacionCSV.TIPO_TESTS: cargar_tests_csv,
+}
+
+
+class ImportacionPerdida(Exception):
+    # El trabajo fue reasignado a otro worker mientras este lo procesaba
+    pass
+
+
+def encolar_importacion(tipo, archivo):
+    return ImportacionCSV.objects.create(tipo=tipo, archivo=archivo)
+
+
+def reintentar_importacion(pk):
+    # Vuelve a poner en cola un trabajo con error; continúa desde filas_procesadas
+    return ImportacionCSV.objects.filter(pk=pk, estado=ImportacionCSV.ERROR).update(
+        estado=ImportacionCSV.PENDIENTE, worker=None, error=None, finalizado=None
+    )
+
+
+def nombre_worker():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def reencolar_abandonadas(timeout_latido, max_intentos):
+    # Trabajos en proceso sin latido reciente: su worker murió o se colgó
+    limite = timezone.now() - timedelta(seconds=timeout_latido)
+    abandonadas = ImportacionCSV.objects.filter(estado=ImportacionCSV.EN_PROCESO, latido__lt=limite)
+    abandonadas.filter(intentos__gte=max_intentos).update(
+        estado=ImportacionCSV.ERROR,
+        error="Se agotaron los intentos de procesamiento.",
+        finalizado=timezone.now(),
+    )
+    return abandonadas.filter(intentos__lt=max_intentos).update(estado=ImportacionCSV.PENDIENTE, worker=None)
+
+
+def _disponibles():
+    # Pendientes que se pueden empezar: un CSV de tests espera a los de personas subidos antes,
+    # que pueden crear los clientes y el personal que referencia
+    personas_previas = ImportacionCSV.objects.filter(
+        tipo=ImportacionCSV.TIPO_PERSONAS,
+        estado__in=[ImportacionCSV.PENDIENTE, ImportacionCSV.EN_PROCESO],
+        creado__lt=OuterRef("creado"),
+    )
+    return ImportacionCSV.objects.filter(estado=ImportacionCSV.PENDIENTE).exclude(
+        Q(tipo=ImportacionCSV.TIPO_TESTS) & Exists(personas_previas)
+    )
+
+
+def reclamar_siguiente(worker):
+    candidatos = (
+        _disponibles()
+        .order_by("creado")
+        .values_list("pk", flat=True)[:10]
+    )
+    for pk in candidatos:
+        ahora = timezone.now()
+        # El UPDATE condicional es atómico: solo un worker consigue pasar el trabajo a en_proceso
+        # (y la condición de _disponibles se vuelve a evaluar en el mismo UPDATE)
+        reclamado = _disponibles().filter(pk=pk).update(
+            estado=ImportacionCSV.EN_PROCESO,
+            worker=worker,
+            intentos=F("intentos") + 1,
+            iniciado=ahora,
+            latido=ahora,
+        )
+        if reclamado:
+            return ImportacionCSV.objects.get(pk=pk)
+    return None
+
+
+def contar_filas(archivo):
+    # Cuenta las líneas del archivo (menos el encabezado) para calcular el progreso
+    lineas = 0
+    ultimo = b"\n"
+    with archivo.open("rb"):
+        for bloque in archivo.chunks():
+            lineas += bloque.count(b"\n")
+            ultimo = bloque[-1:] or ultimo
+    if ultimo != b"\n":
+        lineas += 1
+    return max(lineas - 1, 0)
+
+
+def procesar_importacion(importacion):
+    worker = importacion.worker
+    cargar = CARGADORES[importacion.tipo]
+
+    def al_guardar_lote(total):
+        # Se ejecuta dentro de la transacción del lote: datos y progreso se confirman juntos
+        actualizado = ImportacionCSV.objects.filter(
+            pk=importacion.pk, estado=ImportacionCSV.EN_PROCESO, worker=worker
+        ).update(filas_procesadas=total, latido=timezone.now())
+        if not actualizado:
+            raise ImportacionPerdida(f"La importación {importacion.pk} ya no pertenece a {worker}")
+
+    try:
+        if importacion.filas_totales is None:
+            importacion.filas_totales = contar_filas(importacion.archivo)
+            ImportacionCSV.objects.filter(pk=importacion.pk).update(filas_totales=importacion.filas_totales)
+
+        with importacion.archivo.open("rb"):
+            estadisticas = cargar(
+                importacion.archivo,
+                omitir=importacion.filas_procesadas,
+                al_guardar_lote=al_guardar_lote,
+            )
+    except ImportacionPerdida as e:
+        logger.warning(str(e))
+        return
+    except Exception as e:
+        logger.exception("Error en la importación %s", importacion.pk)
+        ImportacionCSV.objects.filter(pk=importacion.pk, worker=worker).update(
+            estado=ImportacionCSV.ERROR, error=str(e), finalizado=timezone.now()
+        )
+        return
+
+    ImportacionCSV.objects.filter(pk=importacion.pk, worker=worker).update(
+        estado=ImportacionCSV.COMPLETADO,
+        filas_procesadas=estadisticas["filas"],
+        filas_por_segundo=estadisticas["filas_por_segundo"],
+        finalizado=timezone.now(),
+    )
@@ -0,0 +1,318 @@
+"""
+Carga de archivos CSV en streaming.
+
+Los archivos subidos se decodifican por bloques y las filas se procesan con
+generadores, guardando Persona/Test/Resultado en lotes de tamaño fijo, cada
+uno dentro de su propia transacción. La memoria usada no depende del tamaño
+del archivo.
+"""
+import codecs
+import csv
+import logging
+import random
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+from django.db import connections, router, transaction
+
+from .agregados import acumular_tests
+from .copy_postgres import copiar, copy_disponible, reservar_pks
+from .models import Persona, Resultado, Test
+from .versiones import incrementar_version
+
+
+logger = logging.getLogger(__name__)
+
+# Cantidad de filas que se guardan por transacción
+TAMANO_LOTE = 2000
+TAMANO_LOTE_COPY = 20000
+
+# Rango de días de entrega según el tipo de prueba (el primero que coincide gana)
+DIAS_ENTREGA = [
+    ("covid", (1, 2)),
+    ("paternidad", (5, 10)),
+    ("hemograma", (1, 3)),
+    ("influenza", (2, 4)),
+    ("alergia", (3, 7)),
+    ("electrocardiograma", (1, 2)),
+    ("anticuerpo", (3, 5)),
+    ("hepatitis", (5, 10)),
+]
+DIAS_ENTREGA_POR_DEFECTO = (7, 14)  # Por defecto para pruebas no especificadas
+
+
+def iterar_lineas(archivo, encoding="utf-8"):
+    # Decodifica los bloques del archivo subido de forma incremental y
+    # devuelve una línea a la vez (conservando el salto de línea para csv)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pendiente = ""
+    for bloque in archivo.chunks():
+        pendiente += decoder.decode(bloque)
+        lineas = pendiente.splitlines(keepends=True)
+        # La última línea puede estar incompleta (o ser un '\r' de un '\r\n' partido)
+        pendiente = lineas.pop() if lineas else ""
+        if pendiente.endswith("\n"):
+            lineas.append(pendiente)
+            pendiente = ""
+        yield from lineas
+    pendiente += decoder.decode(b"", final=True)
+    if pendiente:
+        yield pendiente
+
+
+def iterar_filas_csv(archivo):
+    # Generador de filas (dict) del CSV subido
+    return csv.DictReader(iterar_lineas(archivo))
+
+
+def en_lotes(iterable, tamano):
+    # Agrupa un iterable en listas de 'tamano' elementos como máximo
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def rango_dias_entrega(nombre_test):
+    nombre_test = nombre_test.lower()
+    for clave, rango in DIAS_ENTREGA:
+        if clave in nombre_test:
+            return rango
+    return DIAS_ENTREGA_POR_DEFECTO
+
+
+def calcular_dias_entrega(nombre_test, aleatorio=random):
+    return aleatorio.randint(*rango_dias_entrega(nombre_test))
+
+
+# Resultados posibles según el tipo de prueba (el primero que coincide gana):
+# (clave, [(resultado, interpretacion, peso), ...], detalles)
+RESULTADOS = [
+    ("covid", [("Negativo", "No se detectó el virus", 1), ("Positivo", "Infección activa", 1)],
+     "Prueba PCR realizada correctamente."),
+    ("paternidad", [("Inclusión", "Coincidencia de marcadores genéticos", 1),
+                    ("Exclusión", "No hay relación biológica", 1)],
+     "Prueba de ADN realizada con precisión."),
+    ("hemograma", [("Normal", "Valores dentro de los rangos esperados", 4), ("Anormal", "Anemia detectada", 1)],
+     "Conteo completo de células sanguíneas."),
+    ("influenza", [("Negativo", "No se detectó el virus", 1), ("Positivo", "Infección viral activa", 1)],
+     "Prueba rápida de influenza."),
+    ("alergia", [("Sin alergias", "Sin reacciones", 1), ("Alergias detectadas", "Reacción alérgica", 1)],
+     "Panel de alérgenos completado."),
+    ("electrocardiograma", [("Normal", "Ritmo cardíaco regular", 1), ("Anormal", "Arritmia detectada", 1)],
+     "ECG realizado sin complicaciones."),
+    ("anticuerpo", [("Positivo", "Presencia de anticuerpos", 1), ("Negativo", "No se detectaron anticuerpos", 1)],
+     "Prueba serológica completada."),
+    ("hepatitis", [("Negativo", "No se detectó infección", 1), ("Positivo", "Infección detectada", 1)],
+     "Análisis para hepatitis realizado."),
+]
+RESULTADO_POR_DEFECTO = (
+    [("Indeterminado", "No se pudo interpretar el resultado", 1)],
+    "Datos insuficientes para el análisis.",
+)
+
+
+def opciones_resultado(nombre_test):
+    nombre_test = nombre_test.lower()
+    for clave, opciones, detalles in RESULTADOS:
+        if clave in nombre_test:
+            return opciones, detalles
+    return RESULTADO_POR_DEFECTO
+
+
+# Función para generar el resultado del test
+def generar_resultado(nombre_test, aleatorio=random):
+    opciones, detalles = opciones_resultado(nombre_test)
+    resultado, interpretacion, _ = aleatorio.choices(opciones, weights=[peso for *_, peso in opciones])[0]
+    return resultado, interpretacion, detalles
+
+
+def parsear_fecha(texto):
+    # Equivale a datetime.strptime(texto, "%m/%d/%Y").date(), pero bastante más rápido
+    mes, dia, anio = texto.split("/")
+    return date(int(anio), int(mes), int(dia))
+
+
+def normalizar_sexo(gender):
+    sexo = gender.lower()
+    if sexo == "female":
+        return "femenino"
+    # "male" y cualquier otro valor se guardan como masculino
+    return "masculino"
+
+
+def normalizar_persona(row):
+    return {
+        "nombre": row["nombre"],
+        "apellidos": row["apellidos"],
+        "sexo": normalizar_sexo(row["gender"]),
+        # Convertir la fecha al formato esperado por Django
+        "fnac": parsear_fecha(row["fnac"]),
+        # Normalizar el campo "telefono" (dejar solo los primeros 8 dígitos válidos)
+        "telefono": "".join(filter(str.isdigit, row["telefono"]))[:8],
+        "rol": row["rol"],
+        "especialidad": None,
+    }
+
+
+def fila_a_persona(row):
+    return Persona(**normalizar_persona(row))
+
+
+def resolver_persona(persona_id, personas_ids, minimo, maximo):
+    # Si la persona no existe se usa un ID aleatorio, como en la carga original
+    if persona_id in personas_ids:
+        return persona_id
+    persona_id = random.randint(minimo, maximo)
+    personas_ids.add(persona_id)
+    return persona_id
+
+
+def normalizar_test(row, personas_ids):
+    fecha_prueba = parsear_fecha(row["fecha"])
+    fecha_entrega = fecha_prueba + timedelta(days=calcular_dias_entrega(row["nombre"]))
+    return {
+        "nombre": row["nombre"],
+        "fecha": fecha_prueba,
+        "fecha_entrega": fecha_entrega,
+        "estado": row["estado"],
+        "observaciones": row["observaciones"] if row["observaciones"] != "N/a" else None,
+        "calificacion": int(row["calificacion"]),
+        "categoria_id": int(row["categoria_id"]),
+        "cliente_id": resolver_persona(int(row["cliente_id"]), personas_ids, 1000, 3000),
+        "personal_id": resolver_persona(int(row["personal_id"]), personas_ids, 1000, 2000),
+    }
+
+
+def fila_a_test(row, personas_ids):
+    return Test(**normalizar_test(row, personas_ids))
+
+
+def datos_resultado(test_id, nombre_test, fecha_entrega, aleatorio=random):
+    resultado_text, interpretacion, detalles = generar_resultado(nombre_test, aleatorio)
+    return {
+        "test_id": test_id,
+        "resultado": resultado_text,
+        "fecha": fecha_entrega,
+        "observaciones": "N/a",
+        "interpretacion": interpretacion,
+        "detalles": detalles,
+        "url_imagen_path": None,
+    }
+
+
+def test_a_resultado(test):
+    # El test ya debe estar guardado: el resultado se enlaza por su PK
+    return Resultado(**datos_resultado(test.pk, test.nombre, test.fecha_entrega))
+
+
+def guardar_lote_personas(lote):
+    Persona.objects.bulk_create(lote)
+
+
+def insertar_con_pks(modelo, lote):
+    # Inserta el lote y asigna a cada instancia la PK generada por la base de datos.
+    # Con RETURNING (PostgreSQL, SQLite >= 3.35) bulk_create ya las asigna.
+    conexion = connections[router.db_for_write(modelo)]
+    if conexion.features.can_return_rows_from_bulk_insert:
+        modelo.objects.bulk_create(lote)
+        return lote
+
+    # Sin RETURNING: dentro de la transacción del lote tenemos el bloqueo de
+    # escritura, así que las últimas len(lote) filas son las que acabamos de insertar
+    modelo.objects.bulk_create(lote)
+    pks = list(modelo.objects.order_by("-pk").values_list("pk", flat=True)[: len(lote)])
+    for instancia, pk in zip(lote, reversed(pks)):
+        instancia.pk = pk
+    return lote
+
+
+def guardar_lote_tests(lote):
+    # Fase 1: insertar los tests y obtener sus PKs
+    insertar_con_pks(Test, lote)
+    # Fase 2: enlazar e insertar los resultados del mismo lote
+    Resultado.objects.bulk_create([test_a_resultado(test) for test in lote])
+    acumular_tests(lote)
+
+
+def guardar_lote_personas_copy(lote):
+    copiar(Persona, lote)
+
+
+def guardar_lote_tests_copy(lote):
+    # Las PKs se reservan de la secuencia para enlazar los resultados sin RETURNING
+    for datos, pk in zip(lote, reservar_pks(Test, len(lote))):
+        datos["id"] = pk
+    copiar(Test, lote, incluir_pk=True)
+    copiar(Resultado, [datos_resultado(datos["id"], datos["nombre"], datos["fecha_entrega"]) for datos in lote])
+    acumular_tests(lote)
+
+
+def _cargar(filas, convertir, guardar, tamano_lote, nombre, omitir=0, al_guardar_lote=None):
+    # 'omitir' salta filas ya guardadas (reanudar una carga interrumpida) y
+    # 'al_guardar_lote(total)' se ejecuta dentro de la transacción de cada lote
+    inicio = time.monotonic()
+    total = omitir
+    filas = islice(filas, omitir, None)
+    try:
+        for lote in en_lotes((convertir(row) for row in filas), tamano_lote):
+            with transaction.atomic():
+                guardar(lote)
+                if al_guardar_lote is not None:
+                    al_guardar_lote(total + len(lote))
+            total += len(lote)
+            logger.debug("%s: %d filas guardadas", nombre, total)
+    finally:
+        # Invalida los cachés de KPIs si se confirmó al menos un lote
+        if total > omitir:
+            incrementar_version()
+
+    segundos = time.monotonic() - inicio
+    nuevas = total - omitir
+    estadisticas = {
+        "filas": total,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(nuevas / segundos, 1) if segundos > 0 else float(nuevas),
+    }
+    logger.info("%s: %d filas en %.2fs (%.1f filas/s)", nombre, nuevas, segundos, estadisticas["filas_por_segundo"])
+    return estadisticas
+
+
+def cargar_personas_csv(archivo, tamano_lote=None, omitir=0, al_guardar_lote=None, usar_copy=None):
+    # Con PostgreSQL se usa COPY; en otros motores, bulk_create
+    if usar_copy is None:
+        usar_copy = copy_disponible(Persona)
+    if usar_copy:
+        convertir, guardar = normalizar_persona, guardar_lote_personas_copy
+    else:
+        convertir, guardar = fila_a_persona, guardar_lote_personas
+    tamano_lote = tamano_lote or (TAMANO_LOTE_COPY if usar_copy else TAMANO_LOTE)
+
+    filas = iterar_filas_csv(archivo)
+    return _cargar(filas, convertir, guardar, tamano_lote, "personas", omitir, al_guardar_lote)
+
+
+def cargar_tests_csv(archivo, tamano_lote=None, omitir=0, al_guardar_lote=None, usar_copy=None):
+    if usar_copy is None:
+        usar_copy = copy_disponible(Test)
+    if usar_copy:
+        normalizar, guardar = normalizar_test, guardar_lote_tests_copy
+    else:
+        normalizar, guardar = fila_a_test, guardar_lote_tests
+    tamano_lote = tamano_lote or (TAMANO_LOTE_COPY if usar_copy else TAMANO_LOTE)
+
+    # Solo se guardan en memoria los IDs de personas, no las instancias
+    personas_ids = set(Persona.objects.values_list("id", flat=True))
+    filas = iterar_filas_csv(archivo)
+    return _cargar(
+        filas,
+        lambda row: normalizar(row, personas_ids),
+        guardar,
+        tamano_lote,
+        "tests",
+        omitir,
+        al_guardar_lote,
+    )
@@ -0,0 +1,51 @@
+"""
+Cálculo concurrente de KPIs para las vistas async.
+
+Las funciones de KPIs usan el ORM síncrono, así que se ejecutan en un pool
+de hilos acotado (KPI_HILOS) y se esperan con asyncio.gather: una página que
+pide varios KPIs tarda lo que el más lento y no la suma de todos. Cada hilo
+tiene su propia conexión a la base de datos; al terminar cada tarea se
+cierran las que ya no deben reutilizarse (CONN_MAX_AGE).
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+_ejecutor = None
+_lock = threading.Lock()
+
+
+def ejecutor():
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "KPI_HILOS", 4), thread_name_prefix="kpi"
+            )
+        return _ejecutor
+
+
+def _ejecutar(funcion):
+    try:
+        return funcion()
+    finally:
+        close_old_connections()
+
+
+async def calcular(funciones):
+    # funciones: {nombre: función sin argumentos}; devuelve {nombre: resultado}
+    loop = asyncio.get_running_loop()
+    nombres = list(funciones)
+    # run_in_executor no copia el contexto: cada tarea lleva el suyo (réplica, primaria forzada)
+    resultados = await asyncio.gather(
+        *(
+            loop.run_in_executor(ejecutor(), contextvars.copy_context().run, _ejecutar, funciones[nombre])
+            for nombre in nombres
+        )
+    )
+    return dict(zip(nombres, resultados))
@@ -0,0 +1,84 @@
+"""
+Caché de las funciones de KPIs.
+
+Los resultados se guardan en el caché 'kpis' de Django (LocMemCache: TTL y
+desalojo LRU al llegar a MAX_ENTRIES). La versión de datos forma parte de la
+clave, así que una carga CSV invalida todo sin borrar nada; las entradas
+viejas salen por LRU o al vencer el TTL.
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+
+from django.core.cache import caches
+
+from .metricas import observar
+from .routers import lectura_replica
+from .versiones import version_datos
+
+
+ALIAS_CACHE = "kpis"
+
+_FALTA = object()
+_contadores = defaultdict(lambda: {"aciertos": 0, "fallos": 0})
+_lock = threading.Lock()
+
+
+def _clave(nombre, args, kwargs):
+    # Se incluye la fecha porque varios KPIs dependen del día actual
+    firma = repr((args, sorted(kwargs.items()), date.today().isoformat()))
+    return f"kpi:{nombre}:{hashlib.md5(firma.encode()).hexdigest()}"
+
+
+def _contar(nombre, campo):
+    with _lock:
+        _contadores[nombre][campo] += 1
+
+
+def cache_kpi(funcion):
+    nombre = funcion.__qualname__
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        cache = caches[ALIAS_CACHE]
+        clave = _clave(nombre, args, kwargs)
+        version = version_datos()
+
+        valor = cache.get(clave, _FALTA, version=version)
+        if valor is not _FALTA:
+            _contar(nombre, "aciertos")
+            return valor
+
+        _contar(nombre, "fallos")
+        # Solo lecturas: pueden ir a la réplica si está al día con la versión de la clave
+        inicio = time.perf_counter()
+        with lectura_replica():
+            valor = funcion(*args, **kwargs)
+        observar("kpi_calculo_segundos", time.perf_counter() - inicio, funcion=nombre)
+        cache.set(clave, valor, version=version)
+        return valor
+
+    envoltura.sin_cache = funcion
+    return envoltura
+
+
+def estadisticas():
+    with _lock:
+        por_funcion = {nombre: dict(valores) for nombre, valores in _contadores.items()}
+    aciertos = sum(valores["aciertos"] for valores in por_funcion.values())
+    fallos = sum(valores["fallos"] for valores in por_funcion.values())
+    return {
+        "version_datos": version_datos(),
+        "aciertos": aciertos,
+        "fallos": fallos,
+        "tasa_aciertos": round(aciertos / (aciertos + fallos), 4) if aciertos + fallos else 0,
+        "funciones": por_funcion,
+    }
+
+
+def reiniciar_estadisticas():
+    with _lock:
+        _contadores.clear()
@@ -0,0 +1,73 @@
+"""
+Consultas consolidadas de KPIs.
+
+ConsultaAgregada junta varias sumas, cada una con un filtro opcional, y las
+resuelve con un solo aggregate(), usando agregación condicional (FILTER /
+CASE WHEN) en lugar de una consulta por medida. Con agrupar() las medidas se calculan por grupo en la misma consulta
+(values().annotate()), y los grupos salen de los datos.
+"""
+from django.db.models import Q, Sum
+
+from .agregados import promedio
+from .kpi_cache import cache_kpi
+from .models import ResumenCalificacion, ResumenTest
+
+
+class ConsultaAgregada:
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.medidas = {}
+        self.grupos = ()
+
+    def sumar(self, nombre, expresion, filtro=None):
+        self.medidas[nombre] = Sum(expresion, filter=filtro)
+        return self
+
+    def agrupar(self, *campos):
+        self.grupos = campos
+        return self
+
+    def ejecutar(self):
+        # Un diccionario con las medidas o, con agrupar(), uno por grupo
+        if self.grupos:
+            return list(self.queryset.values(*self.grupos).annotate(**self.medidas).order_by(*self.grupos))
+        return self.queryset.aggregate(**self.medidas)
+
+
+@cache_kpi
+def resumen_satisfaccion():
+    # Índice general, índices por sexo e histograma de calificaciones en una sola consulta
+    # agrupada por calificación: el histograma tiene las calificaciones que hay en los datos
+    consulta = ConsultaAgregada(ResumenCalificacion.objects.all()).agrupar("calificacion")
+    consulta.sumar("total", "cantidad")
+    for sexo in ("masculino", "femenino"):
+        consulta.sumar(sexo, "cantidad", Q(cliente_sexo=sexo))
+    filas = consulta.ejecutar()
+
+    def indice(medida):
+        return promedio(
+            sum(fila["calificacion"] * (fila[medida] or 0) for fila in filas),
+            sum(fila[medida] or 0 for fila in filas),
+        )
+
+    histograma = [(fila["calificacion"], fila["total"]) for fila in filas if fila["total"]]
+    return {
+        'indice_satisfaccion': round(indice("total"), 2),
+        'indice_satisfaccion_masculino': round(indice("masculino"), 2),
+        'indice_satisfaccion_femenino': round(indice("femenino"), 2),
+        'calificaciones_labels': [calificacion for calificacion, _ in histograma],
+        'calificaciones_totals': [total for _, total in histograma],
+    }
+
+
+@cache_kpi
+def categorias_mas_solicitadas():
+    categoria_counts = (
+        ResumenTest.objects.values('categoria__nombre')
+        .annotate(cantidad=Sum('cantidad'))
+        .order_by('-cantidad')
+    )
+    return {
+        'categorias': [item['categoria__nombre'] for item in categoria_counts],
+        'cantidades': [item['cantidad'] for item in categoria_counts],
+    }
@@ -0,0 +1,17 @@
+"""
+Capa de acceso a la API de lenguaje usada por analitics para generar SQL.
+"""
+from .cliente import ClienteLLM, ErrorLLM, LLMOcupado, cliente
+from .sql import estadisticas_cache, generar_sql, generar_sql_async, normalizar_pedido, vaciar_cache
+
+__all__ = [
+    "ClienteLLM",
+    "ErrorLLM",
+    "LLMOcupado",
+    "cliente",
+    "estadisticas_cache",
+    "generar_sql",
+    "generar_sql_async",
+    "normalizar_pedido",
+    "vaciar_cache",
+]
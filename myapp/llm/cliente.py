@@ -0,0 +1,91 @@
+"""
+Cliente HTTP para la API de chat (OpenAI o compatible).
+
+Una sola requests.Session por proceso reutiliza las conexiones (pool de
+HTTPAdapter), cada llamada tiene timeout de conexión y de lectura, los
+errores transitorios (429 y 5xx, fallas de conexión) se reintentan con
+espera exponencial, y un semáforo limita cuántas llamadas hay en curso a la
+vez para que un proveedor lento no ocupe todos los hilos del servidor.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ErrorLLM(Exception):
+    pass
+
+
+class LLMOcupado(ErrorLLM):
+    # No se consiguió turno en el limitador de concurrencia
+    pass
+
+
+class ClienteLLM:
+    def __init__(self, url=None, api_key=None, modelo=None, timeout=None, reintentos=None, concurrencia=None,
+                 espera_turno=None):
+        self.url = url or settings.LLM_URL
+        self.api_key = api_key if api_key is not None else settings.LLM_API_KEY
+        self.modelo = modelo or settings.LLM_MODELO
+        self.timeout = timeout or (settings.LLM_TIMEOUT_CONEXION, settings.LLM_TIMEOUT_LECTURA)
+        self.espera_turno = espera_turno if espera_turno is not None else settings.LLM_ESPERA_TURNO
+        concurrencia = concurrencia or settings.LLM_CONCURRENCIA
+        self.turnos = threading.BoundedSemaphore(concurrencia)
+
+        reintentos = reintentos if reintentos is not None else settings.LLM_REINTENTOS
+        adaptador = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=concurrencia,
+            # Se reintentan fallas de conexión y respuestas 429/5xx; un timeout de
+            # lectura no, porque el modelo ya estaba trabajando y repetir triplica la espera
+            max_retries=Retry(
+                total=reintentos,
+                connect=reintentos,
+                read=0,
+                status=reintentos,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=None,  # también POST: la llamada no modifica nada
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+        self.sesion = requests.Session()
+        self.sesion.mount("http://", adaptador)
+        self.sesion.mount("https://", adaptador)
+
+    def completar(self, mensajes, **opciones):
+        # Devuelve el texto de la primera respuesta del modelo
+        if not self.turnos.acquire(timeout=self.espera_turno):
+            raise LLMOcupado("Hay demasiadas consultas a la IA en curso, intente de nuevo en unos segundos.")
+        try:
+            respuesta = self.sesion.post(
+                self.url,
+                json={"model": self.modelo, "messages": mensajes, **opciones},
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+            )
+            respuesta.raise_for_status()
+            return respuesta.json()["choices"][0]["message"]["content"]
+        except requests.exceptions.RequestException as e:
+            raise ErrorLLM(f"Error al consultar la API de IA: {e}") from e
+        except (KeyError, IndexError, ValueError) as e:
+            raise ErrorLLM(f"Respuesta inesperada de la API de IA: {e}") from e
+        finally:
+            self.turnos.release()
+
+
+_cliente = None
+_lock = threading.Lock()
+
+
+def cliente():
+    # Cliente compartido del proceso (la sesión y su pool se crean una vez)
+    global _cliente
+    with _lock:
+        if _cliente is None:
+            _cliente = ClienteLLM()
+        return _cliente
@@ -0,0 +1,82 @@
+"""
+Generación de consultas SQL a partir de texto.
+
+El resultado se guarda en un LRU por proceso cuya clave es el pedido
+normalizado (espacios colapsados; no se cambian mayúsculas porque pueden ser
+parte de un valor buscado) junto con el esquema enviado en el prompt: el
+mismo pedido con otro esquema vuelve a consultar a la API. Los errores no se
+guardan.
+"""
+import asyncio
+import functools
+import re
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cliente import cliente
+
+
+MENSAJE_SISTEMA = "Eres un asistente útil que puede generar consultas SQL."
+
+PROMPT = """
+    Aquí está el esquema de la base de datos:
+
+    {esquema}
+
+    El usuario ha solicitado lo siguiente :
+    {texto} , solo dame la consulta , solo la consulta niun texto mas , directo la consulta nada mas , ni un texto de mas solo la consulta , como : "SELECT * FROM tabla"
+    """
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_pedido(texto):
+    return _ESPACIOS.sub(" ", texto).strip()
+
+
+def limpiar_sql(respuesta):
+    # El modelo a veces envuelve la consulta en un bloque ```sql ... ```
+    sql = respuesta.strip().replace("`", "")
+    if sql[:4].lower() == "sql\n":
+        sql = sql[4:]
+    return sql.strip()
+
+
+@functools.lru_cache(maxsize=getattr(settings, "LLM_CACHE_SQL", 256))
+def _generar(pedido, esquema):
+    mensajes = [
+        {"role": "system", "content": MENSAJE_SISTEMA},
+        {"role": "user", "content": PROMPT.format(esquema=esquema, texto=pedido)},
+    ]
+    return limpiar_sql(cliente().completar(mensajes))
+
+
+def generar_sql(texto, esquema):
+    return _generar(normalizar_pedido(texto), esquema)
+
+
+_generar_en_hilo = sync_to_async(generar_sql, thread_sensitive=False)
+_turnos_async = weakref.WeakKeyDictionary()
+
+
+def _semaforo_async():
+    # Un semáforo por event loop: limita las tareas que esperan a la API sin ocupar hilos
+    loop = asyncio.get_running_loop()
+    if loop not in _turnos_async:
+        _turnos_async[loop] = asyncio.Semaphore(settings.LLM_CONCURRENCIA)
+    return _turnos_async[loop]
+
+
+async def generar_sql_async(texto, esquema):
+    async with _semaforo_async():
+        return await _generar_en_hilo(texto, esquema)
+
+
+def estadisticas_cache():
+    return _generar.cache_info()._asdict()
+
+
+def vaciar_cache():
+    _generar.cache_clear()
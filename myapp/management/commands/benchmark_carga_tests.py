@@ -0,0 +1,132 @@
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.copy_postgres import copy_disponible
+from myapp.importers import (
+    TAMANO_LOTE,
+    TAMANO_LOTE_COPY,
+    _cargar,
+    fila_a_test,
+    generar_resultado,
+    guardar_lote_tests,
+    guardar_lote_tests_copy,
+    normalizar_test,
+)
+from myapp.models import Categoria, Persona, Resultado, Test
+
+
+NOMBRES_TESTS = ["Covid PCR", "Prueba de paternidad", "Hemograma", "Influenza", "Panel de alergia", "Otro"]
+
+
+class Rollback(Exception):
+    pass
+
+
+def filas_sinteticas(cantidad, categoria_id, clientes_ids, personal_ids, semilla=0):
+    # Filas con el mismo formato que el CSV de tests
+    aleatorio = random.Random(semilla)
+    inicio = date(2024, 1, 1)
+    for _ in range(cantidad):
+        fecha = inicio + timedelta(days=aleatorio.randint(0, 364))
+        yield {
+            "nombre": aleatorio.choice(NOMBRES_TESTS),
+            "fecha": fecha.strftime("%m/%d/%Y"),
+            "estado": "entregado",
+            "observaciones": "N/a",
+            "calificacion": str(aleatorio.randint(0, 10)),
+            "categoria_id": str(categoria_id),
+            "cliente_id": str(aleatorio.choice(clientes_ids)),
+            "personal_id": str(aleatorio.choice(personal_ids)),
+        }
+
+
+def carga_actual(filas, personas_ids):
+    # Camino anterior: todo en memoria y un bulk_create por modelo, con los
+    # resultados creados a partir de tests aún sin guardar
+    tests = []
+    resultados = []
+    for row in filas:
+        test = fila_a_test(row, personas_ids)
+        resultado_text, interpretacion, detalles = generar_resultado(test.nombre)
+        resultados.append(Resultado(
+            test=test,
+            resultado=resultado_text,
+            fecha=test.fecha_entrega,
+            observaciones="N/a",
+            interpretacion=interpretacion,
+            detalles=detalles,
+            url_imagen_path=None,
+        ))
+        tests.append(test)
+    Test.objects.bulk_create(tests)
+    Resultado.objects.bulk_create(resultados)
+
+
+def carga_por_lotes(filas, personas_ids, tamano_lote):
+    _cargar(filas, lambda row: fila_a_test(row, personas_ids), guardar_lote_tests, tamano_lote, "benchmark")
+
+
+def carga_copy(filas, personas_ids):
+    _cargar(filas, lambda row: normalizar_test(row, personas_ids), guardar_lote_tests_copy, TAMANO_LOTE_COPY, "benchmark")
+
+
+class Command(BaseCommand):
+    help = "Compara la carga de tests anterior con la carga por lotes en dos fases y COPY (los datos se descartan)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filas", type=int, nargs="+", default=[10000, 100000, 1000000])
+        parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE)
+        parser.add_argument("--memoria", action="store_true", help="Mide el pico de memoria con tracemalloc (más lento).")
+        parser.add_argument("--sin-actual", action="store_true", help="Omite el camino anterior (útil con millones de filas).")
+
+    def handle(self, *args, **options):
+        caminos = [("lotes", lambda filas, ids: carga_por_lotes(filas, ids, options["tamano_lote"]))]
+        if not options["sin_actual"]:
+            caminos.insert(0, ("actual", carga_actual))
+        if copy_disponible(Test):
+            caminos.append(("copy", carga_copy))
+
+        self.stdout.write(f"{'filas':>10} {'camino':>8} {'segundos':>10} {'filas/s':>12} {'memoria MB':>11}")
+        for cantidad in options["filas"]:
+            for nombre, cargar in caminos:
+                segundos, pico, correctos = self.medir(cargar, cantidad, options["memoria"])
+                memoria = f"{pico / 1e6:11.1f}" if options["memoria"] else f"{'-':>11}"
+                aviso = "" if correctos else "  (resultados sin test enlazado)"
+                self.stdout.write(
+                    f"{cantidad:>10} {nombre:>8} {segundos:>10.2f} {cantidad / segundos:>12.0f} {memoria}{aviso}"
+                )
+
+    def medir(self, cargar, cantidad, medir_memoria):
+        # Cada medición corre en una transacción que se revierte al final
+        resultado = {}
+        try:
+            with transaction.atomic():
+                categoria = Categoria.objects.create(nombre="benchmark")
+                personas = Persona.objects.bulk_create(
+                    [Persona(nombre=f"bench-{i}", apellidos="bench", rol="cliente" if i >= 10 else "personal")
+                     for i in range(100)]
+                )
+                ids = [persona.pk for persona in personas]
+                personas_ids = set(ids)
+                filas = filas_sinteticas(cantidad, categoria.pk, ids[10:], ids[:10])
+
+                if medir_memoria:
+                    tracemalloc.start()
+                inicio = time.perf_counter()
+                cargar(filas, personas_ids)
+                resultado["segundos"] = time.perf_counter() - inicio
+                resultado["pico"] = tracemalloc.get_traced_memory()[1] if medir_memoria else 0
+                if medir_memoria:
+                    tracemalloc.stop()
+
+                nuevos = Test.objects.filter(categoria=categoria)
+                resultado["correctos"] = Resultado.objects.filter(test__in=nuevos).count() == cantidad
+                raise Rollback
+        except Rollback:
+            pass
+        return resultado["segundos"], resultado["pico"], resultado["correctos"]
@@ -0,0 +1,76 @@
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# Consultas cortas: lo que se mide es el costo de obtener la conexión en cada solicitud
+CONSULTA = "SELECT 1"
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia por solicitud sin conexiones persistentes, con CONN_MAX_AGE y, "
+        "si psycopg 3 está instalado, con el pool de psycopg."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--solicitudes", type=int, default=200)
+        parser.add_argument("--consultas", type=int, default=3, help="Consultas por solicitud")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        base = connections[options["database"]]
+        if base.vendor != "postgresql":
+            raise CommandError("El benchmark es para PostgreSQL.")
+
+        modos = [
+            ("sin persistencia", {"CONN_MAX_AGE": 0}, {}),
+            ("CONN_MAX_AGE=60", {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True}, {}),
+        ]
+        if base.Database.__name__ == "psycopg":
+            modos.append(("pool psycopg", {"CONN_MAX_AGE": 0}, {"pool": {"min_size": 1, "max_size": 2}}))
+        else:
+            self.stdout.write("psycopg 3 no está instalado: se omite el pool.")
+
+        self.stdout.write(f"{'modo':>18} {'mediana ms':>11} {'p95 ms':>8} {'conexiones':>11}")
+        medianas = {}
+        for nombre, cambios, opciones in modos:
+            tiempos, conexiones = self.medir(base, cambios, opciones, options["solicitudes"], options["consultas"])
+            medianas[nombre] = statistics.median(tiempos)
+            p95 = statistics.quantiles(tiempos, n=20)[-1]
+            self.stdout.write(f"{nombre:>18} {medianas[nombre]:>11.2f} {p95:>8.2f} {conexiones:>11}")
+
+        referencia = medianas["sin persistencia"]
+        for nombre, mediana in medianas.items():
+            if nombre != "sin persistencia":
+                self.stdout.write(f"{nombre}: {referencia - mediana:.2f} ms menos por solicitud")
+
+    def medir(self, base, cambios, opciones, solicitudes, consultas):
+        ajustes = copy.deepcopy(base.settings_dict)
+        ajustes.update(cambios)
+        ajustes["OPTIONS"].update(opciones)
+        # Conexión aparte con su propio alias: no toca la del proceso ni su pool
+        conexion = base.__class__(ajustes, alias=f"benchmark-{id(ajustes)}")
+        procesos = set()
+        tiempos = []
+        try:
+            for _ in range(solicitudes):
+                inicio = time.perf_counter()
+                # Lo mismo que hacen request_started y request_finished (close_old_connections)
+                conexion.close_if_unusable_or_obsolete()
+                with conexion.cursor() as cursor:
+                    # Cada proceso servidor distinto es una conexión real abierta
+                    cursor.execute("SELECT pg_backend_pid()")
+                    procesos.add(cursor.fetchone()[0])
+                    for _ in range(consultas - 1):
+                        cursor.execute(CONSULTA)
+                        cursor.fetchone()
+                conexion.close_if_unusable_or_obsolete()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        finally:
+            conexion.close()
+            if opciones.get("pool"):
+                conexion.close_pool()
+        return tiempos, len(procesos)
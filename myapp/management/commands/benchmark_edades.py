@@ -0,0 +1,95 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from myapp.agregados import RANGOS_EDAD
+from myapp.edades import edad_exacta, rango_edad_expresion
+from myapp.management.commands.benchmark_carga_tests import NOMBRES_TESTS, Rollback
+from myapp.models import Categoria, Persona, Test
+
+
+def consulta_actual(tests):
+    # Cálculo anterior: diferencia de años con hoy, un grupo por edad
+    hoy = date.today()
+    return tests.annotate(edad=hoy.year - F('cliente__fnac__year')).values('edad').annotate(cantidad=Count('id')).order_by('edad')
+
+
+def consulta_exacta(tests):
+    # Edad cumplida a la fecha del test, un grupo por edad
+    return tests.annotate(edad=edad_exacta('cliente__fnac', 'fecha')).values('edad').annotate(cantidad=Count('id')).order_by('edad')
+
+
+def consulta_rangos(tests):
+    # Edad cumplida a la fecha del test agrupada por rango en la misma consulta
+    return (
+        tests.annotate(rango=rango_edad_expresion(edad_exacta('cliente__fnac', 'fecha'), RANGOS_EDAD))
+        .values('rango').annotate(cantidad=Count('id')).order_by()
+    )
+
+
+CONSULTAS = [("actual", consulta_actual), ("exacta", consulta_exacta), ("rangos", consulta_rangos)]
+
+
+class Command(BaseCommand):
+    help = "Compara el cálculo de edad anterior con la edad exacta y los rangos en SQL (los datos se descartan)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filas", type=int, default=1000000)
+        parser.add_argument("--clientes", type=int, default=5000)
+        parser.add_argument("--repeticiones", type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                categoria = self.generar(options["filas"], options["clientes"])
+                tests = Test.objects.filter(categoria=categoria, cliente__rol='cliente')
+
+                self.stdout.write(f"{'consulta':>8} {'segundos':>10} {'grupos':>8}")
+                for nombre, consulta in CONSULTAS:
+                    tiempos = []
+                    for _ in range(options["repeticiones"]):
+                        inicio = time.perf_counter()
+                        grupos = list(consulta(tests))
+                        tiempos.append(time.perf_counter() - inicio)
+                    self.stdout.write(f"{nombre:>8} {min(tiempos):>10.3f} {len(grupos):>8}")
+
+                # Ambas a la fecha de hoy: solo difieren por los cumpleaños que aún no llegaron
+                distintas = tests.annotate(
+                    actual=date.today().year - F('cliente__fnac__year'),
+                    exacta=edad_exacta('cliente__fnac'),
+                ).exclude(actual=F('exacta')).count()
+                self.stdout.write(
+                    f"Tests con edad distinta entre el cálculo anterior y el exacto (hoy): {distintas} de {options['filas']}"
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def generar(self, cantidad, cantidad_clientes):
+        aleatorio = random.Random(0)
+        categoria = Categoria.objects.create(nombre="benchmark")
+        clientes = Persona.objects.bulk_create([
+            Persona(
+                nombre=f"bench-{i}", apellidos="bench", rol="cliente",
+                fnac=date(1940, 1, 1) + timedelta(days=aleatorio.randint(0, 365 * 65)),
+            )
+            for i in range(cantidad_clientes)
+        ])
+        personal = Persona.objects.create(nombre="bench-personal", apellidos="bench", rol="personal")
+
+        inicio = date(2020, 1, 1)
+        for desde in range(0, cantidad, 10000):
+            lote = []
+            for _ in range(min(10000, cantidad - desde)):
+                fecha = inicio + timedelta(days=aleatorio.randint(0, 365 * 5))
+                lote.append(Test(
+                    nombre=aleatorio.choice(NOMBRES_TESTS), fecha=fecha, fecha_entrega=fecha,
+                    estado="entregado", observaciones="N/a", calificacion=aleatorio.randint(0, 10),
+                    categoria=categoria, cliente=aleatorio.choice(clientes), personal=personal,
+                ))
+            Test.objects.bulk_create(lote)
+        return categoria
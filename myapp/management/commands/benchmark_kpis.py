@@ -0,0 +1,251 @@
+import json
+import os
+import sqlite3
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from myapp.agregados import reconstruir_agregados
+from myapp.datos_sinteticos import Generador, asegurar_categorias, guardar_personas, guardar_tests
+from myapp.kpi_cache import ALIAS_CACHE
+from myapp.models import Categoria, Persona, Resultado, ResumenCalificacion, ResumenTest, Test
+from myapp.routers import primaria_forzada
+from myapp.views import DATASETS_KPI
+
+
+# Tablas que se vacían antes de sembrar cada escala
+MODELOS_DATOS = [Resultado, Test, Persona, Categoria, ResumenTest, ResumenCalificacion]
+
+# Vistas medidas de punta a punta (URL, middleware y plantilla), además de api/kpi/<nombre>/
+VISTAS = [
+    ("kpi1", ""),
+    ("kpi2", ""),
+    ("kpi3", ""),
+    ("kpi4", ""),
+    ("kpi5", ""),
+    ("kpi6", ""),
+    ("api_tests", "?orden=-fecha"),
+    ("api_personas", "?rol=cliente"),
+]
+
+
+def vaciar_datos():
+    tablas = [modelo._meta.db_table for modelo in MODELOS_DATOS]
+    connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tablas, reset_sequences=True))
+
+
+def sembrar(escala, semilla):
+    # 'escala' tests y una persona cada diez, siempre los mismos para la misma semilla; los
+    # dos años terminan hoy para que los KPIs semanales y mensuales no midan ventanas vacías
+    vaciar_datos()
+    generador = Generador(semilla=semilla, desde=date.today() - timedelta(days=730), dias=730)
+    categorias = asegurar_categorias()
+    clientes, personal = [], []
+    for bloque in generador.personas(max(100, escala // 10)):
+        with transaction.atomic():
+            pks = guardar_personas(bloque)
+        for datos, pk in zip(bloque, pks):
+            (personal if datos["rol"] == "personal" else clientes).append(pk)
+    for tests, resultados in generador.tests(escala, clientes, personal, categorias):
+        with transaction.atomic():
+            guardar_tests(tests, resultados)
+    reconstruir_agregados()
+    # Estadísticas al día antes de medir: si no, el plan depende de si el autovacuum ya pasó
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def _base_referencia():
+    # SQLite en memoria con datos fijos, independiente de la base de datos medida
+    conexion = sqlite3.connect(":memory:")
+    conexion.execute("CREATE TABLE t (k INTEGER, v INTEGER)")
+    conexion.executemany("INSERT INTO t VALUES (?, ?)", ((i % 97, i * 7 % 1000) for i in range(20000)))
+    return conexion
+
+
+def referencia(conexion):
+    # Trabajo fijo de CPU y de consulta (~2 ms): su tiempo, medido junto a cada benchmark,
+    # indica qué tan rápida está la máquina en ese momento
+    inicio = time.perf_counter()
+    conexion.execute("SELECT k, COUNT(*), AVG(v) FROM t GROUP BY k ORDER BY 3").fetchall()
+    sum(i * i for i in range(50000))
+    return (time.perf_counter() - inicio) * 1000
+
+
+def medir(funcion, repeticiones):
+    # Mejor tiempo de las repeticiones (el menos afectado por otros procesos), consultas de
+    # una ejecución y pico de memoria (tracemalloc) de otra; todas con la caché de KPIs vacía
+    def ejecutar():
+        caches[ALIAS_CACHE].clear()
+        funcion()
+
+    ejecutar()  # Calentamiento: imports, plantillas, estadísticas del motor
+    base_referencia = _base_referencia()
+    tiempos, referencias = [], []
+    for _ in range(repeticiones):
+        referencias.append(referencia(base_referencia))
+        inicio = time.perf_counter()
+        ejecutar()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    with CaptureQueriesContext(connection) as capturadas:
+        ejecutar()
+    # Se cuenta ya: captured_queries se lee de connection.queries, que la próxima solicitud vacía
+    consultas = len(capturadas.captured_queries)
+
+    tracemalloc.start()
+    try:
+        ejecutar()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ms": round(min(tiempos), 3),
+        # Tiempo en unidades de la referencia: es lo que se compara con la línea base
+        "relativo": round(min(tiempos) / min(referencias), 3),
+        "consultas": consultas,
+        "memoria_kb": round(pico / 1024, 1),
+    }
+
+
+def regresiones(actual, base, umbral, min_ms, min_kb):
+    # Tiempo (relativo a la referencia) y memoria: más del umbral y por encima del ruido;
+    # consultas: cualquier aumento
+    motivos = []
+    if actual["relativo"] > base["relativo"] * (1 + umbral) and actual["ms"] - base["ms"] > min_ms:
+        motivos.append(f"tiempo {base['ms']:.2f} -> {actual['ms']:.2f} ms "
+                       f"({base['relativo']:.1f} -> {actual['relativo']:.1f} referencias)")
+    if actual["consultas"] > base["consultas"]:
+        motivos.append(f"consultas {base['consultas']} -> {actual['consultas']}")
+    if actual["memoria_kb"] > base["memoria_kb"] * (1 + umbral) and actual["memoria_kb"] - base["memoria_kb"] > min_kb:
+        motivos.append(f"memoria {base['memoria_kb']:.0f} -> {actual['memoria_kb']:.0f} KB")
+    return motivos
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide cada función de KPI y cada vista de KPIs (tiempo, consultas y pico de memoria) sobre datos "
+        "sintéticos de varias escalas en una base de datos de prueba, y falla si algo empeora respecto "
+        "de la línea base guardada. Mide el motor de DATABASES['default'] (SQLite con DB_ENGINE=sqlite; "
+        "PostgreSQL necesita permiso para crear la base de prueba); cada motor tiene su línea base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--escalas", type=int, nargs="+", default=[1000, 10000, 100000], help="Tests sembrados.")
+        parser.add_argument("--repeticiones", type=int, default=7)
+        parser.add_argument("--semilla", type=int, default=0)
+        parser.add_argument("--baseline", default=os.path.join(settings.BASE_DIR, "benchmark_kpis.json"))
+        parser.add_argument("--guardar", action="store_true",
+                            help="Guarda los resultados como línea base del motor actual.")
+        parser.add_argument("--umbral", type=float, default=0.3,
+                            help="Aumento relativo de tiempo o memoria que cuenta como regresión.")
+        parser.add_argument("--min-ms", type=float, default=2.0, help="Diferencias de tiempo menores son ruido.")
+        parser.add_argument("--min-kb", type=float, default=64.0, help="Diferencias de memoria menores son ruido.")
+        parser.add_argument("--reintentos", type=int, default=2,
+                            help="Veces que se vuelve a medir un benchmark más lento o pesado que la línea "
+                                 "base antes de darlo por regresión (descarta interferencias pasajeras).")
+        parser.add_argument("--solo", nargs="+", metavar="NOMBRE",
+                            help="Mide solo estas funciones o vistas (p. ej. categorias kpi1).")
+
+    def handle(self, *args, **options):
+        motor = connection.vendor
+        lineas_base = {}
+        if os.path.exists(options["baseline"]):
+            with open(options["baseline"], encoding="utf-8") as archivo:
+                lineas_base = json.load(archivo)
+        base_motor = lineas_base.get(motor, {})
+
+        # Base de datos de prueba como la del test runner (test_<NAME>; en SQLite, en memoria)
+        setup_test_environment()
+        nombre_original = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Sin memo de la versión de datos: cada solicitud la lee y el número de consultas no
+            # depende de cuánto tardó la anterior
+            with override_settings(METRICAS_MUESTREO=0, VERSION_DATOS_MEMO=0), primaria_forzada():
+                resultados, encontradas = self.medir_escalas(base_motor, options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        if options["guardar"]:
+            for escala, medidas in resultados.items():
+                base_motor.setdefault(escala, {}).update(medidas)
+            lineas_base[motor] = base_motor
+            with open(options["baseline"], "w", encoding="utf-8") as archivo:
+                json.dump(lineas_base, archivo, indent=2, sort_keys=True)
+            self.stdout.write(f"Línea base de {motor} guardada en {options['baseline']}.")
+        elif not base_motor:
+            self.stdout.write(f"No hay línea base de {motor} en {options['baseline']}; usar --guardar.")
+
+        if encontradas:
+            for regresion in encontradas:
+                self.stderr.write(regresion)
+            raise CommandError(f"{len(encontradas)} regresiones respecto de la línea base (umbral {options['umbral']:.0%}).")
+
+    def benchmarks(self, cliente, solo):
+        # {nombre: función sin argumentos} de las funciones de KPIs y de las vistas
+        funciones = {}
+        for nombre, funcion in DATASETS_KPI.items():
+            if not solo or nombre in solo:
+                # Sin la caché de KPIs: se mide la consulta, no el acierto
+                funciones[f"funcion:{nombre}"] = getattr(funcion, "sin_cache", funcion)
+
+        urls = [(nombre, reverse(nombre) + parametros) for nombre, parametros in VISTAS]
+        urls += [(f"api_kpi:{nombre}", reverse("api_kpi", args=[nombre])) for nombre in DATASETS_KPI]
+        for nombre, url in urls:
+            if solo and nombre not in solo and nombre.removeprefix("api_kpi:") not in solo:
+                continue
+            respuesta = cliente.get(url)
+            if respuesta.status_code != 200:
+                raise CommandError(f"{url} respondió {respuesta.status_code}.")
+            funciones[f"vista:{nombre}"] = lambda url=url: cliente.get(url)
+        return funciones
+
+    def medir_escalas(self, base_motor, options):
+        criterios = (options["umbral"], options["min_ms"], options["min_kb"])
+        cliente = Client()
+        resultados, encontradas = {}, []
+        self.stdout.write(f"{'escala':>8} {'benchmark':<44} {'ms':>9} {'base ms':>9} {'consultas':>9} {'memoria KB':>11}")
+        for escala in options["escalas"]:
+            # Claves de texto: así quedan también al leer el JSON
+            escala = str(escala)
+            inicio = time.monotonic()
+            sembrar(int(escala), options["semilla"])
+            self.stdout.write(f"Escala {escala}: datos sembrados en {time.monotonic() - inicio:.1f}s.")
+
+            medidas = {}
+            for nombre, funcion in self.benchmarks(cliente, set(options["solo"] or [])).items():
+                actual = medir(funcion, options["repeticiones"])
+                base = base_motor.get(escala, {}).get(nombre)
+                motivos = regresiones(actual, base, *criterios) if base else []
+                # Un aumento de consultas es determinista; tiempo y memoria se vuelven a medir
+                for _ in range(options["reintentos"]):
+                    if not motivos or actual["consultas"] > base["consultas"]:
+                        break
+                    otra = medir(funcion, options["repeticiones"])
+                    actual = {
+                        **(otra if otra["relativo"] < actual["relativo"] else actual),
+                        "memoria_kb": min(otra["memoria_kb"], actual["memoria_kb"]),
+                    }
+                    motivos = regresiones(actual, base, *criterios)
+                medidas[nombre] = actual
+
+                base_ms = f"{base['ms']:>9.2f}" if base else f"{'-':>9}"
+                linea = (f"{escala:>8} {nombre:<44} {actual['ms']:>9.2f} {base_ms} "
+                         f"{actual['consultas']:>9} {actual['memoria_kb']:>11.0f}")
+                if motivos:
+                    encontradas.append(f"[{escala}] {nombre}: {', '.join(motivos)}")
+                    linea = self.style.ERROR(linea)
+                self.stdout.write(linea)
+            resultados[escala] = medidas
+        return resultados, encontradas
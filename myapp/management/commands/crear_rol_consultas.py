@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from myapp.esquema import MODELOS
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea en PostgreSQL el rol SQL_IA_ROL (sin login) con permiso de lectura solo sobre las tablas "
+        "de myapp que ve analitics, y lo concede al usuario de la aplicación para que ejecutar_consulta "
+        "pueda usarlo con SET LOCAL ROLE. Requiere un usuario con permiso para crear roles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rol", default=getattr(settings, "SQL_IA_ROL", ""))
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Solo PostgreSQL tiene roles; en SQLite la consulta corre con PRAGMA query_only.")
+        if not options["rol"]:
+            raise CommandError("Indicar --rol o definir SQL_IA_ROL.")
+        rol = connection.ops.quote_name(options["rol"])
+        tablas = ", ".join(connection.ops.quote_name(modelo._meta.db_table) for modelo in MODELOS)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_roles WHERE rolname = %s", [options["rol"]])
+            if not cursor.fetchone():
+                cursor.execute(f"CREATE ROLE {rol} NOLOGIN")
+            # Sin privilegios heredados de PUBLIC sobre el esquema más allá de usarlo
+            cursor.execute(f"REVOKE ALL ON ALL TABLES IN SCHEMA public FROM {rol}")
+            cursor.execute(f"GRANT USAGE ON SCHEMA public TO {rol}")
+            cursor.execute(f"GRANT SELECT ON {tablas} TO {rol}")
+            cursor.execute(f"GRANT {rol} TO CURRENT_USER")
+        self.stdout.write(f"Rol {options['rol']} con lectura sobre {len(MODELOS)} tablas.")
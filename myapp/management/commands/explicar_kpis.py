@@ -0,0 +1,111 @@
+import re
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from myapp import views
+from myapp.kpi_cache import ALIAS_CACHE
+
+
+# Además de las funciones de views.DATASETS_KPI (lo que piden las páginas KIP1-KIP6 a
+# api/kpi/), las vistas que consultan por su cuenta
+VISTAS_KPI = [
+    ("KIP2", views.KIP2, {}),
+    ("api_tests", views.api_tests, {"orden": "-fecha"}),
+    ("api_tests", views.api_tests, {"orden": "calificacion", "desde": "2024-01-01"}),
+    ("api_personas", views.api_personas, {"rol": "cliente"}),
+]
+
+# Recorridos completos de una tabla en el plan
+SEQ_SCAN_POSTGRES = re.compile(r"Seq Scan on (\w+)")
+SEQ_SCAN_SQLITE = re.compile(r"^SCAN (\w+)(.*)$")
+
+
+def consultas_de_vista(vista, parametros):
+    request = RequestFactory().get("/", parametros)
+    with CaptureQueriesContext(connection) as capturadas:
+        vista(request)
+    return [consulta["sql"] for consulta in capturadas.captured_queries]
+
+
+def consultas_de_funcion(funcion):
+    # Sin la caché de KPIs: se ejecutan las consultas aunque el resultado esté guardado
+    with CaptureQueriesContext(connection) as capturadas:
+        getattr(funcion, "sin_cache", funcion)()
+    return [consulta["sql"] for consulta in capturadas.captured_queries]
+
+
+def explicar(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [fila[-1] for fila in cursor.fetchall()]
+        cursor.execute("EXPLAIN " + sql)
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def tablas_recorridas(plan):
+    tablas = []
+    for linea in plan:
+        if connection.vendor == "sqlite":
+            coincidencia = SEQ_SCAN_SQLITE.match(linea.strip())
+            # "SCAN tabla USING [COVERING] INDEX" recorre un índice, no la tabla
+            if coincidencia and "USING" not in coincidencia.group(2):
+                tablas.append(coincidencia.group(1))
+        else:
+            tablas.extend(SEQ_SCAN_POSTGRES.findall(linea))
+    return tablas
+
+
+def filas_estimadas(tabla):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [tabla])
+            fila = cursor.fetchone()
+            return max(fila[0], 0) if fila else 0
+        cursor.execute("SELECT COUNT(*) FROM {}".format(connection.ops.quote_name(tabla)))
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = "Ejecuta EXPLAIN sobre las consultas de los KPIs y marca los recorridos secuenciales."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-filas", type=int, default=1000,
+            help="Solo se marcan recorridos de tablas con al menos estas filas (las tablas chicas se leen enteras).",
+        )
+        parser.add_argument("--plan", action="store_true", help="Muestra el plan completo de cada consulta.")
+
+    def handle(self, *args, **options):
+        caches[ALIAS_CACHE].clear()
+        vistas = [(nombre, consultas_de_funcion(funcion)) for nombre, funcion in views.DATASETS_KPI.items()]
+        vistas += [(nombre, consultas_de_vista(vista, parametros)) for nombre, vista, parametros in VISTAS_KPI]
+
+        revisadas = set()
+        marcadas = 0
+        tamanos = {}
+        for nombre, consultas in vistas:
+            for sql in consultas:
+                if sql in revisadas or not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                revisadas.add(sql)
+                plan = explicar(sql)
+                recorridas = []
+                for tabla in tablas_recorridas(plan):
+                    if tabla not in tamanos:
+                        tamanos[tabla] = filas_estimadas(tabla)
+                    if tamanos[tabla] >= options["min_filas"]:
+                        recorridas.append(tabla)
+
+                estado = self.style.WARNING("SEQ SCAN " + ", ".join(recorridas)) if recorridas else self.style.SUCCESS("ok")
+                self.stdout.write(f"[{nombre}] {estado}: {sql[:150]}")
+                if options["plan"] or recorridas:
+                    for linea in plan:
+                        self.stdout.write(f"    {linea}")
+                marcadas += bool(recorridas)
+
+        self.stdout.write(f"{len(revisadas)} consultas revisadas, {marcadas} con recorridos secuenciales.")
@@ -0,0 +1,161 @@
+import csv
+import os
+import time
+from array import array
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from myapp.agregados import reconstruir_agregados
+from myapp.datos_sinteticos import (
+    COLUMNAS_CSV_PERSONAS,
+    COLUMNAS_CSV_TESTS,
+    Generador,
+    asegurar_categorias,
+    fila_csv_persona,
+    fila_csv_test,
+    guardar_personas,
+    guardar_tests,
+)
+from myapp.models import Persona
+from myapp.versiones import incrementar_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera personas, tests y resultados sintéticos reproducibles (misma semilla, mismos datos) "
+        "y los guarda en la base de datos o en CSV con el formato de carga."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--personas", type=int, default=100_000,
+                            help="Personas nuevas; con 0 los tests usan las personas existentes.")
+        parser.add_argument("--tests", type=int, default=1_000_000,
+                            help="Tests nuevos, cada uno con su resultado (con --csv la carga genera los resultados).")
+        parser.add_argument("--semilla", type=int, default=0)
+        parser.add_argument("--desde", type=date.fromisoformat,
+                            help="Primer día de los tests (AAAA-MM-DD); por defecto, el que hace que "
+                                 "terminen hoy (los KPIs semanales y mensuales miran hacia atrás desde hoy).")
+        parser.add_argument("--dias", type=int, default=730, help="Días que abarcan los tests.")
+        parser.add_argument("--proporcion-personal", type=float, default=0.02)
+        parser.add_argument("--csv", metavar="DIRECTORIO",
+                            help="Escribe personas.csv y tests.csv en lugar de guardar en la base de datos.")
+        parser.add_argument("--primer-id", type=int,
+                            help="Con --csv: ID que tendrá la primera persona al cargar personas.csv "
+                                 "(por defecto, el próximo que asignará la base de datos).")
+        parser.add_argument("--sin-agregados", action="store_true",
+                            help="No recalcula ResumenTest/ResumenCalificacion al terminar.")
+
+    def handle(self, *args, **options):
+        if not 0 < options["proporcion_personal"] <= 0.5:
+            raise CommandError("--proporcion-personal debe estar entre 0 y 0.5.")
+        if options["dias"] < 1 or options["personas"] < 0 or options["tests"] < 0:
+            raise CommandError("--dias debe ser positivo y las cantidades no negativas.")
+        if 0 < options["personas"] < 2:
+            raise CommandError("Se necesitan al menos 2 personas (un cliente y un personal).")
+
+        desde = options["desde"] or date.today() - timedelta(days=options["dias"] - 1)
+        generador = Generador(
+            semilla=options["semilla"],
+            desde=desde,
+            dias=options["dias"],
+            proporcion_personal=options["proporcion_personal"],
+        )
+        # Las categorías se crean también con --csv: el CSV de tests las referencia por ID
+        categorias = asegurar_categorias()
+
+        if options["csv"]:
+            self.a_csv(generador, categorias, options)
+        else:
+            self.a_base_de_datos(generador, categorias, options)
+
+    def a_base_de_datos(self, generador, categorias, options):
+        clientes, personal = array("q"), array("q")
+        inicio = time.monotonic()
+        for bloque in generador.personas(options["personas"]):
+            with transaction.atomic():
+                pks = guardar_personas(bloque)
+            for datos, pk in zip(bloque, pks):
+                (personal if datos["rol"] == "personal" else clientes).append(pk)
+        self.informar("personas", options["personas"], inicio)
+
+        if not options["personas"] and options["tests"]:
+            clientes, personal = self.personas_existentes()
+        inicio = time.monotonic()
+        for tests, resultados in generador.tests(options["tests"], clientes, personal, categorias):
+            with transaction.atomic():
+                guardar_tests(tests, resultados)
+        self.informar("tests", options["tests"], inicio)
+
+        if options["sin_agregados"]:
+            incrementar_version()
+        else:
+            inicio = time.monotonic()
+            filas = reconstruir_agregados()
+            self.stdout.write(f"Agregados: {filas} filas en {time.monotonic() - inicio:.1f}s.")
+
+    def a_csv(self, generador, categorias, options):
+        os.makedirs(options["csv"], exist_ok=True)
+        primer_id = options["primer_id"]
+        if primer_id is None:
+            primer_id = self.siguiente_id_persona()
+
+        clientes, personal = array("q"), array("q")
+        inicio = time.monotonic()
+        with open(os.path.join(options["csv"], "personas.csv"), "w", newline="", encoding="utf-8") as archivo:
+            writer = csv.writer(archivo)
+            writer.writerow(COLUMNAS_CSV_PERSONAS)
+            pk = primer_id
+            for bloque in generador.personas(options["personas"]):
+                writer.writerows(fila_csv_persona(datos) for datos in bloque)
+                for datos in bloque:
+                    (personal if datos["rol"] == "personal" else clientes).append(pk)
+                    pk += 1
+        self.informar("personas", options["personas"], inicio)
+
+        if not options["personas"] and options["tests"]:
+            clientes, personal = self.personas_existentes()
+        inicio = time.monotonic()
+        with open(os.path.join(options["csv"], "tests.csv"), "w", newline="", encoding="utf-8") as archivo:
+            writer = csv.writer(archivo)
+            writer.writerow(COLUMNAS_CSV_TESTS)
+            for tests, _ in generador.tests(options["tests"], clientes, personal, categorias):
+                writer.writerows(fila_csv_test(datos) for datos in tests)
+        self.informar("tests", options["tests"], inicio)
+        self.stdout.write(
+            f"Cargar primero personas.csv (IDs desde {primer_id}) y después tests.csv, "
+            "sin otras personas creadas en medio."
+        )
+
+    def siguiente_id_persona(self):
+        # ID que recibirá la próxima persona insertada. No es MAX(id) + 1: la secuencia de
+        # PostgreSQL tiene huecos (rollbacks, reservar_pks) y SQLite no reutiliza IDs borrados
+        tabla, columna = Persona._meta.db_table, Persona._meta.pk.column
+        maximo = Persona.objects.aggregate(maximo=Max("id"))["maximo"] or 0
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [tabla, columna])
+                secuencia = cursor.fetchone()[0]
+                if secuencia:
+                    cursor.execute(f"SELECT last_value, is_called FROM {secuencia}")
+                    ultimo, usado = cursor.fetchone()
+                    return ultimo + 1 if usado else ultimo
+            elif connection.vendor == "sqlite":
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [tabla])
+                fila = cursor.fetchone()
+                return max(maximo, fila[0] if fila else 0) + 1
+        return maximo + 1
+
+    def personas_existentes(self):
+        clientes = array("q", Persona.objects.filter(rol="cliente").order_by("id").values_list("id", flat=True))
+        personal = array("q", Persona.objects.filter(rol="personal").order_by("id").values_list("id", flat=True))
+        if not clientes or not personal:
+            raise CommandError("Con --personas 0 la base de datos debe tener clientes y personal.")
+        return clientes, personal
+
+    def informar(self, tabla, filas, inicio):
+        segundos = time.monotonic() - inicio
+        por_segundo = filas / segundos if segundos > 0 else float(filas)
+        self.stdout.write(f"{tabla}: {filas} filas en {segundos:.1f}s ({por_segundo:.0f} filas/s)")
@@ -0,0 +1,62 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from myapp.importaciones import (
+    nombre_worker,
+    procesar_importacion,
+    reclamar_siguiente,
+    reencolar_abandonadas,
+    reintentar_importacion,
+)
+
+
+class Command(BaseCommand):
+    help = "Procesa en segundo plano las importaciones CSV pendientes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrencia", type=int, default=2, help="Cantidad de trabajos procesados a la vez.")
+        parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos de espera cuando no hay trabajos.")
+        parser.add_argument("--timeout-latido", type=int, default=300, help="Segundos sin latido para considerar un trabajo abandonado.")
+        parser.add_argument("--max-intentos", type=int, default=3)
+        parser.add_argument("--una-vez", action="store_true", help="Termina cuando no quedan trabajos pendientes.")
+        parser.add_argument("--reintentar", type=int, nargs="*", default=[], help="IDs de importaciones con error a reencolar.")
+
+    def handle(self, *args, **options):
+        for pk in options["reintentar"]:
+            if reintentar_importacion(pk):
+                self.stdout.write(f"Importación {pk} reencolada.")
+
+        detener = threading.Event()
+        hilos = [
+            threading.Thread(target=self.bucle, args=(detener, options), daemon=True)
+            for _ in range(max(options["concurrencia"], 1))
+        ]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            for hilo in hilos:
+                while hilo.is_alive():
+                    hilo.join(timeout=1)
+        except KeyboardInterrupt:
+            detener.set()
+            for hilo in hilos:
+                hilo.join()
+
+    def bucle(self, detener, options):
+        worker = nombre_worker()
+        try:
+            while not detener.is_set():
+                close_old_connections()
+                reencolar_abandonadas(options["timeout_latido"], options["max_intentos"])
+                importacion = reclamar_siguiente(worker)
+                if importacion is not None:
+                    self.stdout.write(f"{worker}: procesando importación {importacion.pk}")
+                    procesar_importacion(importacion)
+                elif options["una_vez"]:
+                    break
+                else:
+                    detener.wait(options["intervalo"])
+        finally:
+            connection.close()
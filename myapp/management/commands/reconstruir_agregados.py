@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.agregados import reconstruir_agregados
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero las tablas de agregados de los KPIs (ResumenTest y ResumenCalificacion)."
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        filas = reconstruir_agregados()
+        self.stdout.write(f"Agregados reconstruidos: {filas} filas en {time.monotonic() - inicio:.2f}s.")
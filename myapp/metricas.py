@@ -0,0 +1,196 @@
+"""
+Métricas por vista en formato Prometheus (/metrics).
+
+MetricasMiddleware (middleware.py) mide cada solicitud: latencia, código y
+tamaño de la respuesta. En las solicitudes muestreadas (METRICAS_MUESTREO)
+además junta, a través de un execute_wrapper instalado en cada conexión,
+la cantidad de consultas, el tiempo en la base de datos y la consulta más
+lenta, y el tiempo de render de plantillas. Una misma consulta (igual SQL,
+distintos parámetros) repetida METRICAS_N_MAS_1 veces o más en una
+solicitud se marca como posible N+1.
+
+El registro vive en memoria de cada proceso: con varios workers cada uno
+expone sus propios valores.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+CUBETAS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CUBETAS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+CUBETAS_BYTES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+HISTOGRAMAS = {
+    "django_solicitud_segundos": ("Latencia de la solicitud por vista", CUBETAS_SEGUNDOS),
+    "django_bd_segundos": ("Tiempo en la base de datos por solicitud (muestreado)", CUBETAS_SEGUNDOS),
+    "django_consultas": ("Consultas SQL por solicitud (muestreado)", CUBETAS_CONSULTAS),
+    "django_plantilla_segundos": ("Tiempo de render de plantillas por solicitud (muestreado)", CUBETAS_SEGUNDOS),
+    "django_respuesta_bytes": ("Tamaño del cuerpo de la respuesta", CUBETAS_BYTES),
+    "kpi_calculo_segundos": ("Tiempo de cálculo de cada función de KPI (fallos del caché)", CUBETAS_SEGUNDOS),
+}
+CONTADORES = {
+    "django_solicitudes_total": "Solicitudes por vista y código de estado",
+    "django_n_mas_1_total": "Solicitudes con una consulta repetida METRICAS_N_MAS_1 veces o más",
+}
+
+_histogramas = defaultdict(lambda: None)
+_contadores = Counter()
+# Consulta más lenta vista en cada vista: {vista: (segundos, sql)}
+_mas_lentas = {}
+_lock = threading.Lock()
+
+_solicitud = contextvars.ContextVar("metricas_solicitud", default=None)
+
+
+class Medicion:
+    # Datos de una solicitud muestreada; los hilos de la solicitud comparten el objeto
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.mas_lenta = (0.0, "")
+        self.repeticiones = Counter()
+        self.tiempo_plantillas = 0.0
+        self.lock = threading.Lock()
+
+
+def observar(nombre, valor, **etiquetas):
+    cubetas = HISTOGRAMAS[nombre][1]
+    clave = (nombre, tuple(sorted(etiquetas.items())))
+    with _lock:
+        histograma = _histogramas[clave]
+        if histograma is None:
+            # conteos por cubeta (+Inf al final), suma, cantidad
+            histograma = _histogramas[clave] = [[0] * (len(cubetas) + 1), 0.0, 0]
+        histograma[0][bisect.bisect_left(cubetas, valor)] += 1
+        histograma[1] += valor
+        histograma[2] += 1
+
+
+def incrementar(nombre, **etiquetas):
+    with _lock:
+        _contadores[(nombre, tuple(sorted(etiquetas.items())))] += 1
+
+
+def medir_consulta(execute, sql, params, many, context):
+    # execute_wrapper de todas las conexiones; sin medición activa solo delega
+    medicion = _solicitud.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        with medicion.lock:
+            medicion.consultas += 1
+            medicion.tiempo_bd += duracion
+            medicion.repeticiones[sql] += 1
+            if duracion > medicion.mas_lenta[0]:
+                medicion.mas_lenta = (duracion, sql)
+
+
+def instalar_en_conexion(sender, connection, **kwargs):
+    # connection_created: cada conexión (de cualquier hilo) pasa por medir_consulta
+    if medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consulta)
+
+
+def instrumentar_plantillas():
+    # Se envuelve el render de nivel superior del backend de Django (no los {% include %})
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, "medido", False):
+        return
+    render_original = Template.render
+
+    def render(self, context=None, request=None):
+        medicion = _solicitud.get()
+        if medicion is None:
+            return render_original(self, context, request)
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context, request)
+        finally:
+            with medicion.lock:
+                medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+    render.medido = True
+    Template.render = render
+
+
+def iniciar_medicion(muestreada):
+    return _solicitud.set(Medicion() if muestreada else None)
+
+
+def terminar_medicion(token, vista):
+    medicion = _solicitud.get()
+    _solicitud.reset(token)
+    if medicion is None:
+        return
+    observar("django_bd_segundos", medicion.tiempo_bd, vista=vista)
+    observar("django_consultas", medicion.consultas, vista=vista)
+    observar("django_plantilla_segundos", medicion.tiempo_plantillas, vista=vista)
+    with _lock:
+        if medicion.mas_lenta[0] > _mas_lentas.get(vista, (0.0, ""))[0]:
+            _mas_lentas[vista] = medicion.mas_lenta
+
+    umbral = getattr(settings, "METRICAS_N_MAS_1", 10)
+    if medicion.repeticiones:
+        sql, veces = medicion.repeticiones.most_common(1)[0]
+        if veces >= umbral:
+            incrementar("django_n_mas_1_total", vista=vista)
+            logger.warning("Posible N+1 en %s: %d ejecuciones de %s", vista, veces, sql[:200])
+
+
+def _etiquetas(pares, extra=()):
+    pares = list(pares) + list(extra)
+    if not pares:
+        return ""
+    texto = ",".join(f'{clave}="{str(valor).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for clave, valor in pares)
+    return "{" + texto + "}"
+
+
+def exposicion():
+    # Texto en formato de exposición de Prometheus 0.0.4
+    with _lock:
+        histogramas = {clave: (list(h[0]), h[1], h[2]) for clave, h in _histogramas.items() if h is not None}
+        contadores = dict(_contadores)
+        mas_lentas = dict(_mas_lentas)
+
+    lineas = []
+    for nombre, (ayuda, cubetas) in HISTOGRAMAS.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for (metrica, etiquetas), (conteos, suma, cantidad) in sorted(histogramas.items()):
+            if metrica != nombre:
+                continue
+            acumulado = 0
+            for limite, conteo in zip(list(cubetas) + ["+Inf"], conteos):
+                acumulado += conteo
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, [('le', limite)])} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {suma}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {cantidad}")
+    for nombre, ayuda in CONTADORES.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+        for (metrica, etiquetas), valor in sorted(contadores.items()):
+            if metrica == nombre:
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+    nombre = "django_consulta_mas_lenta_segundos"
+    lineas += [f"# HELP {nombre} Consulta más lenta observada por vista (el SQL está en metricas/vistas/)",
+               f"# TYPE {nombre} gauge"]
+    for vista, (segundos, _) in sorted(mas_lentas.items()):
+        lineas.append(f"{nombre}{_etiquetas([('vista', vista)])} {segundos}")
+    return "\n".join(lineas) + "\n"
+
+
+def consultas_mas_lentas():
+    with _lock:
+        return {vista: {"segundos": round(segundos, 6), "sql": sql} for vista, (segundos, sql) in _mas_lentas.items()}
@@ -0,0 +1,89 @@
+"""
+Middleware de la aplicación.
+
+LecturaPrimariaMiddleware: si el navegador tiene la cookie de
+routers.pegar_a_primaria(), las lecturas de la solicitud no usan la réplica.
+Funciona en vistas síncronas y async sin cambiar de hilo.
+
+MetricasMiddleware: latencia, código y tamaño de cada respuesta por vista y,
+en una fracción METRICAS_MUESTREO de las solicitudes, consultas, tiempo de
+base de datos y de plantillas (ver metricas.py). Va primero en MIDDLEWARE
+para medir también al resto de los middleware.
+"""
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metricas
+from .routers import pegado_a_primaria, primaria_forzada
+
+
+class LecturaPrimariaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        with primaria_forzada(pegado_a_primaria(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with primaria_forzada(pegado_a_primaria(request)):
+            return await self.get_response(request)
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        inicio, token = self.iniciar()
+        try:
+            response = self.get_response(request)
+        finally:
+            vista = self.vista(request)
+            metricas.terminar_medicion(token, vista)
+        self.registrar(vista, response, inicio)
+        return response
+
+    async def __acall__(self, request):
+        inicio, token = self.iniciar()
+        try:
+            response = await self.get_response(request)
+        finally:
+            vista = self.vista(request)
+            metricas.terminar_medicion(token, vista)
+        self.registrar(vista, response, inicio)
+        return response
+
+    def iniciar(self):
+        muestreada = random.random() < getattr(settings, "METRICAS_MUESTREO", 0.1)
+        return time.perf_counter(), metricas.iniciar_medicion(muestreada)
+
+    def vista(self, request):
+        # Nombre de la ruta y no la URL: las etiquetas de Prometheus deben ser pocas
+        match = getattr(request, "resolver_match", None)
+        return (match.view_name or match._func_path) if match else "sin_ruta"
+
+    def registrar(self, vista, response, inicio):
+        metricas.observar("django_solicitud_segundos", time.perf_counter() - inicio, vista=vista)
+        metricas.incrementar("django_solicitudes_total", vista=vista, codigo=response.status_code)
+        if not response.streaming:
+            metricas.observar("django_respuesta_bytes", len(response.content), vista=vista)
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacionCSV',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('personas', 'Personas'), ('tests', 'Tests')], max_length=20)),
+                ('archivo', models.FileField(upload_to='importaciones/')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('filas_totales', models.BigIntegerField(blank=True, null=True)),
+                ('filas_procesadas', models.BigIntegerField(default=0)),
+                ('filas_por_segundo', models.FloatField(blank=True, null=True)),
+                ('intentos', models.IntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('latido', models.DateTimeField(blank=True, null=True)),
+                ('finalizado', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
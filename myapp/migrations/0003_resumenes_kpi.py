@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def llenar_agregados(apps, schema_editor):
+    from myapp.agregados import reconstruir_agregados
+
+    reconstruir_agregados(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_importacioncsv'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCalificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calificacion', models.IntegerField()),
+                ('cliente_sexo', models.CharField(default='', max_length=10)),
+                ('cantidad', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('calificacion', 'cliente_sexo'), name='resumen_calificacion_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenTest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('nombre', models.CharField(max_length=100)),
+                ('cliente_sexo', models.CharField(default='', max_length=10)),
+                ('rango_edad', models.CharField(default='', max_length=10)),
+                ('cantidad', models.BigIntegerField(default=0)),
+                ('suma_calificacion', models.BigIntegerField(default=0)),
+                ('suma_dias_espera', models.BigIntegerField(default=0)),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.categoria')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dia', 'nombre', 'categoria', 'cliente_sexo', 'rango_edad'), name='resumen_test_unico')],
+            },
+        ),
+        migrations.RunPython(llenar_agregados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_versiondatos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='importacioncsv',
+            index=models.Index(fields=['estado', 'creado'], name='importacion_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(condition=models.Q(('rol', 'personal')), fields=['nombre', 'apellidos'], name='persona_personal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(condition=models.Q(('rol', 'cliente')), fields=['id', 'sexo', 'fnac'], name='persona_cliente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(fields=['rol', 'sexo'], name='persona_rol_sexo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['fecha', 'nombre'], name='test_fecha_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['cliente', 'calificacion'], name='test_cliente_calif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['personal', 'calificacion'], include=('fecha', 'fecha_entrega'), name='test_personal_calif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['calificacion', 'id'], name='test_calif_id_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_indices_kpi'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(fields=['nombre', 'id'], name='persona_nombre_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(fields=['apellidos', 'id'], name='persona_apellidos_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['fecha_entrega', 'id'], name='test_entrega_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['nombre', 'id'], name='test_nombre_id_idx'),
+        ),
+    ]
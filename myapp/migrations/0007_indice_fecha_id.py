@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_indices_listados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(fields=['fecha', 'id'], name='test_fecha_id_idx'),
+        ),
+    ]
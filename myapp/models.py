@@ -38,6 +38,18 @@ class Persona(models.Model):
     rol = models.CharField(max_length=50, blank=True, null=True)
     especialidad = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # KIP2: Persona.objects.filter(rol='personal') (pocas filas de muchas)
+            models.Index(fields=["nombre", "apellidos"], condition=models.Q(rol="personal"), name="persona_personal_idx"),
+            # KPIs de clientes por sexo y edad (rol='cliente')
+            models.Index(fields=["id", "sexo", "fnac"], condition=models.Q(rol="cliente"), name="persona_cliente_idx"),
+            models.Index(fields=["rol", "sexo"], name="persona_rol_sexo_idx"),
+            # Listado paginado por clave ordenado por nombre o apellidos
+            models.Index(fields=["nombre", "id"], name="persona_nombre_id_idx"),
+            models.Index(fields=["apellidos", "id"], name="persona_apellidos_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.nombre} {self.apellidos}"
     
@@ -54,6 +66,26 @@ class Test(models.Model):
     cliente = models.ForeignKey(Persona, on_delete=models.CASCADE, related_name="tests_como_cliente")
     personal = models.ForeignKey(Persona, on_delete=models.CASCADE, related_name="tests_como_personal")
 
+    class Meta:
+        indexes = [
+            # Rangos de fecha (semanal, mensual, listados) agrupados por nombre de prueba
+            models.Index(fields=["fecha", "nombre"], name="test_fecha_nombre_idx"),
+            # Satisfacción por cliente (sexo, edad) sin leer la tabla
+            models.Index(fields=["cliente", "calificacion"], name="test_cliente_calif_idx"),
+            # KIP2: cantidad, calificación y tiempo de entrega por personal (INCLUDE solo
+            # en PostgreSQL; en SQLite se ignora, ver SILENCED_SYSTEM_CHECKS)
+            models.Index(
+                fields=["personal", "calificacion"],
+                include=["fecha", "fecha_entrega"],
+                name="test_personal_calif_idx",
+            ),
+            # Listado paginado por clave: (campo de orden, id) para cada orden de api/tests/
+            # (-fecha por defecto, calificación, fecha de entrega, nombre)
+            models.Index(fields=["fecha", "id"], name="test_fecha_id_idx"),
+            models.Index(fields=["calificacion", "id"], name="test_calif_id_idx"),
+            models.Index(fields=["fecha_entrega", "id"], name="test_entrega_id_idx"),
+            models.Index(fields=["nombre", "id"], name="test_nombre_id_idx"),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -70,3 +102,91 @@ class Resultado(models.Model):
     def __str__(self):
         return f"Resultado de {self.test.nombre}"
     
+
+class ImportacionCSV(models.Model):
+    # Trabajo de carga de un CSV, procesado en segundo plano por el comando procesar_importaciones
+    TIPO_PERSONAS = "personas"
+    TIPO_TESTS = "tests"
+    TIPOS = [(TIPO_PERSONAS, "Personas"), (TIPO_TESTS, "Tests")]
+
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADO = "completado"
+    ERROR = "error"
+    ESTADOS = [(PENDIENTE, "Pendiente"), (EN_PROCESO, "En proceso"), (COMPLETADO, "Completado"), (ERROR, "Error")]
+
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    archivo = models.FileField(upload_to="importaciones/")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    filas_totales = models.BigIntegerField(blank=True, null=True)
+    # Filas ya guardadas; se actualiza en la misma transacción de cada lote
+    filas_procesadas = models.BigIntegerField(default=0)
+    filas_por_segundo = models.FloatField(blank=True, null=True)
+    intentos = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(blank=True, null=True)
+    latido = models.DateTimeField(blank=True, null=True)  # Última señal de vida del worker
+    finalizado = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Búsqueda de trabajos pendientes y abandonados por el worker
+            models.Index(fields=["estado", "creado"], name="importacion_estado_idx"),
+        ]
+
+    def progreso(self):
+        if self.estado == self.COMPLETADO:
+            return 100.0
+        if not self.filas_totales:
+            return 0.0
+        return round(min(self.filas_procesadas / self.filas_totales, 1) * 100, 1)
+
+    def __str__(self):
+        return f"Importación {self.pk} ({self.tipo}, {self.estado})"
+
+class ResumenTest(models.Model):
+    # Agregados de Test por día, nombre, categoría, sexo y rango de edad del cliente.
+    # Se actualizan en cada carga CSV (ver myapp/agregados.py) y los leen los KPIs.
+    dia = models.DateField()
+    nombre = models.CharField(max_length=100)
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE)
+    cliente_sexo = models.CharField(max_length=10, default="")  # "" si no se conoce
+    rango_edad = models.CharField(max_length=10, default="")  # Edad del cliente a la fecha del test
+    cantidad = models.BigIntegerField(default=0)
+    suma_calificacion = models.BigIntegerField(default=0)
+    suma_dias_espera = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dia", "nombre", "categoria", "cliente_sexo", "rango_edad"],
+                name="resumen_test_unico",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.nombre}: {self.cantidad}"
+
+class ResumenCalificacion(models.Model):
+    # Histograma de calificaciones por sexo del cliente
+    calificacion = models.IntegerField()
+    cliente_sexo = models.CharField(max_length=10, default="")
+    cantidad = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["calificacion", "cliente_sexo"], name="resumen_calificacion_unico")
+        ]
+
+    def __str__(self):
+        return f"{self.calificacion} ({self.cliente_sexo}): {self.cantidad}"
+
+class VersionDatos(models.Model):
+    # Fila única cuyo contador aumenta con cada carga de datos; invalida los cachés de KPIs
+    version = models.BigIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Versión de datos {self.version}"
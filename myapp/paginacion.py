@@ -0,0 +1,122 @@
+"""
+Listados JSON con paginación por clave (keyset / seek).
+
+En lugar de OFFSET, cada página continúa desde la última fila de la anterior:
+el cursor guarda el valor del campo de orden y la PK de esa fila, y la
+siguiente consulta filtra con (campo, pk) > (valor, pk). El costo de cada
+página no depende de qué tan lejos esté del inicio.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import JsonResponse
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(valores):
+    texto = json.dumps(valores, default=str)
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ParametroInvalido("Cursor inválido.")
+
+
+class ListadoKeyset:
+    # campos: columnas devueltas; ordenes: campos por los que se puede ordenar
+    # (no nulos); filtros: {parámetro GET: lookup del ORM}
+    def __init__(self, queryset, campos, ordenes, filtros, orden_por_defecto="pk",
+                 limite_por_defecto=50, limite_maximo=500):
+        self.queryset = queryset
+        self.campos = campos
+        self.ordenes = ordenes
+        self.filtros = filtros
+        self.orden_por_defecto = orden_por_defecto
+        self.limite_por_defecto = limite_por_defecto
+        self.limite_maximo = limite_maximo
+
+    def _orden(self, parametros):
+        orden = parametros.get("orden", self.orden_por_defecto)
+        campo = orden.lstrip("-")
+        if campo not in self.ordenes:
+            raise ParametroInvalido(f"No se puede ordenar por '{campo}'.")
+        return campo, orden.startswith("-")
+
+    def _limite(self, parametros):
+        try:
+            limite = int(parametros.get("limite", self.limite_por_defecto))
+        except ValueError:
+            raise ParametroInvalido("El límite debe ser un número.")
+        return max(1, min(limite, self.limite_maximo))
+
+    def _filtrar(self, queryset, parametros):
+        modelo = queryset.model
+        for parametro, lookup in self.filtros.items():
+            valor = parametros.get(parametro)
+            if valor in (None, ""):
+                continue
+            campo = modelo._meta.get_field(lookup.split("__")[0])
+            try:
+                if not lookup.endswith(("__icontains", "__istartswith")):
+                    valor = campo.to_python(valor)
+            except Exception:
+                raise ParametroInvalido(f"Valor inválido para '{parametro}'.")
+            queryset = queryset.filter(**{lookup: valor})
+        return queryset
+
+    def _leer_cursor(self, cursor, modelo, campo):
+        # [valor del campo de orden, pk], ambos convertidos al tipo de su columna
+        valores = decodificar_cursor(cursor)
+        if not isinstance(valores, list) or len(valores) != 2:
+            raise ParametroInvalido("Cursor inválido.")
+        valor, pk = valores
+        try:
+            valor = (modelo._meta.pk if campo == "pk" else modelo._meta.get_field(campo)).to_python(valor)
+            if isinstance(pk, bool) or not isinstance(pk, (int, str)):
+                raise TypeError
+            pk = int(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise ParametroInvalido("Cursor inválido.")
+        if valor is None:
+            raise ParametroInvalido("Cursor inválido.")
+        return valor, pk
+
+    def pagina(self, parametros):
+        campo, descendente = self._orden(parametros)
+        limite = self._limite(parametros)
+        queryset = self._filtrar(self.queryset, parametros)
+
+        cursor = parametros.get("cursor")
+        if cursor:
+            valor, pk = self._leer_cursor(cursor, queryset.model, campo)
+            comparacion = "lt" if descendente else "gt"
+            # (campo, pk) > (valor, pk); el primer filtro acota el rango que se lee del índice
+            queryset = queryset.filter(**{f"{campo}__{comparacion}e": valor}).filter(
+                Q(**{f"{campo}__{comparacion}": valor}) | Q(**{f"pk__{comparacion}": pk})
+            )
+
+        signo = "-" if descendente else ""
+        filas = list(
+            queryset.order_by(f"{signo}{campo}", f"{signo}pk")
+            .values("pk", *self.campos)[:limite + 1]
+        )
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            ultima = filas[-1]
+            siguiente = codificar_cursor([ultima[campo], ultima["pk"]])
+        return {"resultados": filas, "siguiente": siguiente, "limite": limite}
+
+    def responder(self, request):
+        try:
+            return JsonResponse(self.pagina(request.GET))
+        except ParametroInvalido as e:
+            return JsonResponse({"error": str(e)}, status=400)
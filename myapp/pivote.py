@@ -0,0 +1,44 @@
+"""
+Tablas cruzadas (pivot) para los gráficos de KPIs.
+
+pivotar() recibe filas ya agrupadas en SQL (por ejemplo .values('nombre',
+'rango').annotate(cantidad=...)) y arma una matriz densa: los índices de
+filas y columnas se calculan una sola vez y cada fila del queryset se ubica
+en su celda con dos búsquedas en diccionario.
+"""
+
+
+def _indices(etiquetas):
+    return {etiqueta: posicion for posicion, etiqueta in enumerate(etiquetas)}
+
+
+def pivotar(filas, campo_fila, campo_columna, campo_valor="cantidad", etiquetas_filas=None, etiquetas_columnas=None):
+    """
+    Devuelve (etiquetas_filas, etiquetas_columnas, matriz) con
+    matriz[i][j] = suma de campo_valor para (fila i, columna j).
+    Si no se pasan las etiquetas se toman de los datos, ordenadas; si se
+    pasan, las filas con otros valores se descartan.
+    """
+    filas = list(filas)  # el queryset se evalúa una sola vez
+    if etiquetas_filas is None:
+        etiquetas_filas = sorted({fila[campo_fila] for fila in filas})
+    if etiquetas_columnas is None:
+        etiquetas_columnas = sorted({fila[campo_columna] for fila in filas})
+    indice_filas = _indices(etiquetas_filas)
+    indice_columnas = _indices(etiquetas_columnas)
+
+    matriz = [[0] * len(etiquetas_columnas) for _ in etiquetas_filas]
+    for fila in filas:
+        i = indice_filas.get(fila[campo_fila])
+        j = indice_columnas.get(fila[campo_columna])
+        if i is not None and j is not None:
+            matriz[i][j] += fila[campo_valor] or 0
+    return etiquetas_filas, etiquetas_columnas, matriz
+
+
+def datasets_chartjs(etiquetas_filas, etiquetas_columnas, matriz):
+    # Formato {'labels', 'datasets'} de Chart.js: una serie por fila de la matriz
+    return {
+        'labels': list(etiquetas_columnas),
+        'datasets': [{'label': etiqueta, 'data': datos} for etiqueta, datos in zip(etiquetas_filas, matriz)],
+    }
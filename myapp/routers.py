@@ -0,0 +1,148 @@
+"""
+Router de base de datos con réplica de lectura.
+
+Solo las lecturas hechas dentro de lectura_replica() (KPIs con caché,
+agregaciones, listados y las consultas de analitics) pueden ir al alias
+REPLICA_ALIAS; el resto, y toda escritura, va a 'default'. Antes de usar la
+réplica se comprueba, con memo de REPLICA_CHEQUEO_SEGUNDOS, que ya tenga la
+última versión de datos de la primaria (una carga CSV recién terminada no
+se lee a medias) y, en PostgreSQL, que el retraso de replicación no supere
+REPLICA_LAG_MAXIMO. Si la réplica no está configurada, está atrasada o no
+responde, se lee de la primaria.
+
+Quien acaba de subir un CSV queda pegado a la primaria durante
+REPLICA_PEGADO_SEGUNDOS (cookie firmada, ver middleware.py) para leer sus
+propias escrituras.
+"""
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# Modelos de myapp que se leen siempre de la primaria: usuarios y los que coordinan
+# cachés e importaciones (las demás apps, como sesiones y auth, tampoco usan la réplica)
+MODELOS_PRIMARIA = {"myapp.customuser", "myapp.versiondatos", "myapp.importacioncsv"}
+
+COOKIE_PRIMARIA = "leer_primaria"
+
+_en_replica = contextvars.ContextVar("en_replica", default=False)
+_primaria_forzada = contextvars.ContextVar("primaria_forzada", default=False)
+
+_estado = {"disponible": False, "comprobado": None}
+_lock = threading.Lock()
+
+
+def alias_replica():
+    return getattr(settings, "REPLICA_ALIAS", "replica")
+
+
+def _retraso_postgres(conexion):
+    # Segundos de retraso de la réplica; 0 si ya aplicó todo lo recibido o si no es réplica
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() "
+            "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        return cursor.fetchone()[0] or 0
+
+
+def _comprobar_replica(alias):
+    from .models import VersionDatos
+    from .versiones import PK_VERSION, version_datos
+
+    conexion = connections[alias]
+    try:
+        if conexion.vendor == "postgresql":
+            retraso = _retraso_postgres(conexion)
+            if retraso > getattr(settings, "REPLICA_LAG_MAXIMO", 5.0):
+                logger.info("Réplica %s atrasada %.1f s, se lee de la primaria", alias, retraso)
+                return False
+        fila = VersionDatos.objects.using(alias).filter(pk=PK_VERSION).values_list("version", flat=True).first()
+    except DatabaseError as e:
+        logger.warning("Réplica %s no disponible: %s", alias, e)
+        return False
+    return (fila or 0) >= version_datos()
+
+
+def replica_disponible():
+    alias = alias_replica()
+    if alias not in settings.DATABASES:
+        return False
+    with _lock:
+        comprobado = _estado["comprobado"]
+        if comprobado is not None and time.monotonic() - comprobado < getattr(settings, "REPLICA_CHEQUEO_SEGUNDOS", 1.0):
+            return _estado["disponible"]
+    disponible = _comprobar_replica(alias)
+    with _lock:
+        _estado.update(disponible=disponible, comprobado=time.monotonic())
+    return disponible
+
+
+def alias_lectura():
+    # Alias desde el que leer ahora mismo (la réplica solo dentro de lectura_replica())
+    if _en_replica.get() and not _primaria_forzada.get() and replica_disponible():
+        return alias_replica()
+    return DEFAULT_DB_ALIAS
+
+
+@contextlib.contextmanager
+def lectura_replica():
+    # También sirve como decorador de funciones síncronas (vistas, funciones de KPIs)
+    token = _en_replica.set(True)
+    try:
+        yield
+    finally:
+        _en_replica.reset(token)
+
+
+@contextlib.contextmanager
+def primaria_forzada(forzar=True):
+    token = _primaria_forzada.set(forzar)
+    try:
+        yield
+    finally:
+        _primaria_forzada.reset(token)
+
+
+def pegar_a_primaria(response):
+    # Después de una escritura del usuario (carga CSV): leer de la primaria por un rato
+    segundos = int(getattr(settings, "REPLICA_PEGADO_SEGUNDOS", 30))
+    response.set_signed_cookie(COOKIE_PRIMARIA, "1", max_age=segundos, httponly=True, samesite="Lax")
+    return response
+
+
+def pegado_a_primaria(request):
+    segundos = getattr(settings, "REPLICA_PEGADO_SEGUNDOS", 30)
+    return request.get_signed_cookie(COOKIE_PRIMARIA, default=None, max_age=segundos) is not None
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != "myapp" or model._meta.label_lower in MODELOS_PRIMARIA:
+            return DEFAULT_DB_ALIAS
+        return alias_lectura()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica y primaria tienen los mismos datos
+        bases = {DEFAULT_DB_ALIAS, alias_replica()}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Una réplica física recibe el esquema por replicación; una base separada
+        # (DB_REPLICA_NAME) se migra como la primaria
+        if db == alias_replica() and getattr(settings, "REPLICA_FISICA", True):
+            return False
+        return None
@@ -0,0 +1,111 @@
+"""
+Series de tiempo densas para los gráficos de KPIs.
+
+agrupar() agrupa un queryset por periodo (día, semana, mes o año) en SQL y
+densificar() convierte esas filas en listas ya rellenas con ceros, una por
+serie, en una sola pasada: el índice de cada fila dentro de la lista se
+calcula con aritmética de fechas en lugar de buscarlo en un diccionario.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek, TruncYear
+
+
+TRUNCAR = {
+    "dia": TruncDay,
+    "semana": TruncWeek,
+    "mes": TruncMonth,
+    "anio": TruncYear,
+}
+
+
+def _como_fecha(valor):
+    # Acepta date o datetime
+    return valor.date() if hasattr(valor, "date") else valor
+
+
+def truncar(fecha, granularidad):
+    # Inicio del periodo que contiene 'fecha' (las semanas empiezan en lunes, como TruncWeek)
+    fecha = _como_fecha(fecha)
+    if granularidad == "dia":
+        return fecha
+    if granularidad == "semana":
+        return fecha - timedelta(days=fecha.weekday())
+    if granularidad == "mes":
+        return fecha.replace(day=1)
+    if granularidad == "anio":
+        return fecha.replace(month=1, day=1)
+    raise ValueError(f"Granularidad desconocida: {granularidad}")
+
+
+def _ordinal(fecha, granularidad):
+    # Número de periodo, consecutivo entre periodos vecinos
+    if granularidad == "dia":
+        return fecha.toordinal()
+    if granularidad == "semana":
+        return (fecha.toordinal() - 1) // 7  # el ordinal 1 (0001-01-01) es lunes
+    if granularidad == "mes":
+        return fecha.year * 12 + fecha.month - 1
+    return fecha.year
+
+
+def _desde_ordinal(numero, granularidad):
+    if granularidad == "dia":
+        return date.fromordinal(numero)
+    if granularidad == "semana":
+        return date.fromordinal(numero * 7 + 1)
+    if granularidad == "mes":
+        return date(numero // 12, numero % 12 + 1, 1)
+    return date(numero, 1, 1)
+
+
+def periodos(desde, hasta, granularidad="dia"):
+    # Inicios de los periodos entre 'desde' y 'hasta' (ambos incluidos)
+    inicio = _ordinal(truncar(desde, granularidad), granularidad)
+    fin = _ordinal(truncar(hasta, granularidad), granularidad)
+    return [_desde_ordinal(numero, granularidad) for numero in range(inicio, fin + 1)]
+
+
+def agrupar(queryset, campo_fecha, granularidad="dia", campo_serie=None, valor=None):
+    # Filas {'periodo', [campo_serie], 'valor'} agrupadas en la base de datos
+    campos = ["periodo"] + ([campo_serie] if campo_serie else [])
+    return (
+        queryset.annotate(periodo=TRUNCAR[granularidad](campo_fecha))
+        .values(*campos)
+        .annotate(valor=valor if valor is not None else Sum("cantidad"))
+        .order_by()
+    )
+
+
+def densificar(filas, desde, hasta, granularidad="dia", campo_fecha="periodo", campo_valor="valor",
+               campo_serie=None, series=None):
+    """
+    Devuelve (periodos, {serie: [valores]}) con un valor por periodo entre
+    'desde' y 'hasta'. Las filas fuera del rango se ignoran y las que caen en
+    el mismo periodo se suman. Sin 'campo_serie' hay una única serie, None.
+    Si no se pasan 'series', se toman de las filas (ordenadas).
+    """
+    etiquetas = periodos(desde, hasta, granularidad)
+    base = _ordinal(etiquetas[0], granularidad) if etiquetas else 0
+    cantidad = len(etiquetas)
+
+    valores = {serie: [0] * cantidad for serie in series} if series is not None else {}
+    fijas = series is not None
+    for fila in filas:
+        posicion = _ordinal(truncar(fila[campo_fecha], granularidad), granularidad) - base
+        if not 0 <= posicion < cantidad:
+            continue
+        serie = fila[campo_serie] if campo_serie else None
+        lista = valores.get(serie)
+        if lista is None:
+            if fijas:
+                continue
+            lista = valores[serie] = [0] * cantidad
+        lista[posicion] += fila[campo_valor] or 0
+
+    if not fijas:
+        valores = {serie: valores[serie] for serie in sorted(valores, key=lambda s: (s is None, s))}
+    if not campo_serie:
+        valores.setdefault(None, [0] * cantidad)
+    return etiquetas, valores
@@ -1,3 +1,611 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import importers, llm, routers, views
+from .agregaciones import Agregador
+from .agregados import reconstruir_agregados
+from .cache_consultas import ALIAS_CACHE as ALIAS_CACHE_CONSULTAS
+from .datos_sinteticos import (
+    COLUMNAS_CSV_TESTS,
+    Generador,
+    asegurar_categorias,
+    fila_csv_test,
+    guardar_personas,
+    guardar_tests,
+)
+from .importaciones import (
+    encolar_importacion,
+    procesar_importacion,
+    reclamar_siguiente,
+    reencolar_abandonadas,
+    reintentar_importacion,
+)
+from .importers import cargar_tests_csv, opciones_resultado
+from .kpi_cache import ALIAS_CACHE
+from .models import (
+    CustomUser,
+    ImportacionCSV,
+    Persona,
+    Resultado,
+    ResumenCalificacion,
+    ResumenTest,
+    Test,
+    VersionDatos,
+)
+from .paginacion import ParametroInvalido, codificar_cursor
+from .series_tiempo import TRUNCAR, agrupar, densificar, periodos, truncar
+from .versiones import PK_VERSION, incrementar_version
+from .views import DATASETS_KPI
+
+
+def sembrar(tests=300, personas=60, dias=90):
+    # Datos sintéticos de los últimos 'dias' días (los KPIs semanales y mensuales miran hacia atrás desde hoy)
+    generador = Generador(semilla=1, desde=date.today() - timedelta(days=dias - 1), dias=dias, proporcion_personal=0.1)
+    categorias = asegurar_categorias()
+    clientes, personal = [], []
+    for bloque in generador.personas(personas):
+        for datos, pk in zip(bloque, guardar_personas(bloque)):
+            (personal if datos["rol"] == "personal" else clientes).append(pk)
+    for bloque_tests, resultados in generador.tests(tests, clientes, personal, categorias):
+        guardar_tests(bloque_tests, resultados)
+    reconstruir_agregados()
+
+
+# Los tests que no son del router leen siempre de 'default', aunque haya réplica configurada
+SIN_REPLICA = override_settings(REPLICA_ALIAS=None)
+
+
+# Sin memo de la versión de datos: cada llamada con caché la lee, así el conteo no depende del reloj
+@SIN_REPLICA
+@override_settings(VERSION_DATOS_MEMO=0)
+class ConsultasKpiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sembrar()
+
+    def setUp(self):
+        caches[ALIAS_CACHE].clear()
+
+    def test_cada_kpi_en_una_consulta(self):
+        for nombre, funcion in DATASETS_KPI.items():
+            with self.subTest(kpi=nombre), self.assertNumQueries(1):
+                funcion.sin_cache()
+
+    def test_kpi_en_cache_solo_lee_la_version(self):
+        for nombre, funcion in DATASETS_KPI.items():
+            with self.subTest(kpi=nombre):
+                # Versión de datos y la consulta del KPI; después, solo la versión
+                with self.assertNumQueries(2):
+                    primero = funcion()
+                with self.assertNumQueries(1):
+                    self.assertEqual(funcion(), primero)
+
+    def test_satisfaccion_histograma_con_calificaciones_de_los_datos(self):
+        resumen = DATASETS_KPI["satisfaccion"].sin_cache()
+        self.assertEqual(resumen["calificaciones_labels"], sorted(resumen["calificaciones_labels"]))
+        self.assertEqual(sum(resumen["calificaciones_totals"]), 300)
+        self.assertTrue(1 <= resumen["indice_satisfaccion"] <= 10)
+
+
+@SIN_REPLICA
+class ListadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(tests=120, personas=30)
+
+    def test_personas_sin_datos_de_contacto(self):
+        filas = self.client.get(reverse("api_personas")).json()["resultados"]
+        self.assertEqual(len(filas), 30)
+        self.assertEqual(set(filas[0]), {"pk", "nombre", "apellidos", "sexo", "rol"})
+
+    def recorrer(self, url, **parametros):
+        # Todas las páginas siguiendo 'siguiente'; devuelve las PKs en orden
+        pks, cursor = [], None
+        while True:
+            pagina = self.client.get(url, {**parametros, **({"cursor": cursor} if cursor else {})}).json()
+            pks += [fila["pk"] for fila in pagina["resultados"]]
+            cursor = pagina["siguiente"]
+            if not cursor:
+                return pks
+
+    def test_cursor_recorre_todo_sin_repetir(self):
+        url = reverse("api_tests")
+        for orden in ["-fecha", "calificacion", "-fecha_entrega", "nombre"]:
+            with self.subTest(orden=orden):
+                esperado = list(
+                    Test.objects.order_by(orden, f"{'-' if orden.startswith('-') else ''}pk").values_list("pk", flat=True)
+                )
+                self.assertEqual(self.recorrer(url, orden=orden, limite=7), esperado)
+        esperado = list(Test.objects.filter(estado="entregado").order_by("-fecha", "-pk").values_list("pk", flat=True))
+        self.assertTrue(esperado)
+        self.assertEqual(self.recorrer(url, estado="entregado", limite=5), esperado)
+
+    def test_cursor_invalido(self):
+        url = reverse("api_tests")
+        for cursor in [
+            "no es base64!",
+            codificar_cursor({"fecha": "2024-01-01"}),
+            codificar_cursor(["2024-01-01", 1, 2]),
+            codificar_cursor(["no es fecha", 1]),
+            codificar_cursor([None, 1]),
+            codificar_cursor(["2024-01-01", True]),
+            codificar_cursor(["2024-01-01", [1]]),
+            codificar_cursor(["2024-01-01", "uno"]),
+        ]:
+            with self.subTest(cursor=cursor):
+                respuesta = self.client.get(url, {"cursor": cursor})
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertEqual(respuesta.json(), {"error": "Cursor inválido."})
+
+
+@SIN_REPLICA
+class SeriesTiempoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(tests=200, personas=30, dias=400)
+
+    def esperado(self, desde, hasta, granularidad, serie=None):
+        # Cálculo directo: sumar cada fila en el periodo que le toca
+        totales = {}
+        for fila in ResumenTest.objects.filter(dia__range=(desde, hasta)).values("dia", "nombre", "cantidad"):
+            if serie is None or fila["nombre"] == serie:
+                periodo = truncar(fila["dia"], granularidad)
+                totales[periodo] = totales.get(periodo, 0) + fila["cantidad"]
+        return totales
+
+    def test_una_fila_por_periodo_con_ceros(self):
+        # El rango pasa el final de los datos: los últimos periodos quedan en cero
+        desde, hasta = date.today() - timedelta(days=500), date.today() + timedelta(days=400)
+        nombre = Test.objects.values_list("nombre", flat=True).first()
+        for granularidad in TRUNCAR:
+            with self.subTest(granularidad=granularidad):
+                filas = agrupar(ResumenTest.objects.filter(dia__range=(desde, hasta)), "dia", granularidad)
+                etiquetas, series = densificar(filas, desde, hasta, granularidad)
+                self.assertEqual(etiquetas, periodos(desde, hasta, granularidad))
+                self.assertEqual(etiquetas[0], truncar(desde, granularidad))
+                self.assertEqual(etiquetas[-1], truncar(hasta, granularidad))
+                self.assertEqual(len(set(etiquetas)), len(etiquetas))
+                esperado = self.esperado(desde, hasta, granularidad)
+                self.assertEqual(series, {None: [esperado.get(periodo, 0) for periodo in etiquetas]})
+                self.assertEqual(series[None][-1], 0)
+
+                filas = agrupar(ResumenTest.objects.filter(dia__range=(desde, hasta)), "dia", granularidad,
+                                campo_serie="nombre")
+                _, series = densificar(filas, desde, hasta, granularidad, campo_serie="nombre")
+                esperado = self.esperado(desde, hasta, granularidad, serie=nombre)
+                self.assertEqual(series[nombre], [esperado.get(periodo, 0) for periodo in etiquetas])
+
+
+@SIN_REPLICA
+class AgregadorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(tests=80, personas=20)
+
+    def assertRechaza(self, agregador, agrupar, **opciones):
+        with self.assertRaises(ParametroInvalido), self.assertNumQueries(0):
+            agregador.consultar(agrupar, **opciones)
+
+    def test_rutas_rechazadas(self):
+        agregador = Agregador(Test)
+        # Relaciones inversas (uno a muchos y uno a uno) y many-to-many
+        self.assertRechaza(Agregador(Persona), ["tests_como_cliente"])
+        self.assertRechaza(agregador, ["resultado__resultado"])
+        self.assertRechaza(Agregador(CustomUser), ["groups__name"])
+        # Métodos y propiedades no son campos
+        self.assertRechaza(Agregador(ImportacionCSV), ["progreso"])
+        self.assertRechaza(agregador, ["__str__"])
+        # Atravesar algo que no es relación, campos inexistentes y rutas vacías
+        self.assertRechaza(agregador, ["nombre__cliente"])
+        self.assertRechaza(agregador, ["cliente__clave"])
+        self.assertRechaza(agregador, [""])
+        self.assertRechaza(agregador, [])
+
+    def test_profundidad_maxima(self):
+        self.assertEqual(len(Agregador(Resultado, profundidad=2).consultar(["test__cliente__sexo"])), 2)
+        self.assertRechaza(Agregador(Resultado, profundidad=1), ["test__cliente__sexo"])
+        self.assertRechaza(Agregador(Resultado, profundidad=1), ["nombre"], filtros={"test__cliente__sexo": "femenino"})
+
+    def test_lookups_y_valores_invalidos(self):
+        agregador = Agregador(Test)
+        self.assertRechaza(agregador, ["estado"], filtros={"nombre__regex": ".*"})
+        self.assertRechaza(agregador, ["estado"], filtros={"calificacion__gte": "diez"})
+        self.assertRechaza(agregador, ["estado"], filtros={"fecha__in": "2024-01-01,ayer"})
+        self.assertRechaza(agregador, ["estado"], operacion="sum", campo="nombre")
+        self.assertRechaza(agregador, ["estado"], operacion="drop")
+        self.assertRechaza(agregador, ["estado"], orden="observaciones")
+
+    def test_una_sola_consulta(self):
+        agregador = Agregador(Test)
+        filtros = {"cliente__sexo": "femenino", "calificacion__gte": "5", "fecha__lte": date.today().isoformat()}
+        with self.assertNumQueries(1):
+            filas = agregador.consultar(["categoria__nombre", "cliente__rol"], "avg", campo="calificacion", filtros=filtros)
+        esperado = Test.objects.filter(cliente__sexo="femenino", calificacion__gte=5).count()
+        with self.assertNumQueries(1):
+            self.assertEqual(sum(fila["valor"] for fila in agregador.consultar(["categoria__nombre"], filtros=filtros)), esperado)
+        self.assertTrue(filas)
+
+    def test_formula_avisa_si_la_grafica_queda_truncada(self):
+        with mock.patch.object(views, "LIMITE_FORMULA", 5):
+            campo, valores, conteos, truncado = views.evaluar_formula("fecha")
+            self.assertTrue(truncado)
+            self.assertEqual(len(valores), 5)
+            self.assertEqual(valores, sorted(valores))
+            _, valores, conteos, truncado = views.evaluar_formula("estado")
+        self.assertFalse(truncado)
+        self.assertEqual(sum(conteos), 80)
+
+
+class AccesoTests(TestCase):
+    VISTAS_STAFF = ["metricas_vistas", "estadisticas_cache", "estadisticas_cache_analitics", "estadisticas_bd"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.importacion = ImportacionCSV.objects.create(tipo="personas", archivo="personas.csv")
+        cls.staff = User.objects.create_user("staff", password="clave", is_staff=True)
+        cls.usuario = User.objects.create_user("usuario", password="clave")
+
+    def urls_staff(self):
+        return [reverse(nombre) for nombre in self.VISTAS_STAFF] + [
+            reverse("estado_importacion", args=[self.importacion.pk])
+        ]
+
+    def test_vistas_internas_solo_para_staff(self):
+        for url in self.urls_staff():
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.usuario)
+        for url in self.urls_staff():
+            with self.subTest(url=url, usuario="sin staff"):
+                self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        for url in self.urls_staff():
+            with self.subTest(url=url, usuario="staff"):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICAS_TOKEN="secreto", METRICAS_IPS=["10.0.0.5"])
+    def test_metrics_con_token_o_ip_permitida(self):
+        url = reverse("metricas")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={"authorization": "Bearer otro"}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={"authorization": "Bearer secreto"}).status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.5").status_code, 200)
+
+
+@SIN_REPLICA
+@override_settings(VERSION_DATOS_MEMO=0)
+class ApiKpiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(tests=50, personas=20)
+
+    def setUp(self):
+        caches[ALIAS_CACHE].clear()
+
+    def test_304_si_el_cliente_tiene_la_version_actual(self):
+        url = reverse("api_kpi", args=["satisfaccion"])
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta.headers["ETag"]
+
+        # Solo la versión de datos, leída una vez para ETag y Last-Modified
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(respuesta.status_code, 304)
+        respuesta = self.client.get(url, headers={"if-modified-since": respuesta.headers["Last-Modified"]})
+        self.assertEqual(respuesta.status_code, 304)
+
+        # Una carga nueva cambia el ETag
+        incrementar_version()
+        self.assertEqual(self.client.get(url, headers={"if-none-match": etag}).status_code, 200)
+
+    def test_kpi_inexistente_es_404_aunque_coincidan_los_validadores(self):
+        url = reverse("api_kpi", args=["no-existe"])
+        for cabeceras in [{}, {"if-none-match": "*"}, {"if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT"}]:
+            with self.subTest(cabeceras=cabeceras), self.assertNumQueries(0):
+                respuesta = self.client.get(url, headers=cabeceras)
+            self.assertEqual(respuesta.status_code, 404)
+            self.assertNotIn("ETag", respuesta.headers)
+
+
+def csv_tests(cantidad, semilla=2):
+    # CSV de carga de tests que referencia a las personas ya guardadas
+    generador = Generador(semilla=semilla, desde=date.today() - timedelta(days=59), dias=60)
+    clientes = list(Persona.objects.filter(rol="cliente").values_list("pk", flat=True))
+    personal = list(Persona.objects.filter(rol="personal").values_list("pk", flat=True))
+    salida = io.StringIO()
+    writer = csv.writer(salida)
+    writer.writerow(COLUMNAS_CSV_TESTS)
+    for tests, _ in generador.tests(cantidad, clientes, personal, asegurar_categorias()):
+        writer.writerows(fila_csv_test(datos) for datos in tests)
+    return salida.getvalue().encode()
+
+
+def resumenes():
+    # Contenido de las tablas de agregados, sin IDs
+    return (
+        sorted(tuple(fila) for fila in ResumenTest.objects.values_list(
+            "dia", "nombre", "categoria_id", "cliente_sexo", "rango_edad", "cantidad", "suma_calificacion",
+            "suma_dias_espera",
+        )),
+        sorted(ResumenCalificacion.objects.values_list("calificacion", "cliente_sexo", "cantidad")),
+    )
+
+
+@SIN_REPLICA
+class ImportacionesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(tests=0, personas=40)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=media.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def assertResultadosEnlazados(self):
+        # Cada resultado corresponde al test al que apunta: fecha de entrega y opciones de su nombre
+        tests = Test.objects.select_related("resultado")
+        self.assertEqual(Resultado.objects.count(), len(tests))
+        for test in tests:
+            opciones, detalles = opciones_resultado(test.nombre)
+            self.assertEqual(test.resultado.fecha, test.fecha_entrega)
+            self.assertEqual(test.resultado.detalles, detalles)
+            self.assertIn((test.resultado.resultado, test.resultado.interpretacion), [opcion[:2] for opcion in opciones])
+
+    def test_carga_en_dos_lotes_deja_los_mismos_agregados_que_reconstruir(self):
+        estadisticas = cargar_tests_csv(ContentFile(csv_tests(60), name="tests.csv"), tamano_lote=30)
+        self.assertEqual(estadisticas["filas"], 60)
+        self.assertEqual(Test.objects.count(), 60)
+        incrementales = resumenes()
+        self.assertEqual(sum(fila[5] for fila in incrementales[0]), 60)
+
+        reconstruir_agregados()
+        self.assertEqual(resumenes(), incrementales)
+        self.assertResultadosEnlazados()
+
+    def test_reclamar_interrumpir_y_reanudar(self):
+        personas = encolar_importacion(ImportacionCSV.TIPO_PERSONAS, ContentFile(b"nombre,apellidos\n", name="p.csv"))
+        tests = encolar_importacion(ImportacionCSV.TIPO_TESTS, ContentFile(csv_tests(50), name="t.csv"))
+
+        # El CSV de tests espera al de personas subido antes, aunque esté en proceso
+        self.assertEqual(reclamar_siguiente("w1").pk, personas.pk)
+        self.assertIsNone(reclamar_siguiente("w2"))
+        ImportacionCSV.objects.filter(pk=personas.pk).update(estado=ImportacionCSV.COMPLETADO)
+
+        # El worker se cae en el tercer lote: quedan confirmados los dos primeros con su avance
+        importacion = reclamar_siguiente("w1")
+        self.assertEqual((importacion.pk, importacion.worker, importacion.intentos), (tests.pk, "w1", 1))
+        with mock.patch.object(importers, "TAMANO_LOTE", 20), mock.patch.object(importers, "TAMANO_LOTE_COPY", 20), \
+                mock.patch.object(importers, "acumular_tests", side_effect=[None, None, RuntimeError("caída")]), \
+                self.assertLogs("myapp.importaciones", "ERROR"):
+            procesar_importacion(importacion)
+        importacion.refresh_from_db()
+        self.assertEqual((importacion.estado, importacion.filas_procesadas), (ImportacionCSV.ERROR, 40))
+        self.assertEqual(Test.objects.count(), 40)
+
+        # Reencolado, otro worker lo toma y sigue desde la fila 40 sin duplicar
+        reintentar_importacion(tests.pk)
+        importacion = reclamar_siguiente("w2")
+        self.assertEqual((importacion.pk, importacion.intentos, importacion.filas_procesadas), (tests.pk, 2, 40))
+        procesar_importacion(importacion)
+        importacion.refresh_from_db()
+        self.assertEqual(importacion.estado, ImportacionCSV.COMPLETADO)
+        self.assertEqual((importacion.filas_procesadas, importacion.filas_totales), (50, 50))
+        self.assertEqual(Test.objects.count(), 50)
+        self.assertIsNone(reclamar_siguiente("w1"))
+
+    def test_trabajo_abandonado_vuelve_a_la_cola(self):
+        importacion = encolar_importacion(ImportacionCSV.TIPO_TESTS, ContentFile(csv_tests(10), name="t.csv"))
+        reclamar_siguiente("w1")
+        ImportacionCSV.objects.filter(pk=importacion.pk).update(latido=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(reencolar_abandonadas(timeout_latido=60, max_intentos=3), 1)
+        procesar_importacion(reclamar_siguiente("w2"))
+        importacion.refresh_from_db()
+        self.assertEqual((importacion.estado, importacion.worker, importacion.intentos), (ImportacionCSV.COMPLETADO, "w2", 2))
+        self.assertResultadosEnlazados()
+
+
+class ApiLLMFalsa(BaseHTTPRequestHandler):
+    # Responde como la API de chat con el contenido y la demora que fije cada test
+    contenido = ""
+    demora = 0
+    pedidos = []
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).pedidos.append({"cuerpo": cuerpo, "autorizacion": self.headers.get("Authorization")})
+        time.sleep(self.demora)
+        respuesta = json.dumps({"choices": [{"message": {"content": self.contenido}}]}).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(respuesta)))
+            self.end_headers()
+            self.wfile.write(respuesta)
+        except OSError:
+            # El cliente ya cortó por timeout
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class AnaliticsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.servidor = ThreadingHTTPServer(("127.0.0.1", 0), ApiLLMFalsa)
+        cls.servidor.daemon_threads = True
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{cls.servidor.server_address[1]}/v1/chat/completions"
+        cls.ajustes = override_settings(
+            LLM_URL=url, LLM_API_KEY="clave-de-prueba", LLM_TIMEOUT_CONEXION=1, LLM_TIMEOUT_LECTURA=0.5,
+            LLM_REINTENTOS=0, METRICAS_MUESTREO=0, REPLICA_ALIAS=None, SQL_IA_ROL="consultas_ia_test",
+        )
+        # Antes de setUpTestData, que crea el rol SQL_IA_ROL en PostgreSQL
+        cls.ajustes.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.ajustes.disable()
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar(tests=50, personas=20)
+        if connection.vendor == "postgresql":
+            call_command("crear_rol_consultas", stdout=io.StringIO())
+
+    def setUp(self):
+        # El cliente compartido lee LLM_URL al crearse; el LRU de SQL y el caché de resultados, vacíos
+        # (el paquete llm exporta la función cliente con el mismo nombre que el módulo)
+        parche = mock.patch.object(importlib.import_module("myapp.llm.cliente"), "_cliente", None)
+        parche.start()
+        self.addCleanup(parche.stop)
+        llm.vaciar_cache()
+        caches[ALIAS_CACHE_CONSULTAS].clear()
+        ApiLLMFalsa.contenido, ApiLLMFalsa.demora, ApiLLMFalsa.pedidos = "", 0, []
+
+    async def preguntar(self, texto):
+        return await self.async_client.post("/analitics/", {"input_text": texto})
+
+    async def test_consulta_generada_se_ejecuta(self):
+        ApiLLMFalsa.contenido = "```sql\nSELECT nombre, COUNT(*) AS cantidad FROM myapp_test GROUP BY nombre;\n```"
+        respuesta = await self.preguntar("cantidad de tests por nombre")
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIsNone(respuesta.context["error"])
+        resultado = respuesta.context["result"]
+        self.assertEqual([columna["nombre"] for columna in resultado["columnas"]], ["nombre", "cantidad"])
+        self.assertEqual(sum(fila[1] for fila in resultado["filas"]), 50)
+        pedido = ApiLLMFalsa.pedidos[0]
+        self.assertEqual(pedido["autorizacion"], "Bearer clave-de-prueba")
+        self.assertIn("myapp_test", pedido["cuerpo"]["messages"][1]["content"])
+
+        # El mismo pedido (con otros espacios) sale del LRU sin llamar a la API
+        await self.preguntar("  cantidad de tests   por nombre ")
+        self.assertEqual(len(ApiLLMFalsa.pedidos), 1)
+
+    async def test_timeout_de_la_api(self):
+        ApiLLMFalsa.contenido = "SELECT 1"
+        ApiLLMFalsa.demora = 2
+        inicio = time.monotonic()
+        respuesta = await self.preguntar("algo lento")
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertLess(time.monotonic() - inicio, 1.5)
+        self.assertIn("Error al consultar la API de IA", respuesta.context["error"])
+        self.assertIsNone(respuesta.context["result"])
+
+    async def test_sql_no_permitido(self):
+        for contenido, mensaje in [
+            ("DELETE FROM myapp_test", "Solo se permiten consultas SELECT"),
+            ("SELECT password FROM auth_user", "No se puede consultar auth_user"),
+            ('SELECT password FROM U&"\\0061uth_user"', "escapes Unicode (U&)"),
+            ('SELECT * FROM u&"\\0070g_shadow"', "escapes Unicode (U&)"),
+            ("SELECT U&'\\0061' AS letra", "escapes Unicode (U&)"),
+            ("no sé qué consulta armar", "Solo se permiten consultas SELECT"),
+        ]:
+            with self.subTest(contenido=contenido):
+                ApiLLMFalsa.contenido = contenido
+                respuesta = await self.preguntar(f"pedido {contenido}")
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertIn(mensaje, respuesta.context["error"])
+                self.assertIsNone(respuesta.context["result"])
+        self.assertEqual(await Test.objects.acount(), 50)
+
+    @skipUnless(connection.vendor == "postgresql", "Los roles son de PostgreSQL")
+    async def test_sin_rol_no_se_ejecuta_en_postgresql(self):
+        ApiLLMFalsa.contenido = "SELECT COUNT(*) FROM myapp_test"
+        with override_settings(SQL_IA_ROL=""):
+            respuesta = await self.preguntar("cuántos tests hay")
+        self.assertIn("Falta configurar SQL_IA_ROL", respuesta.context["error"])
+        self.assertIsNone(respuesta.context["result"])
+
+
+# Necesita una réplica que sea otra base, p. ej. dos SQLite locales:
+# DB_ENGINE=sqlite DB_REPLICA_NAME=replica.sqlite3 python manage.py test myapp
+REPLICA_SEPARADA = "replica" in settings.DATABASES and not settings.REPLICA_FISICA
+
+
+@skipUnless(REPLICA_SEPARADA, "Sin DB_REPLICA_NAME")
+@override_settings(REPLICA_ALIAS="replica", REPLICA_CHEQUEO_SEGUNDOS=0, VERSION_DATOS_MEMO=0, METRICAS_MUESTREO=0)
+class RouterReplicaTests(TestCase):
+    # El runner crea las bases de todas las clases, también de las que se saltean
+    databases = {"default", "replica"} if REPLICA_SEPARADA else {"default"}
+
+    @classmethod
+    def setUpTestData(cls):
+        # Una persona en cada base: según cuál aparezca se sabe de dónde se leyó
+        Persona.objects.create(nombre="Primaria", apellidos="P", rol="cliente")
+        Persona.objects.using("replica").create(nombre="Replica", apellidos="R", rol="cliente")
+        # La réplica está al día: tiene la versión de datos de la primaria (migrate ya la incrementó)
+        incrementar_version()
+        VersionDatos.objects.using("replica").create(pk=PK_VERSION, version=VersionDatos.objects.get(pk=PK_VERSION).version)
+
+    def setUp(self):
+        routers._estado.update(disponible=False, comprobado=None)
+
+    def nombres_leidos(self):
+        return set(Persona.objects.values_list("nombre", flat=True))
+
+    def test_lecturas_de_kpis_van_a_la_replica(self):
+        self.assertEqual(self.nombres_leidos(), {"Primaria"})
+        with routers.lectura_replica():
+            self.assertEqual(routers.alias_lectura(), "replica")
+            self.assertEqual(self.nombres_leidos(), {"Replica"})
+            # Escrituras y modelos que coordinan cachés e importaciones, siempre en la primaria
+            self.assertEqual(router.db_for_write(Persona), "default")
+            self.assertEqual(router.db_for_read(VersionDatos), "default")
+            self.assertEqual(router.db_for_read(ImportacionCSV), "default")
+
+    def test_replica_atrasada_lee_de_la_primaria(self):
+        # Una carga terminó en la primaria y la réplica todavía no la tiene
+        incrementar_version()
+        with routers.lectura_replica():
+            self.assertEqual(routers.alias_lectura(), "default")
+            self.assertEqual(self.nombres_leidos(), {"Primaria"})
+
+        VersionDatos.objects.using("replica").filter(pk=PK_VERSION).update(version=F("version") + 1)
+        with routers.lectura_replica():
+            self.assertEqual(routers.alias_lectura(), "replica")
+
+    def test_quien_sube_un_csv_lee_de_la_primaria(self):
+        url = reverse("api_personas")
+        self.assertEqual([fila["nombre"] for fila in self.client.get(url).json()["resultados"]], ["Replica"])
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            archivo = SimpleUploadedFile("personas.csv", b"nombre,apellidos\n", content_type="text/csv")
+            respuesta = self.client.post(reverse("cargar"), {"csv_file": archivo})
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertIn(routers.COOKIE_PRIMARIA, respuesta.cookies)
+
+        # El cliente de pruebas reenvía la cookie: las lecturas de la réplica van a la primaria
+        self.assertEqual([fila["nombre"] for fila in self.client.get(url).json()["resultados"]], ["Primaria"])
+        self.client.cookies.pop(routers.COOKIE_PRIMARIA)
+        self.assertEqual([fila["nombre"] for fila in self.client.get(url).json()["resultados"]], ["Replica"])
@@ -29,9 +29,12 @@ urlpatterns = [
     path('cargardatos/', views.cargar, name='cargar'),
     
     path('analitics/', views.analitics, name='analitics'),
+    path('analitics/cache/', views.estadisticas_cache_analitics, name='estadisticas_cache_analitics'),
     
     path('cargar test/', views.cargar_tests, name='cargar_tests'),
     
+    path('importaciones/<int:pk>/', views.estado_importacion, name='estado_importacion'),
+    
     
     
     
@@ -39,6 +42,16 @@ urlpatterns = [
 
     
     path('Home_KPI/', views.KPIhome, name='homekpi'),
+    
+    path('kpi/cache/', views.estadisticas_cache, name='estadisticas_cache'),
+    path('bd/estadisticas/', views.estadisticas_bd, name='estadisticas_bd'),
+    path('metrics', views.metricas, name='metricas'),
+    path('metricas/vistas/', views.metricas_vistas, name='metricas_vistas'),
+    
+    path('api/tests/', views.api_tests, name='api_tests'),
+    path('api/personas/', views.api_personas, name='api_personas'),
+    path('api/kpi/<str:nombre>/', views.api_kpi, name='api_kpi'),
+    path('api/kpis/', views.api_kpis, name='api_kpis'),
    
     # routes to 'signout' view and named as 'signout'
     path('signout/', views.signout, name='signout'),
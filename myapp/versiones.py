@@ -0,0 +1,56 @@
+"""
+Versión de los datos de Test/Persona.
+
+Cada carga CSV (y la reconstrucción de agregados) incrementa el contador de
+VersionDatos al terminar. Los cachés de KPIs usan la versión como parte de la
+clave, así que una carga nueva los invalida en todos los procesos.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VersionDatos
+
+
+PK_VERSION = 1
+
+_local = {"version": None, "actualizado": None, "leido": 0.0}
+_lock = threading.Lock()
+
+
+def _segundos_memo():
+    # Cuánto tiempo se reutiliza la versión leída sin volver a consultar la base de datos
+    return getattr(settings, "VERSION_DATOS_MEMO", 1.0)
+
+
+def leer_version():
+    # Devuelve (version, actualizado)
+    with _lock:
+        if _local["version"] is not None and time.monotonic() - _local["leido"] < _segundos_memo():
+            return _local["version"], _local["actualizado"]
+
+    fila = VersionDatos.objects.filter(pk=PK_VERSION).values_list("version", "actualizado").first()
+    version, actualizado = fila if fila else (0, None)
+    with _lock:
+        _local.update(version=version, actualizado=actualizado, leido=time.monotonic())
+    return version, actualizado
+
+
+def version_datos():
+    return leer_version()[0]
+
+
+def incrementar_version():
+    actualizados = VersionDatos.objects.filter(pk=PK_VERSION).update(
+        version=F("version") + 1, actualizado=timezone.now()
+    )
+    if not actualizados:
+        _, creada = VersionDatos.objects.get_or_create(pk=PK_VERSION, defaults={"version": 1})
+        if not creada:
+            # Otro proceso creó la fila al mismo tiempo
+            VersionDatos.objects.filter(pk=PK_VERSION).update(version=F("version") + 1, actualizado=timezone.now())
+    with _lock:
+        _local["version"] = None
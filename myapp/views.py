@@ -7,7 +7,9 @@ from django.http import JsonResponse
 # Import authentication and authorization utilities to manage user sessions and access control.
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
+from django.conf import settings
 
 # Import Django's messaging framework to provide feedback to users about actions (e.g., errors, success messages).
 from django.contrib import messages
@@ -21,29 +23,52 @@ from email.mime.text import MIMEText
 # Import model and utility functions specific to the application for managing scans and validations.
 from .models import Test
 from .models import Persona
-from .models import Categoria
-from .models import Resultado
+from .models import ImportacionCSV
+from .models import ResumenTest
+from myapp.agregaciones import Agregador, datos_grafico
+from myapp.agregados import RANGOS_EDAD, etiquetas_rangos_edad, promedio
+from myapp.cache_consultas import estadisticas as estadisticas_cache_consultas, resultado_para
+from myapp.conexiones import estadisticas as estadisticas_conexiones
+from myapp.edades import edad_exacta, rango_edad_expresion
+from myapp.ejecutor_sql import ConsultaNoPermitida, ErrorConsulta
+from myapp.esquema import esquema_prompt
+from myapp.graficos import grafico_para
+from myapp.kpi_async import calcular as calcular_kpis
+from myapp.metricas import consultas_mas_lentas, exposicion as exposicion_metricas
+from myapp.llm import ErrorLLM, estadisticas_cache as estadisticas_cache_sql, generar_sql, generar_sql_async
+from myapp.kpi_cache import cache_kpi, estadisticas as estadisticas_cache_kpis
+from myapp.kpi_queries import categorias_mas_solicitadas, resumen_satisfaccion
+from myapp.paginacion import ListadoKeyset, ParametroInvalido
+from myapp.pivote import datasets_chartjs, pivotar
+from myapp.routers import lectura_replica, pegar_a_primaria
+from myapp.series_tiempo import agrupar, densificar
+from myapp.versiones import leer_version
 from myapp.validators import CustomPasswordValidator
+from myapp.importaciones import encolar_importacion
 
 # Import standard libraries and third-party libraries for additional functionalities.
-import random
+import hashlib
+import hmac
+import json
 import smtplib
 import logging
 
 # Import Django's exception classes to handle specific exceptions such as validation errors.
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 
 # Import Django utility to fetch an object from the database or raise a 404 error if not found.
 from django.shortcuts import get_object_or_404
-
-from django.db.models import Count, Avg, F, ExpressionWrapper, fields
-from django.db.models.functions import TruncMonth,TruncDay
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from asgiref.sync import sync_to_async
+from django.views.decorators.http import condition, require_GET
+
+from django.db.models import Count, Avg, Sum, F, ExpressionWrapper, fields
 from datetime import datetime, timedelta ,date
-import csv
-import requests
-from django.db import connection
 
-import os  # Asegúrate de importar el módulo os
 from dotenv import load_dotenv
 
 
@@ -118,133 +143,104 @@ def register(request):
         return render(request, 'register.html')
 
 
+@lectura_replica()
 def KIP1(request):
      # Obtener las URLs más visitadas y contarlas
     valores = []
     campo=0
     conteos = 0
+    truncado = False
     if request.method == "POST":
         formula = request.POST.get("formula", "").replace(" ", "")  # Quita los espacios
         try:
-            campo, valores, conteos = evaluar_formula(formula)
+            campo, valores, conteos, truncado = evaluar_formula(formula)
         except ValueError as e:
             # Maneja el error si el campo no existe
             messages.error(request, str(e))
             return redirect("kpi1")
      
-      # Gráfico 2: Categoría más solicitada en Test
-    categoria_counts = (
-        Test.objects.values('categoria__nombre')
-        .annotate(cantidad=Count('categoria'))
-        .order_by('-cantidad')
-    )
-    categorias = [item['categoria__nombre'] for item in categoria_counts]
-    cantidades = [item['cantidad'] for item in categoria_counts]
-
-    result = Test.objects.values('nombre', 'fecha', 'calificacion')
-
+    # La tabla de tests se carga por páginas desde api/tests/ y los gráficos de
+    # categorías y satisfacción desde api/kpi/ (categorias, satisfaccion)
     field_names = [field.name for field in Test._meta.fields]  # Obtiene los nombres de los campos
 
-
-    # Calcular el índice de satisfacción promedio------------------------------------------------------
-    indice_satisfaccion = Test.objects.aggregate(Avg('calificacion'))['calificacion__avg']
-    
-    # Redondear el resultado a 2 decimales si es necesario
-    indice_satisfaccion = round(indice_satisfaccion, 2) if indice_satisfaccion else 0
-    # Separar los datos para el gráfico
-    
-    # Contar la cantidad de cada calificación del 0 al 10
-    calificaciones = Test.objects.values('calificacion').annotate(total=Count('calificacion')).order_by('calificacion')
-    calificaciones_labels = [item['calificacion'] for item in calificaciones]
-    calificaciones_totals = [item['total'] for item in calificaciones]
-    
-    indices_satisfaccion = calcular_indice_satisfaccion_por_genero()
-
-    context = {
-        'indice_satisfaccion_masculino': indices_satisfaccion['indice_satisfaccion_masculino'],
-        'indice_satisfaccion_femenino': indices_satisfaccion['indice_satisfaccion_femenino']
-    }
-    context = {'tests': result, 
-               'field_names': field_names,
-               'categorias': categorias,
-               'cantidades': cantidades,
+    context = {'field_names': field_names,
                "campo": campo,
                "valores": valores,
                "conteos": conteos,
-               'indice_satisfaccion': indice_satisfaccion,
-                'calificaciones_labels': calificaciones_labels,
-                'calificaciones_totals': calificaciones_totals,
-                'indice_satisfaccion_masculino': indices_satisfaccion['indice_satisfaccion_masculino'],
-              'indice_satisfaccion_femenino': indices_satisfaccion['indice_satisfaccion_femenino']
+               "truncado": truncado,
                }
     return render(request, 'kpi.html', context)
 
 def evaluar_formula(formula):
     # Limpia los espacios de la fórmula ingresada
     campo = formula.strip()
-    print(f"Campo solicitado: {campo}")  # Imprime el campo ingresado
-
-    # Verifica si el campo existe en el modelo ScanResult
-    if not hasattr(Test, campo):
-        print(f"Error: El campo '{campo}' no existe en el modelo ScanResult.")
-        raise ValueError(f"El campo '{campo}' no existe en el modelo ScanResult.")
 
-    # Agrupa por el campo especificado y cuenta las ocurrencias de cada valor único
-    resultados_contados = Test.objects.values(campo).annotate(conteo=Count(campo)).order_by(campo)
+    # Agrupa por el campo especificado y cuenta las ocurrencias de cada valor único;
+    # el campo se valida contra Test._meta (ParametroInvalido es un ValueError).
+    # Se pide un valor de más para saber si la gráfica quedó truncada
+    resultados_contados = AGREGADOR_TESTS.consultar(
+        [campo], "count", campo=campo, orden=campo, limite=LIMITE_FORMULA + 1
+    )
+    truncado = len(resultados_contados) > LIMITE_FORMULA
+    resultados_contados = resultados_contados[:LIMITE_FORMULA]
 
     # Extrae los datos para la gráfica: valores únicos y sus respectivos conteos
     valores = [resultado[campo] for resultado in resultados_contados]
-    conteos = [resultado['conteo'] for resultado in resultados_contados]
-
-    print(f"Valores únicos: {valores}")  # Imprime los valores únicos
-    print(f"Conteos: {conteos}")  # Imprime los conteos
+    conteos = [resultado['valor'] for resultado in resultados_contados]
 
-    # Retorna el nombre del campo, valores únicos y sus conteos
-    return campo, valores, conteos
+    # Retorna el nombre del campo, valores únicos, sus conteos y si faltan valores
+    return campo, valores, conteos, truncado
 
 def calcular_indice_satisfaccion_por_genero():
-    # Calcular el promedio de calificación para género masculino
-    indice_satisfaccion_masculino = Test.objects.filter(cliente__sexo='masculino').aggregate(Avg('calificacion'))['calificacion__avg'] or 0
-    # Calcular el promedio de calificación para género femenino
-    indice_satisfaccion_femenino = Test.objects.filter(cliente__sexo='femenino').aggregate(Avg('calificacion'))['calificacion__avg'] or 0
-
-    # Redondear a 2 decimales para mejor presentación
-    indice_satisfaccion_masculino = round(indice_satisfaccion_masculino, 2)
-    indice_satisfaccion_femenino = round(indice_satisfaccion_femenino, 2)
-
+    # Promedio de calificación por género, tomado de la consulta consolidada de satisfacción
+    satisfaccion = resumen_satisfaccion()
     return {
-        'indice_satisfaccion_masculino': indice_satisfaccion_masculino,
-        'indice_satisfaccion_femenino': indice_satisfaccion_femenino
+        'indice_satisfaccion_masculino': satisfaccion['indice_satisfaccion_masculino'],
+        'indice_satisfaccion_femenino': satisfaccion['indice_satisfaccion_femenino']
     }
 
+@lectura_replica()
 def KIP2(request):
-    
-    
-    # Filtrar personas con rol 'personal' y contar la cantidad de tests que ha realizado cada una
-    cantidad_tests = Persona.objects.filter(rol='personal').annotate(num_tests=Count('tests_como_personal'))
-    
-    # Calcular el total de tests realizados por todas las personas con rol 'personal'
-    total_tests = sum([persona.num_tests for persona in cantidad_tests])
-    
-    # Crear una lista de diccionarios con el nombre y el porcentaje de tests realizados
-    datos2 = [
-        {
-            'nombre': persona.nombre,
-            'porcentaje_tests': (persona.num_tests / total_tests * 100) if total_tests > 0 else 0
-        } for persona in cantidad_tests
-    ]
-    
-   
+    # Los gráficos se cargan desde api/kpi/; aquí solo la tabla del personal
     personas_personal = Persona.objects.filter(rol='personal')
-    # Filtrar personas con rol 'personal' y contar la cantidad de tests que ha realizado cada una
-    cantidad_tests = Persona.objects.filter(rol='personal').annotate(num_tests=Count('tests_como_personal'))
-    # Crear una lista de diccionarios con el nombre y la cantidad de tests
-    datos = [{'nombre': persona.nombre, 'cantidad_tests_realizados': persona.num_tests} for persona in cantidad_tests]
     
+    context = {
+        'personals':personas_personal,
+    }
     
+    return render(request, 'kpi2.html',context)
     
+
+@cache_kpi
+def obtener_tests_por_personal():
+    # Filtrar personas con rol 'personal' y contar la cantidad de tests que ha realizado cada una
+    cantidad_tests = list(
+        Persona.objects.filter(rol='personal')
+        .annotate(num_tests=Count('tests_como_personal'))
+        .values('nombre', 'num_tests')
+    )
     
+    # Calcular el total de tests realizados por todas las personas con rol 'personal'
+    total_tests = sum(persona['num_tests'] for persona in cantidad_tests)
     
+    return {
+        # Nombre y cantidad de tests
+        'cantidades': [
+            {'nombre': persona['nombre'], 'cantidad_tests_realizados': persona['num_tests']}
+            for persona in cantidad_tests
+        ],
+        # Nombre y porcentaje de tests realizados
+        'porcentajes': [
+            {
+                'nombre': persona['nombre'],
+                'porcentaje_tests': (persona['num_tests'] / total_tests * 100) if total_tests > 0 else 0
+            } for persona in cantidad_tests
+        ],
+    }
+
+
+@cache_kpi
+def obtener_tiempo_promedio_personal():
       # Calcular el tiempo promedio de ejecución para cada persona
     tiempo_promedio = Persona.objects.filter(rol='personal').annotate(
         tiempo_promedio=Avg(
@@ -253,33 +249,18 @@ def KIP2(request):
                 output_field=fields.DurationField()
             )
         )
-    )
+    ).values('nombre', 'tiempo_promedio')
 
     # Crear una lista de diccionarios con el nombre y el tiempo promedio en días
-    datos_tiempo_promedio = [
+    return [
         {
-            'nombre': persona.nombre,
-            'tiempo_promedio_dias': persona.tiempo_promedio.days if persona.tiempo_promedio else 0
+            'nombre': persona['nombre'],
+            'tiempo_promedio_dias': persona['tiempo_promedio'].days if persona['tiempo_promedio'] else 0
         } for persona in tiempo_promedio
     ]
     
-    
-    datos_promedio_calificacion = promediocalificacion()
-    
-    
-    
-    context = {
-        'personals':personas_personal,
-         'datos': datos,
-         'datosporcentaje': datos2,
-         'datos_tiempo_promedio': datos_tiempo_promedio,  # Tiempo promedio en días por test
-        'datos_promedio_calificacion': datos_promedio_calificacion
-    }
-    print(f"Valores nombreporcentajess: {datos2}")  # Imprime los valores únicos
-    
-    return render(request, 'kpi2.html',context)
-    
 
+@cache_kpi
 def promediocalificacion():
     promedio_calificacion = (
         Persona.objects.filter(rol='personal')
@@ -302,68 +283,43 @@ def promediocalificacion():
 
 
 def KIP3(request):
-    
-    
-    datos = obtener_pruebas_mensuales()
-    
-    datostiempoespera =tiempodeespera()
-    
-    context={
-          'datos_tiempo_espera': datostiempoespera,
-          'datos': datos
-    }
-    
-    return render(request, 'kpi3.html',context)
+    # Los gráficos se cargan desde api/kpi/ (tiempo_espera, pruebas_mensuales)
+    return render(request, 'kpi3.html')
     
 
+@cache_kpi
 def tiempodeespera():
     # Calcular el tiempo de espera promedio por cada prueba
     tiempo_espera_por_prueba = (
-        Test.objects.annotate(
-            tiempo_espera=ExpressionWrapper(
-                F('fecha_entrega') - F('fecha'),
-                output_field=fields.DurationField()
-            )
-        )
-        .values('nombre')  # Agrupar por nombre de la prueba
-        .annotate(promedio_tiempo_espera=Avg('tiempo_espera'))  # Calcular el promedio de tiempo de espera
+        ResumenTest.objects.values('nombre')  # Agrupar por nombre de la prueba
+        .annotate(dias_espera=Sum('suma_dias_espera'), cantidad=Sum('cantidad'))
         .order_by('nombre')  # Ordenar alfabéticamente por nombre de la prueba
     )
 
-    # Convertir el tiempo de espera promedio a días para cada prueba
+    # Tiempo de espera promedio en días completos para cada prueba
     datos_tiempo_espera = [
         {
             'nombre': prueba['nombre'],
-            'promedio_tiempo_espera_dias': prueba['promedio_tiempo_espera'].days if prueba['promedio_tiempo_espera'] else 0
+            'promedio_tiempo_espera_dias': int(promedio(prueba['dias_espera'], prueba['cantidad']))
         } for prueba in tiempo_espera_por_prueba
     ] 
-    print(f"orderby pruebas times: {datos_tiempo_espera}")  # Imprime los conteos
 
     return datos_tiempo_espera
     
+@cache_kpi
 def obtener_pruebas_mensuales():
     # Año actual
     año_actual = datetime.now().year
+    inicio, fin = date(año_actual, 1, 1), date(año_actual, 12, 31)
 
-    # Consulta para obtener la cantidad de pruebas por mes en el año actual
-    pruebas_por_mes = (
-        Test.objects.filter(fecha__year=año_actual)
-        .annotate(mes=TruncMonth('fecha'))
-        .values('mes')
-        .annotate(cantidad=Count('id'))
-        .order_by('mes')
-    )
-
-    # Crear un diccionario con la cantidad de pruebas por mes, iniciando con 0 para cada mes
-    datos_por_mes = {mes: 0 for mes in range(1, 13)}
-    for entry in pruebas_por_mes:
-        mes = entry['mes'].month  # Extraer el número de mes
-        datos_por_mes[mes] = entry['cantidad']  # Asignar la cantidad de pruebas al mes correspondiente
+    # Cantidad de pruebas por mes en el año actual, con 0 en los meses sin pruebas
+    pruebas_por_mes = agrupar(ResumenTest.objects.filter(dia__range=(inicio, fin)), 'dia', 'mes')
+    _, series = densificar(pruebas_por_mes, inicio, fin, 'mes')
 
     # Preparar los datos para el gráfico
     datos = {
         'labels': ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'],
-        'data': [datos_por_mes[mes] for mes in range(1, 13)]
+        'data': series[None]
     }
 
     return datos
@@ -371,79 +327,40 @@ def obtener_pruebas_mensuales():
     
     
 def KIP4(request):
-    datos2 = obtener_volumen_pruebas_semanales()
-    
-    datos = obtener_pruebas_semanales()
-    
-    datos_porcentaje = obtener_porcentaje_pruebas()
-    
-    datos_genero = obtener_volumen_pruebas_por_genero()
-    
-    context = {
-        'datos': datos,
-        'datos2': datos2,
-         'datos_porcentaje': datos_porcentaje,
-          'datos_genero': datos_genero
-    }
-    
-    return render(request, 'kpi4.html', context)
+    # Los gráficos se cargan desde api/kpi/ (pruebas_semanales, volumen_pruebas_semanales,
+    # porcentaje_pruebas, volumen_pruebas_por_genero)
+    return render(request, 'kpi4.html')
     
+@cache_kpi
 def obtener_pruebas_semanales():
-    hace_siete_dias = datetime.now() - timedelta(days=7)
+    # Los siete días anteriores a hoy
+    hace_siete_dias = date.today() - timedelta(days=7)
+    ayer = date.today() - timedelta(days=1)
 
-    # Obtener la cantidad de pruebas por día en la última semana
-    pruebas_por_dia = (
-        Test.objects.filter(fecha__gte=hace_siete_dias)
-        .annotate(dia=TruncDay('fecha'))
-        .values('dia')
-        .annotate(cantidad=Count('id'))
-        .order_by('dia')
-    )
-
-    # Generar un diccionario con los días de la semana y la cantidad de pruebas
-    dias_semana = [(hace_siete_dias + timedelta(days=i)).date() for i in range(7)]
-    datos_por_dia = {dia: 0 for dia in dias_semana}  # Inicializar con 0 para cada día
-
-    # Rellenar con la cantidad de pruebas de cada día de la consulta
-    for entry in pruebas_por_dia:
-        dia = entry['dia']  # Ya es un objeto date, no se necesita .date()
-        datos_por_dia[dia] = entry['cantidad']  # Asignar la cantidad de pruebas
+    # Cantidad de pruebas por día, con 0 en los días sin pruebas
+    pruebas_por_dia = agrupar(ResumenTest.objects.filter(dia__range=(hace_siete_dias, ayer)), 'dia')
+    dias_semana, series = densificar(pruebas_por_dia, hace_siete_dias, ayer)
 
     # Preparar los datos para el gráfico
     datos = {
         'labels': [dia.strftime('%Y-%m-%d') for dia in dias_semana],
-        'data': [datos_por_dia[dia] for dia in dias_semana]
+        'data': series[None]
     }
 
     return datos
     
+@cache_kpi
 def obtener_volumen_pruebas_semanales():
-    # Fecha de hace 7 días desde hoy
-    hace_siete_dias = datetime.now() - timedelta(days=7)
-
-    # Obtener la cantidad de pruebas por día en la última semana, agrupado por nombre de prueba
-    pruebas_por_dia_y_nombre = (
-        Test.objects.filter(fecha__gte=hace_siete_dias)
-        .annotate(dia=TruncDay('fecha'))
-        .values('dia', 'nombre')
-        .annotate(cantidad=Count('id'))
-        .order_by('dia', 'nombre')
+    # Los siete días anteriores a hoy
+    hace_siete_dias = date.today() - timedelta(days=7)
+    ayer = date.today() - timedelta(days=1)
+
+    # Cantidad de pruebas por día y por nombre de prueba; cada prueba con
+    # datos en la semana es una serie (sin consultar aparte los nombres)
+    pruebas_por_dia_y_nombre = agrupar(
+        ResumenTest.objects.filter(dia__range=(hace_siete_dias, ayer)), 'dia', campo_serie='nombre'
     )
-
-    # Generar estructura para los datos del gráfico
-    dias_semana = [(hace_siete_dias + timedelta(days=i)).date() for i in range(7)]
-    nombres_pruebas = Test.objects.values_list('nombre', flat=True).distinct()
-
-    # Crear un diccionario inicial con todos los nombres de prueba y 0 pruebas para cada día de la semana
-    datos_por_prueba = {
-        nombre: {dia: 0 for dia in dias_semana} for nombre in nombres_pruebas
-    }
-
-    # Rellenar el diccionario con los datos de la consulta
-    for entry in pruebas_por_dia_y_nombre:
-        dia = entry['dia']
-        nombre = entry['nombre']
-        datos_por_prueba[nombre][dia] = entry['cantidad']
+    dias_semana, series = densificar(pruebas_por_dia_y_nombre, hace_siete_dias, ayer, campo_serie='nombre')
 
     # Preparar los datos para el gráfico
     datos = {
@@ -451,24 +368,23 @@ def obtener_volumen_pruebas_semanales():
         'datasets': [
             {
                 'label': nombre,
-                'data': [datos_por_prueba[nombre][dia] for dia in dias_semana],
+                'data': data,
                 'fill': 'false'  # Sin relleno bajo las líneas
             }
-            for nombre in nombres_pruebas
+            for nombre, data in series.items()
         ]
     }
-    print(f"Valores pruebasSemanalesChartbytest: {datos}")  #
     return datos    
 
+@cache_kpi
 def obtener_porcentaje_pruebas():
-    # Total de pruebas
-    total_pruebas = Test.objects.count()
-
     # Contar el número de pruebas por tipo (nombre) y calcular el porcentaje
-    pruebas_por_tipo = (
-        Test.objects.values('nombre')
-        .annotate(cantidad=Count('id'))
+    pruebas_por_tipo = list(
+        ResumenTest.objects.values('nombre')
+        .annotate(cantidad=Sum('cantidad'))
     )
+    # Total de pruebas
+    total_pruebas = sum(entry['cantidad'] for entry in pruebas_por_tipo)
 
     # Calcular el porcentaje para cada tipo de prueba
     datos = {
@@ -480,6 +396,7 @@ def obtener_porcentaje_pruebas():
     }
     return datos
 
+@cache_kpi
 def obtener_volumen_pruebas_por_genero():
     # Filtrar personas con rol de 'personal' y agrupar por género
     pruebas_por_genero = (
@@ -500,76 +417,54 @@ def obtener_volumen_pruebas_por_genero():
 
 
 def KIP5(request):
-    datos_edad = obtener_tests_por_edad()
-    
-    datos_tests_por_edad = obtener_tests_por_edad_y_nombre()
-    
-    datos_tests_menos_usados = obtener_tests_menos_usados()
-    
-    datos_tests_mas_solicitados = obtener_tests_mas_solicitados()
-    
-    datos_genero = obtener_indice_genero()
-    
+    # Los gráficos se cargan desde api/kpi/ (tests_por_edad, tests_por_edad_y_nombre,
+    # tests_menos_usados, tests_mas_solicitados, indice_genero)
+    return render(request, 'kpi5.html')
     
-    context = {
-        'datos_edad': datos_edad,
-        'datos_tests_por_edad': datos_tests_por_edad,
-         'datos_tests_menos_usados': datos_tests_menos_usados,
-         'datos_tests_mas_solicitados': datos_tests_mas_solicitados,
-          'datos_genero': datos_genero
-    }
-    
-    return render(request, 'kpi5.html',context)
-    
-def obtener_tests_por_edad():
-    # Calcular la edad de cada cliente y contar la cantidad de tests por edad
-    hoy = date.today()
+@cache_kpi
+def obtener_tests_por_edad(rangos=RANGOS_EDAD):
+    # Contar los tests por rango de edad del cliente a la fecha del test
     tests_por_edad = (
         Test.objects.filter(cliente__rol='cliente')
-        .annotate(edad=(hoy.year - F('cliente__fnac__year')))
-        .values('edad')
+        .annotate(rango=rango_edad_expresion(edad_exacta('cliente__fnac', 'fecha'), rangos))
+        .values('rango')
         .annotate(cantidad=Count('id'))
-        .order_by('edad')
+        .order_by()
     )
+    cantidades = {entry['rango']: entry['cantidad'] for entry in tests_por_edad}
 
-    # Formatear los datos para el gráfico
+    # Formatear los datos para el gráfico, con todos los rangos
+    etiquetas = etiquetas_rangos_edad(rangos)
     datos = {
-        'labels': [str(entry['edad']) for entry in tests_por_edad],  # Edades
-        'data': [entry['cantidad'] for entry in tests_por_edad]  # Cantidad de tests por edad
+        'labels': etiquetas,  # Rangos de edad
+        'data': [cantidades.get(etiqueta, 0) for etiqueta in etiquetas]  # Cantidad de tests por rango
     }
     
     return datos   
     
-def obtener_tests_por_edad_y_nombre():
-    hoy = date.today()
-    # Anotar la edad y contar la cantidad de cada tipo de test realizado por edad
+@cache_kpi
+def obtener_tests_por_edad_y_nombre(rangos=RANGOS_EDAD):
+    # Contar los tests por rango de edad del cliente (a la fecha del test) y
+    # nombre del test; el rango se calcula y agrupa en la base de datos
     tests_por_edad_y_nombre = (
         Test.objects.filter(cliente__rol='cliente')
-        .annotate(edad=hoy.year - F('cliente__fnac__year'))  # Calcula la edad del cliente
-        .values('edad', 'nombre')  # Agrupar por edad y nombre del test
+        .annotate(rango=rango_edad_expresion(edad_exacta('cliente__fnac', 'fecha'), rangos))
+        .values('rango', 'nombre')  # Agrupar por rango de edad y nombre del test
         .annotate(cantidad=Count('id'))
-        .order_by('edad', 'nombre')
+        .order_by()
     )
 
-    # Organizar los datos en el formato requerido para Chart.js
-    edades = sorted(set(entry['edad'] for entry in tests_por_edad_y_nombre))  # Lista de edades únicas
-    nombres_tests = sorted(set(entry['nombre'] for entry in tests_por_edad_y_nombre))  # Lista de nombres de tests únicos
-
-    # Inicializar la estructura de datos para el gráfico
-    datos = {nombre: [0] * len(edades) for nombre in nombres_tests}
-    for entry in tests_por_edad_y_nombre:
-        edad_index = edades.index(entry['edad'])
-        datos[entry['nombre']][edad_index] = entry['cantidad']
+    # Una serie por test y una columna por rango de edad, en el formato de Chart.js
+    return datasets_chartjs(*pivotar(
+        tests_por_edad_y_nombre, 'nombre', 'rango', etiquetas_columnas=etiquetas_rangos_edad(rangos)
+    ))
 
-    return {
-        'labels': edades,
-        'datasets': [{'label': nombre, 'data': datos[nombre]} for nombre in nombres_tests]
-    }  
+@cache_kpi
 def obtener_tests_menos_usados():
     # Obtener los 5 tests menos usados (con menor cantidad de registros)
     tests_menos_usados = (
-        Test.objects.values('nombre')
-        .annotate(cantidad=Count('id'))
+        ResumenTest.objects.values('nombre')
+        .annotate(cantidad=Sum('cantidad'))
         .order_by('cantidad')[:5]
     )
 
@@ -578,11 +473,12 @@ def obtener_tests_menos_usados():
     return datos  
 
 
+@cache_kpi
 def obtener_tests_mas_solicitados():
     # Obtener los 5 tests más usados (con mayor cantidad de registros)
     tests_mas_solicitados = (
-        Test.objects.values('nombre')
-        .annotate(cantidad=Count('id'))
+        ResumenTest.objects.values('nombre')
+        .annotate(cantidad=Sum('cantidad'))
         .order_by('-cantidad')[:5]  # Ordenar en orden descendente por cantidad
     )
 
@@ -591,6 +487,7 @@ def obtener_tests_mas_solicitados():
     return datos
 
 
+@cache_kpi
 def obtener_indice_genero():
     # Filtrar clientes y agrupar por sexo
     indice_genero = (
@@ -607,10 +504,12 @@ def obtener_indice_genero():
     }
     return datos
 
+@lectura_replica()
 def KIP6(request):
     valores = []
     campo=0
     conteos = 0
+    truncado = False
     
     datos =[] 
     field_name = ""
@@ -618,28 +517,27 @@ def KIP6(request):
     if request.method == "POST":
         formula = request.POST.get("formula", "").replace(" ", "")  # Quita los espacios
         try:
-            campo, valores, conteos = evaluar_formula(formula)
+            campo, valores, conteos, truncado = evaluar_formula(formula)
         except ValueError as e:
             # Maneja el error si el campo no existe
             messages.error(request, str(e))
             return redirect("kpi6")
 
     
-    result = Test.objects.all()
     field_names = [field.name for field in Test._meta.fields]  # Obtiene los nombres de los campos
     
-    result = Persona.objects.all()
+    # La tabla de personas se carga por páginas desde api/personas/
     field_namespersona = [field.name for field in Persona._meta.fields]  # Obtiene los nombres de los campos
     
     
     
     context = {
-      'tests': result, 
        'field_names': field_names,
        'field_namespersona': field_namespersona,
         "campo": campo,
         "valores": valores,
         "conteos": conteos,
+        "truncado": truncado,
            'datos': datos, 
             'field_name': field_name
     }
@@ -655,52 +553,10 @@ def cargar(request):
         if not csv_file.name.endswith(".csv"):
             return HttpResponse("El archivo debe tener formato CSV.")
 
-        # Leer y procesar el archivo CSV
-        try:
-            data = csv_file.read().decode("utf-8").splitlines()  # Decodificar el archivo
-            reader = csv.DictReader(data)
-
-            personas = []
-            for row in reader:
-                if "id" in row:
-                    del row["id"]
-                # Convertir la fecha al formato esperado por Django
-                fecha_nac = datetime.strptime(row["fnac"], "%m/%d/%Y").date()
-               
-                # Normalizar el campo "telefono" (dejar solo los primeros 8 dígitos válidos)
-                telefono = "".join(filter(str.isdigit, row["telefono"]))[:8]
-
-                # Normalizar el campo "sexo"
-                sexo = row["gender"].lower()
-                if sexo == "male":
-                    sexo = "masculino"
-                elif sexo == "female":
-                    sexo = "femenino"
-                else:
-                    sexo = "masculino"
-
-                # Crear instancia de Persona
-                persona = Persona(
-                    nombre=row["nombre"],
-                    apellidos=row["apellidos"],
-                    sexo=sexo,
-                    fnac=fecha_nac,
-                    telefono=telefono,
-                    rol=row["rol"],
-                    #especialidad=row["especialidad"] if row["especialidad"] else None,
-                    especialidad=None,
-                )
-                # Imprimir la instancia de Persona antes de agregarla
-                print(f"Persona creada: {persona.__dict__}")
-                personas.append(persona)
-
-            # Guardar todas las personas en la base de datos
-            #print( 'datos: ',personas)
-            Persona.objects.bulk_create(personas)
-
-            return HttpResponse("Datos cargados exitosamente.")
-        except Exception as e:
-            return HttpResponse(f"Error al procesar el archivo: {str(e)}")
+        # El archivo se procesa en segundo plano (comando procesar_importaciones)
+        importacion = encolar_importacion(ImportacionCSV.TIPO_PERSONAS, csv_file)
+        # Quien sube el archivo lee de la primaria hasta que la réplica lo alcance
+        return pegar_a_primaria(respuesta_importacion(importacion, status=202))
 
     return render(request, "cargar.html")
 
@@ -714,347 +570,318 @@ def cargar_tests(request):
         if not csv_file.name.endswith(".csv"):
             return HttpResponse("El archivo debe tener formato CSV.")
 
-        # Leer y procesar el archivo CSV
-        try:
-            data = csv_file.read().decode("utf-8").splitlines()  # Decodificar el archivo
-            reader = csv.DictReader(data)
-            # Cargar todas las categorías en caché
-            categorias = {categoria.id: categoria for categoria in Categoria.objects.all()}
-            personas_cache = {persona.id: persona for persona in Persona.objects.all()}
-            
-            
-            tests = []
-            resultados = []
-            for row in reader:
-                # Convertir la fecha al formato esperado por Django
-                fecha_prueba = datetime.strptime(row["fecha"], "%m/%d/%Y").date()
-
-                if "covid" in row["nombre"].lower():
-                    dias_entrega = random.randint(1, 2)
-                elif "paternidad" in row["nombre"].lower():
-                    dias_entrega = random.randint(5, 10)
-                elif "hemograma" in row["nombre"].lower():
-                    dias_entrega = random.randint(1, 3)
-                elif "influenza" in row["nombre"].lower():
-                    dias_entrega = random.randint(2, 4)
-                elif "alergia" in row["nombre"].lower():
-                    dias_entrega = random.randint(3, 7)
-                elif "electrocardiograma" in row["nombre"].lower():
-                    dias_entrega = random.randint(1, 2)
-                elif "anticuerpo" in row["nombre"].lower():
-                    dias_entrega = random.randint(3, 5)
-                elif "hepatitis" in row["nombre"].lower():
-                    dias_entrega = random.randint(5, 10)
-                else:
-                    dias_entrega = random.randint(7, 14)  # Por defecto para pruebas no especificadas
-
-                fecha_entrega = fecha_prueba + timedelta(days=dias_entrega)
-
-                # Buscar la categoría y las personas relacionadas
-                #categoria = Categoria.objects.get(id=row["categoria_id"])
-                categoria_id = int(row["categoria_id"])
-                categoria = categorias.get(categoria_id)
-                
-                '''
-                try:
-                    cliente = Persona.objects.get(id=row["cliente_id"])
-                except Persona.DoesNotExist:
-                    cliente_id = random.randint(1000, 3000)
-                    cliente = Persona(id=cliente_id, nombre=f"Cliente-{cliente_id}")  # Creando un cliente temporal
-
-                # Obtener el personal
-                try:
-                    personal = Persona.objects.get(id=row["personal_id"])
-                except Persona.DoesNotExist:
-                    personal_id = random.randint(1000, 2000)
-                    personal = Persona(id=personal_id, nombre=f"Personal-{personal_id}") 
-                '''
-                 # Obtener cliente desde la caché o crear temporalmente con un ID aleatorio
-                cliente_id = int(row["cliente_id"])
-                try:
-                    cliente = personas_cache[cliente_id]
-                except KeyError:
-                    cliente_id = random.randint(1000, 3000)
-                    cliente = Persona(id=cliente_id, nombre=f"Cliente-{cliente_id}")  # Crear cliente temporal
-                    personas_cache[cliente_id] = cliente  # Agregar al caché temporalmente
-
-                # Obtener personal desde la caché o crear temporalmente con un ID aleatorio
-                personal_id = int(row["personal_id"])
-                try:
-                    personal = personas_cache[personal_id]
-                except KeyError:
-                    personal_id = random.randint(1000, 2000)
-                    personal = Persona(id=personal_id, nombre=f"Personal-{personal_id}")  # Crear personal temporal
-                    personas_cache[personal_id] = personal  # Agregar al caché temporalmente
-                
-                
-                # Crear la instancia del Test
-                test = Test(
-                    nombre=row["nombre"],
-                    fecha=fecha_prueba,
-                    fecha_entrega=fecha_entrega,
-                    estado=row["estado"],
-                    observaciones=row["observaciones"] if row["observaciones"] != "N/a" else None,
-                    calificacion=int(row["calificacion"]),
-                    categoria=categoria,
-                    cliente=cliente,
-                    personal=personal,
-                )
-                # Imprimir datos del test para depuración
-                #observaciones=row["observaciones"] if row["observaciones"] != "N/a" else None,
-                # Manejar el campo 'observaciones' con un valor predeterminado
-                #para crear los resultados, se toman el nombre y se generan resutlados leatorios por codigo
-                
-                 # Generar el resultado del test
-                resultado_text, interpretacion, detalles = generar_resultado(test.nombre)
-
-                # Crear la instancia de Resultado
-                resultado = Resultado(
-                    test=test,
-                    resultado=resultado_text,
-                    fecha=fecha_entrega,
-                    observaciones="N/a",
-                    interpretacion=interpretacion,
-                    detalles=detalles,
-                    url_imagen_path=None,
-                )
-                resultados.append(resultado)
-                
-                
-               
-
-                tests.append(test)
-                print(f"Resultado creado: {resultado.__dict__}")
-                
-
-            # Guardar todos los tests en la base de datos
-            Test.objects.bulk_create(tests)
-            Resultado.objects.bulk_create(resultados)
-
-            return HttpResponse("Datos de los tests cargados exitosamente.")
-        except Exception as e:
-            return HttpResponse(f"Error al procesar el archivo: {str(e)}")
+        # El archivo se procesa en segundo plano; los resultados se generan por cada test
+        importacion = encolar_importacion(ImportacionCSV.TIPO_TESTS, csv_file)
+        return pegar_a_primaria(respuesta_importacion(importacion, status=202))
 
     return render(request, "cargar_tests.html")
 
-# Función para generar el resultado del test
-def generar_resultado(nombre_test):
-    nombre_test = nombre_test.lower()
-
-    if "covid" in nombre_test:
-        resultado = random.choice(["Negativo", "Positivo"])
-        interpretacion = "Infección activa" if resultado == "Positivo" else "No se detectó el virus"
-        detalles = "Prueba PCR realizada correctamente."
-    elif "paternidad" in nombre_test:
-        resultado = random.choice(["Inclusión", "Exclusión"])
-        interpretacion = "Coincidencia de marcadores genéticos" if resultado == "Inclusión" else "No hay relación biológica"
-        detalles = "Prueba de ADN realizada con precisión."
-    elif "hemograma" in nombre_test:
-        resultado = "Normal" if random.random() > 0.2 else "Anormal"
-        interpretacion = "Valores dentro de los rangos esperados" if resultado == "Normal" else "Anemia detectada"
-        detalles = "Conteo completo de células sanguíneas."
-    elif "influenza" in nombre_test:
-        resultado = random.choice(["Negativo", "Positivo"])
-        interpretacion = "Infección viral activa" if resultado == "Positivo" else "No se detectó el virus"
-        detalles = "Prueba rápida de influenza."
-    elif "alergia" in nombre_test:
-        resultado = random.choice(["Sin alergias", "Alergias detectadas"])
-        interpretacion = "Reacción alérgica" if resultado == "Alergias detectadas" else "Sin reacciones"
-        detalles = "Panel de alérgenos completado."
-    elif "electrocardiograma" in nombre_test:
-        resultado = random.choice(["Normal", "Anormal"])
-        interpretacion = "Ritmo cardíaco regular" if resultado == "Normal" else "Arritmia detectada"
-        detalles = "ECG realizado sin complicaciones."
-    elif "anticuerpo" in nombre_test:
-        resultado = random.choice(["Positivo", "Negativo"])
-        interpretacion = "Presencia de anticuerpos" if resultado == "Positivo" else "No se detectaron anticuerpos"
-        detalles = "Prueba serológica completada."
-    elif "hepatitis" in nombre_test:
-        resultado = random.choice(["Negativo", "Positivo"])
-        interpretacion = "Infección detectada" if resultado == "Positivo" else "No se detectó infección"
-        detalles = "Análisis para hepatitis realizado."
-    else:
-        resultado = "Indeterminado"
-        interpretacion = "No se pudo interpretar el resultado"
-        detalles = "Datos insuficientes para el análisis."
 
-    return resultado, interpretacion, detalles
+@staff_member_required
+def estado_importacion(request, pk):
+    importacion = get_object_or_404(ImportacionCSV, pk=pk)
+    return respuesta_importacion(importacion)
+
+
+def respuesta_importacion(importacion, status=200):
+    return JsonResponse({
+        'id': importacion.pk,
+        'tipo': importacion.tipo,
+        'estado': importacion.estado,
+        'filas_procesadas': importacion.filas_procesadas,
+        'filas_totales': importacion.filas_totales,
+        'progreso': importacion.progreso(),
+        'filas_por_segundo': importacion.filas_por_segundo,
+        'intentos': importacion.intentos,
+        'error': importacion.error,
+        'url_estado': reverse('estado_importacion', args=[importacion.pk]),
+    }, status=status)
 
 
 
 
+@lectura_replica()
 def realizar_consulta(request):
     
     
     valores = []
     campo=0
     conteos = 0
-    result = Test.objects.all()
     field_names = [field.name for field in Test._meta.fields]  # Obtiene los nombres de los campos
-    result = Persona.objects.all()
     field_namespersona = [field.name for field in Persona._meta.fields]  # Obtiene los nombres de los campos
   
     
+    error = None
+    # Obtener parámetros de la consulta
+    field_name = request.GET.get('field_name', '')
+    order = request.GET.get('order', 'asc')
+    operation = request.GET.get('operation')
     try:
-        # Obtener parámetros de la consulta
-        field_name = request.GET.get('field_name')
-        order = request.GET.get('order', 'asc')
-        operation = request.GET.get('operation')
-
-        # Validar los datos
-        if not field_name or operation not in ['sum', 'avg']:
-            raise ValueError('Parámetros inválidos')
-
-        # Realizar la consulta en función de la operación
-        if operation == 'sum':
-            queryset = (
-                Persona.objects.values(field_name)
-                .annotate(total=Count(field_name))
-                .order_by(f"{'' if order == 'asc' else '-'}total")
-            )
-        elif operation == 'avg':
-            queryset = (
-                Persona.objects.values(field_name)
-                .annotate(total=Avg(field_name))
-                .order_by(f"{'' if order == 'asc' else '-'}total")
-            )
-        else:
-            queryset = []
+        # Varios campos separados por coma agrupan por todos ellos
+        agrupar = [ruta.strip() for ruta in field_name.split(',') if ruta.strip()]
+        # 'sum' (Suma en el formulario) siempre contó personas por valor del campo
+        operacion = 'count' if operation == 'sum' else operation
+        # Sin 'campo' se agrega el último campo agrupado, como antes
+        campo_agregado = request.GET.get('campo') or (agrupar[-1] if agrupar else None)
+        filas = AGREGADOR_PERSONAS.consultar(
+            agrupar,
+            operacion,
+            campo=campo_agregado,
+            filtros={
+                parametro: valor for parametro, valor in request.GET.items()
+                if parametro not in PARAMETROS_CONSULTA and valor != ''
+            },
+            orden='valor' if order == 'asc' else '-valor',
+            limite=request.GET.get('limite'),
+            percentil=request.GET.get('percentil', 0.5),
+        )
 
         # Preparar datos para la gráfica
-        datos = {
-            'labels': [entry[field_name] for entry in queryset],
-            'data': [entry['total'] for entry in queryset],
-        }
+        datos = datos_grafico(filas, agrupar)
 
-    except Exception as e:
+    except ParametroInvalido as e:
         # Manejar errores y pasar el mensaje al contexto
-        error_message = str(e)
-        datos =[] 
+        error = str(e)
+        datos = {}
         
     
     
     
     context = {
-        'tests': result, 
         'field_names': field_names,
         'field_namespersona': field_namespersona,
             "campo": campo,
             "valores": valores,
             "conteos": conteos,
-            'datos': datos, 
-            'field_name': field_name
+            'datos': json.dumps(datos, cls=DjangoJSONEncoder),
+            'field_name': field_name,
+            'error': error,
         }
     return render(request, 'kpiparametro.html', context)
 
 
+# Listados paginados por clave (ver myapp/paginacion.py)
+LISTADO_TESTS = ListadoKeyset(
+    Test.objects.all(),
+    campos=['nombre', 'fecha', 'fecha_entrega', 'estado', 'calificacion', 'categoria__nombre'],
+    ordenes=['pk', 'nombre', 'fecha', 'fecha_entrega', 'calificacion'],
+    filtros={
+        'nombre': 'nombre__icontains',
+        'estado': 'estado',
+        'calificacion': 'calificacion',
+        'categoria': 'categoria_id',
+        'desde': 'fecha__gte',
+        'hasta': 'fecha__lte',
+    },
+    orden_por_defecto='-fecha',
+)
+
+# Agregaciones con campos validados contra _meta (ver myapp/agregaciones.py)
+AGREGADOR_TESTS = Agregador(Test)
+# Barras de la gráfica de la fórmula de KIP1/KIP6
+LIMITE_FORMULA = 1000
+AGREGADOR_PERSONAS = Agregador(Persona)
+
+# Parámetros de realizar_consulta que no son filtros
+PARAMETROS_CONSULTA = {'field_name', 'order', 'operation', 'campo', 'limite', 'percentil'}
+
+
+# Sin teléfono ni fecha de nacimiento: el listado es público y el panel no los necesita
+LISTADO_PERSONAS = ListadoKeyset(
+    Persona.objects.all(),
+    campos=['nombre', 'apellidos', 'sexo', 'rol'],
+    ordenes=['pk', 'nombre', 'apellidos'],
+    filtros={
+        'nombre': 'nombre__istartswith',
+        'apellidos': 'apellidos__istartswith',
+        'sexo': 'sexo',
+        'rol': 'rol',
+    },
+)
+
+
+@lectura_replica()
+def api_tests(request):
+    return LISTADO_TESTS.responder(request)
+
+
+@lectura_replica()
+def api_personas(request):
+    return LISTADO_PERSONAS.responder(request)
+
+
+# Conjuntos de datos que se sirven en api/kpi/<nombre>/
+DATASETS_KPI = {
+    'categorias': categorias_mas_solicitadas,
+    'satisfaccion': resumen_satisfaccion,
+    'tests_por_personal': obtener_tests_por_personal,
+    'tiempo_promedio_personal': obtener_tiempo_promedio_personal,
+    'promedio_calificacion': promediocalificacion,
+    'tiempo_espera': tiempodeespera,
+    'pruebas_mensuales': obtener_pruebas_mensuales,
+    'pruebas_semanales': obtener_pruebas_semanales,
+    'volumen_pruebas_semanales': obtener_volumen_pruebas_semanales,
+    'porcentaje_pruebas': obtener_porcentaje_pruebas,
+    'volumen_pruebas_por_genero': obtener_volumen_pruebas_por_genero,
+    'tests_por_edad': obtener_tests_por_edad,
+    'tests_por_edad_y_nombre': obtener_tests_por_edad_y_nombre,
+    'tests_menos_usados': obtener_tests_menos_usados,
+    'tests_mas_solicitados': obtener_tests_mas_solicitados,
+    'indice_genero': obtener_indice_genero,
+}
+
+
+def validadores_kpi(clave):
+    # (ETag, Last-Modified): cambian con cada carga de datos y cada día
+    # (varios KPIs dependen de la fecha actual)
+    version, actualizado = leer_version()
+    inicio_del_dia = timezone.make_aware(datetime.combine(date.today(), datetime.min.time()))
+    etag = f"{clave}-{version}-{date.today().isoformat()}"
+    return etag, max(actualizado, inicio_del_dia) if actualizado else inicio_del_dia
+
+
+def validadores_solicitud(request, nombre):
+    # condition() pide el ETag y Last-Modified por separado: se calculan una vez por solicitud.
+    # Sin validadores para un KPI inexistente, así la vista responde 404 y no 304
+    if nombre not in DATASETS_KPI:
+        return None, None
+    if not hasattr(request, '_validadores_kpi'):
+        request._validadores_kpi = validadores_kpi(nombre)
+    return request._validadores_kpi
+
+
+def etag_kpi(request, nombre):
+    return validadores_solicitud(request, nombre)[0]
+
+
+def ultima_modificacion_kpi(request, nombre):
+    return validadores_solicitud(request, nombre)[1]
+
+
+@require_GET
+@condition(etag_func=etag_kpi, last_modified_func=ultima_modificacion_kpi)
+def api_kpi(request, nombre):
+    # Responde 304 si el cliente ya tiene la versión actual (If-None-Match / If-Modified-Since)
+    funcion = DATASETS_KPI.get(nombre)
+    if funcion is None:
+        return JsonResponse({'error': f"No existe el KPI '{nombre}'."}, status=404)
+    response = JsonResponse(funcion(), safe=False)
+    # El navegador guarda la respuesta pero la revalida en cada uso
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@require_GET
+async def api_kpis(request):
+    # Varios KPIs en una respuesta (api/kpis/?nombres=a,b,c), calculados en
+    # paralelo: la respuesta tarda lo que el KPI más lento
+    nombres = sorted({nombre for nombre in request.GET.get('nombres', '').split(',') if nombre})
+    desconocidos = [nombre for nombre in nombres if nombre not in DATASETS_KPI]
+    if not nombres or desconocidos:
+        return JsonResponse({'error': f"KPIs inexistentes: {', '.join(desconocidos) or '(ninguno pedido)'}"}, status=404)
+
+    # La clave no puede llevar comas (separan ETags en If-None-Match)
+    clave = 'kpis-' + hashlib.md5(','.join(nombres).encode()).hexdigest()[:16]
+    etag, ultima_modificacion = await sync_to_async(validadores_kpi)(clave)
+    etag = quote_etag(etag)
+    ultima_modificacion = int(ultima_modificacion.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        response = JsonResponse(await calcular_kpis({nombre: DATASETS_KPI[nombre] for nombre in nombres}))
+        patch_cache_control(response, private=True, no_cache=True)
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(ultima_modificacion)
+    return response
+
+
 def KPIhome(request):
     return render(request, 'homekpi.html')
 
 
-STATIC_DATABASE_SCHEMA = """
-    Tabla: myapp_persona
-      - nombre (CharField)
-      - apellidos (CharField)
-      - sexo (CharField)
-      - fnac (DateField)
-      - telefono (CharField)
-      - rol (CharField)
-      - especialidad (CharField)
-
-    Tabla: myapp_test
-      - nombre (CharField)
-      - fecha (DateField)
-      - fecha_entrega (DateField)
-      - estado (CharField)
-      - observaciones (TextField)
-      - calificacion (IntegerField)
-      - categoria (ForeignKey)
-      - cliente (ForeignKey)
-      - personal (ForeignKey)
-      """
+@staff_member_required
+def estadisticas_cache(request):
+    # Aciertos y fallos del caché de KPIs, total y por función
+    return JsonResponse(estadisticas_cache_kpis())
 
-def get_ia_response(text):
-    api_key = os.getenv('OPENAI_API_KEY')   # Reemplaza con tu API key de OpenAI
-    print(api_key) 
-    url = 'https://api.openai.com/v1/chat/completions'
-    prompt_message = f"""
-    Aquí está el esquema de la base de datos:
 
-    {STATIC_DATABASE_SCHEMA}
-    
-    El usuario ha solicitado lo siguiente :
-    {text} , solo dame la consulta , solo la consulta niun texto mas , directo la consulta nada mas , ni un texto de mas solo la consulta , como : "SELECT * FROM tabla"
-    """
-    # Datos del cuerpo de la solicitud
-    #prompt_message = f"Analiza el siguiente texto y genera una consulta SQL: {text}"  # Modificamos el prompt para generar SQL
-    
-    request_body = {
-        "model": "gpt-3.5-turbo",  # Usa el modelo adecuado de OpenAI
-        "messages": [
-            {"role": "system", "content": "Eres un asistente útil que puede generar consultas SQL."},
-            {"role": "user", "content": prompt_message}
-        ]
-    }
-    
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
+@staff_member_required
+def estadisticas_bd(request):
+    # Persistencia, conexiones abiertas y estado del pool por alias
+    return JsonResponse(estadisticas_conexiones())
 
-    try:
-        # Realizar la solicitud POST a la API de OpenAI
-        response = requests.post(url, json=request_body, headers=headers)
-        
-        # Si la solicitud es exitosa, obtener la respuesta en formato JSON
-        response.raise_for_status()  # Lanza un error si la respuesta no es 2xx
-        chat_response = response.json()
-        
-        # Obtener la consulta SQL generada por la IA
-        sql_query = chat_response['choices'][0]['message']['content'].strip()
-        
-        sql_query_without_backticks = sql_query.replace("`", "")
-        print(sql_query_without_backticks)
-        
-        return sql_query_without_backticks
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error al consultar la API de ChatGPT: {e}")
-        return "Hubo un error al procesar la solicitud."
+def metricas_autorizadas(request):
+    # Prometheus no inicia sesión: token Bearer (METRICAS_TOKEN) o IP en METRICAS_IPS
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    autorizacion = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(autorizacion.encode(), f'Bearer {token}'.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICAS_IPS', ['127.0.0.1', '::1'])
+
+
+def metricas(request):
+    # Formato de texto de Prometheus; cada proceso expone solo sus propias solicitudes
+    if not metricas_autorizadas(request):
+        return HttpResponse('No autorizado.', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(exposicion_metricas(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def metricas_vistas(request):
+    # El SQL de la consulta más lenta por vista no entra en las etiquetas de /metrics
+    return JsonResponse(consultas_mas_lentas())
+
+
+@staff_member_required
+def estadisticas_cache_analitics(request):
+    # Aciertos del LRU pregunta -> SQL y del caché de resultados de analitics
+    return JsonResponse({
+        'sql': estadisticas_cache_sql(),
+        'resultados': estadisticas_cache_consultas(),
+    })
+
+
+def get_ia_response(text):
+    # Consulta SQL generada por la IA para el pedido del usuario (ver myapp/llm)
+    return generar_sql(text, esquema_prompt())
     
     
 def execute_sql_query(query):
-    try:
-        # Ejecutar la consulta SQL generada por la IA
-        with connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()  # Obtener los resultados de la consulta
-        return result
-    except Exception as e:
-        print(f"Error al ejecutar la consulta SQL: {e}")
-        return None
+    # Solo un SELECT validado, con LIMIT, solo lectura y límite de tiempo (ver ejecutor_sql);
+    # si la misma consulta ya se ejecutó con los datos actuales se devuelve el resultado guardado
+    with lectura_replica():
+        return resultado_para(query)
 
 
-def analitics(request):
-    result = []
+async def analitics(request):
+    # Vista async: mientras se espera a la API de IA el worker sigue atendiendo otras solicitudes
+    result = None
     chart_data = {}
+    error = None
     if request.method == 'POST':
         input_text = request.POST.get('input_text')
         
         if input_text:
-            # Paso 1: Obtener la consulta SQL generada por la IA
-            sql_query = get_ia_response(input_text)  # Asume que esta función ya está implementada
-            
-            # Paso 2: Ejecutar la consulta SQL
-            query_result = execute_sql_query(sql_query)
-            
-            if query_result:
-                result = query_result  # Pasam
+            try:
+                # Paso 1: Obtener la consulta SQL generada por la IA
+                esquema = await sync_to_async(esquema_prompt)()
+                sql_query = await generar_sql_async(input_text, esquema)
+                # Paso 2: Ejecutar la consulta SQL
+                result = await sync_to_async(execute_sql_query)(sql_query)
+                # Paso 3: Elegir y reducir el gráfico en el servidor
+                chart_data = grafico_para(result)
+            except ErrorLLM as e:
+                logger.warning("No se pudo generar la consulta: %s", e)
+                error = str(e)
+            except (ConsultaNoPermitida, ErrorConsulta) as e:
+                logger.warning("Consulta generada rechazada: %s", e)
+                error = str(e)
 
 
     context = {
         'result': result,
         'chart_data': chart_data,
+        'error': error,
     }
     return render(request, 'analitics.html', context)
 
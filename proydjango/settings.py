@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 #from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,7 +62,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware'
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'myapp.middleware.LecturaPrimariaMiddleware',
 ]
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -89,21 +92,151 @@ WSGI_APPLICATION = 'proydjango.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+def variable_requerida(nombre):
+    try:
+        return os.environ[nombre]
+    except KeyError:
+        raise ImproperlyConfigured(f"Falta la variable de entorno {nombre} (o usar DB_ENGINE=sqlite).")
+
+
+# Base de datos (variables de entorno). DB_ENGINE=sqlite usa db.sqlite3 local;
+# por defecto PostgreSQL, con DB_HOST y DB_PASSWORD obligatorios (sin valores en el código).
+# Con DB_CONN_MAX_AGE > 0 cada hilo reutiliza su conexión entre solicitudes y no
+# repite el handshake TCP+TLS+autenticación; CONN_HEALTH_CHECKS la prueba antes de
+# reutilizarla después de un error o de un reinicio del servidor. Solo conviene bajo
+# WSGI: bajo ASGI (el Procfile usa uvicorn) las vistas async abren conexiones en hilos
+# que no cierran al terminar la solicitud, así que el valor por defecto es 0.
+# Por eso por defecto se usa el pool de psycopg 3 (psycopg[pool] en requirements.txt),
+# que devuelve la conexión al terminar cada solicitud; con pool Django exige
+# CONN_MAX_AGE=0. Bajo WSGI se puede usar DB_POOL=0 y DB_CONN_MAX_AGE=60.
+# Estado en bd/estadisticas/.
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'microservicio'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': variable_requerida('DB_PASSWORD'),
+            'HOST': variable_requerida('DB_HOST'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+            },
+        },
+    }
+    if os.getenv('DB_POOL', '1') == '1':
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN', 2)),
+            # Alcanzar para los hilos de KPI_HILOS más el hilo principal de cada proceso
+            'max_size': int(os.getenv('DB_POOL_MAX', 10)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+
+# Réplica de lectura para KPIs, agregaciones y analitics (myapp/routers.py).
+# DB_REPLICA_HOST: réplica física (standby) de la primaria; recibe el esquema por
+# replicación y en los tests apunta a la base de pruebas de 'default'.
+# DB_REPLICA_NAME: otra base (un archivo con DB_ENGINE=sqlite), por ejemplo dos bases
+# locales; se migra con migrate --database replica y los tests crean la suya.
+# Sin ninguna de las dos no hay alias 'replica' y todo se lee de 'default'.
+REPLICA_FISICA = not os.getenv('DB_REPLICA_NAME')
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    if os.getenv('DB_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / os.getenv('DB_REPLICA_NAME'),
+        }
+elif os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        'OPTIONS': {**DATABASES['default'].get('OPTIONS', {})},
+    }
+    if REPLICA_FISICA:
+        DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['myapp.routers.RouterReplica']
+REPLICA_ALIAS = 'replica'
+# Retraso de replicación tolerado (segundos, solo PostgreSQL)
+REPLICA_LAG_MAXIMO = float(os.getenv('REPLICA_LAG_MAXIMO', 5))
+# Cada cuánto se vuelve a comprobar si la réplica está al día
+REPLICA_CHEQUEO_SEGUNDOS = float(os.getenv('REPLICA_CHEQUEO_SEGUNDOS', 1))
+# Tiempo que quien sube un CSV lee de la primaria
+REPLICA_PEGADO_SEGUNDOS = int(os.getenv('REPLICA_PEGADO_SEGUNDOS', 30))
+
+# Caché
+# El alias 'kpis' guarda los resultados de las funciones de KPIs (myapp/kpi_cache.py).
+# LocMemCache desaloja por LRU al superar MAX_ENTRIES; TIMEOUT es el TTL en segundos.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'kpis': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'kpis',
+        'TIMEOUT': int(os.getenv('KPI_CACHE_TTL', 600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('KPI_CACHE_MAX_ENTRIES', 500)),
+        },
+    },
+    # Resultados de las consultas de analitics; la versión de datos los invalida,
+    # el TTL solo acota cuánto vive una entrada que nadie vuelve a pedir
+    'consultas': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'consultas',
+        'TIMEOUT': int(os.getenv('CONSULTAS_CACHE_TTL', 86400)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CONSULTAS_CACHE_MAX_ENTRIES', 100)),
+        },
     },
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'microservicio',  # Nombre de tu base de datos PostgreSQL
-        'USER': 'postgres',                    # Usuario de PostgreSQL
-        'PASSWORD': 'proyectosoftware2',             # Contraseña de PostgreSQL
-        'HOST': 'database-2.cqbyti8zhpca.us-east-1.rds.amazonaws.com',                  # Dirección del servidor (puede ser 'localhost' o la IP si está en otro servidor)
-        'PORT': '5432',                       # Puerto en el que corre PostgreSQL (por defecto es 5432)
-    }
 }
 
+# Hilos por proceso para calcular KPIs en paralelo desde las vistas async
+# (cada hilo usa su propia conexión a la base de datos)
+KPI_HILOS = int(os.getenv('KPI_HILOS', 4))
+
+# Cliente de la API de lenguaje que genera SQL en analitics (myapp/llm).
+# LLM_URL permite apuntar a otro servidor compatible (por ejemplo uno local de prueba).
+LLM_URL = os.getenv('LLM_URL', 'https://api.openai.com/v1/chat/completions')
+LLM_API_KEY = os.getenv('OPENAI_API_KEY')
+LLM_MODELO = os.getenv('LLM_MODELO', 'gpt-3.5-turbo')
+LLM_TIMEOUT_CONEXION = float(os.getenv('LLM_TIMEOUT_CONEXION', 3.05))
+LLM_TIMEOUT_LECTURA = float(os.getenv('LLM_TIMEOUT_LECTURA', 30))
+LLM_REINTENTOS = int(os.getenv('LLM_REINTENTOS', 2))
+# Llamadas simultáneas por proceso y cuánto se espera un turno antes de rechazar
+LLM_CONCURRENCIA = int(os.getenv('LLM_CONCURRENCIA', 4))
+LLM_ESPERA_TURNO = float(os.getenv('LLM_ESPERA_TURNO', 10))
+# Consultas SQL generadas que se recuerdan (LRU por proceso)
+LLM_CACHE_SQL = int(os.getenv('LLM_CACHE_SQL', 256))
+# Límites de las consultas generadas que se ejecutan (filas devueltas y tiempo por consulta)
+SQL_IA_LIMITE_FILAS = int(os.getenv('SQL_IA_LIMITE_FILAS', 1000))
+SQL_IA_TIMEOUT_MS = int(os.getenv('SQL_IA_TIMEOUT_MS', 5000))
+# Rol de PostgreSQL con el que corren (solo lectura de las tablas de myapp; ver crear_rol_consultas)
+SQL_IA_ROL = os.getenv('SQL_IA_ROL', '')
+# Puntos que recibe el gráfico de analitics (LTTB en series, N mayores + "Otros" en barras)
+GRAFICO_MAX_PUNTOS = int(os.getenv('GRAFICO_MAX_PUNTOS', 300))
+GRAFICO_MAX_CATEGORIAS = int(os.getenv('GRAFICO_MAX_CATEGORIAS', 15))
+
+# Métricas por vista (/metrics): fracción de solicitudes con detalle de consultas y plantillas,
+# y repeticiones de una misma consulta en una solicitud a partir de las que se marca un N+1
+METRICAS_MUESTREO = float(os.getenv('METRICAS_MUESTREO', 0.1))
+METRICAS_N_MAS_1 = int(os.getenv('METRICAS_N_MAS_1', 10))
+# Quién puede leer /metrics: "Authorization: Bearer <METRICAS_TOKEN>" o una IP de METRICAS_IPS
+# (REMOTE_ADDR: detrás de un proxy es la del proxy)
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN', '')
+METRICAS_IPS = [ip.strip() for ip in os.getenv('METRICAS_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -142,6 +275,11 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# Archivos subidos (CSV en cola para el comando procesar_importaciones).
+# La web y el worker deben compartir este almacenamiento.
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
 
 # Ensures the session cookie is sent over HTTPS
 SESSION_COOKIE_SECURE = True  # Ensures cookies are only sent over HTTPS
@@ -154,3 +292,8 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 MB, o ajusta según sea necesario
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# models.W040: SQLite no admite columnas INCLUDE en índices. test_personal_calif_idx
+# (myapp/models.py) las usa para cubrir KIP2 en PostgreSQL; en SQLite queda como índice
+# común sobre (personal, calificacion), así que el aviso no indica un problema.
+SILENCED_SYSTEM_CHECKS = ['models.W040']